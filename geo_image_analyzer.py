@@ -9,107 +9,4934 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
 import json
 import sys
+import argparse
+import asyncio
+import base64
+import csv
+import fnmatch
+import heapq
+import http.server
+import math
+import re
+import time
+import tarfile
+import zipfile
 try:
     from importlib.metadata import version, PackageNotFoundError
 except ImportError:
     # Fallback per Python < 3.8
     from importlib_metadata import version, PackageNotFoundError
 from datetime import datetime
-from PIL import Image, ExifTags, ImageTk
+from urllib.parse import urlsplit, parse_qs
+from PIL import Image, ImageFile, ExifTags, ImageTk
 from PIL.ExifTags import TAGS, GPSTAGS
+from PIL.TiffImagePlugin import IFDRational
 import requests
 import hashlib
+import io
+import mmap
 import platform
 import subprocess
+import threading
+import queue
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 import folium
+from folium.plugins import FastMarkerCluster, HeatMap
+from jinja2 import Environment, ChoiceLoader, DictLoader, FileSystemLoader
 import tempfile
 import webbrowser
+import zlib
+from collections import OrderedDict
+from xml.etree import ElementTree
 try:
     import tkintermapview
 except ImportError:
     tkintermapview = None
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pillow_heif = None
+
+# Valori EXIF più lunghi di questa soglia vengono troncati ed espansi al click
+MAX_INLINE_VALUE_LENGTH = 200
+# Oltre questa dimensione il testo di una scheda viene inserito a blocchi con after_idle
+RENDER_CHUNK_SIZE = 256 * 1024
+
+# File di configurazione accanto allo script e valori predefiniti usati se mancante
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+DEFAULT_CONFIG = {
+    'analysis': {
+        'supported_formats': ['.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp', '.gif',
+                              '.webp', '.heic', '.heif', '.dng', '.cr2', '.nef', '.nrw', '.arw', '.pef', '.srw'],
+        'max_file_size_mb': 100,
+        'max_image_pixels': Image.MAX_IMAGE_PIXELS,
+        'hash_tree': {
+            'block_size_mb': 4,
+            'workers': 4,
+        },
+        'scanner': {
+            'include': [],
+            'exclude': [],
+            'sniff_unknown_extensions': False,
+            'watch_interval_seconds': 5,
+        },
+        'manipulation': {
+            'header_bytes': 262144,
+            'signatures_file': '',
+            'timestamp_tolerance_hours': 24,
+        },
+        'extended_metadata': {
+            'xmp': True,
+            'iptc': True,
+            'makernote': False,
+        },
+        'ela': {
+            'quality': 90,
+            'max_dimension': 1600,
+            'amplification': 0,
+        },
+    },
+    'geolocation': {
+        'reverse_geocoding': {
+            'enabled': True,
+            'timeout_seconds': 10,
+            'user_agent': 'GeoImageAnalyzer/1.0',
+        },
+        'tile_cache': {
+            'path': 'geoimage_tiles.mbtiles',
+            'tile_server': 'https://tile.openstreetmap.org/{z}/{x}/{y}.png',
+            'offline': False,
+            'max_size_mb': 512,
+            'timeout_seconds': 10,
+            'retry_seconds': 60,
+            'prefetch_zoom': [10, 17],
+            'prefetch_margin_degrees': 0.02,
+            'max_prefetch_tiles': 20000,
+        },
+    },
+    'export': {
+        'timestamp_format': 'ISO8601',
+        'case_database': {
+            'path': 'geoimage_cases.db',
+            'batch_size': 500,
+        },
+        'case_map': {
+            'heatmap': True,
+        },
+        'reports': {
+            'formats': ['txt', 'html', 'csv'],
+            'template_dir': '',
+        },
+        'case_statistics': {
+            'top_n': 10,
+            'counter_capacity': 1000,
+            'location_precision': 2,
+        },
+    },
+    'security': {
+        'log_file_paths': False,
+        'anonymize_sensitive_data': False,
+        'require_confirmation_for_network': True,
+        'redaction': {
+            'workers': 4,
+            'manifest': 'redaction_manifest.json',
+        },
+    },
+    'advanced': {
+        'parallel_processing': False,
+        'pipeline': {
+            'queue_size': 16,
+            'read_workers': 4,
+            'hash_workers': 2,
+            'parse_workers': 2,
+            'geocode_workers': 1,
+        },
+        'async_io': {
+            'concurrency': 32,
+            'header_bytes': 131072,
+        },
+        'checkpoint': {
+            'interval_files': 100,
+            'interval_seconds': 30,
+        },
+        'api_server': {
+            'host': '127.0.0.1',
+            'port': 8765,
+            'workers': 8,
+            'queue_size': 64,
+            'max_upload_mb': 100,
+            'allowed_roots': [],
+        },
+    },
+}
+
+# Cache degli indirizzi già risolti e intervallo minimo tra richieste (policy Nominatim: 1 al secondo)
+GEOCODE_MIN_INTERVAL = 1.0
+geocode_cache = {}
+geocode_lock = threading.Lock()
+geocode_last_request = [0.0]
+
+# Dimensione delle miniature e numero massimo di miniature tenute in memoria
+THUMBNAIL_SIZE = 48
+THUMBNAIL_CACHE_SIZE = 512
+
+# Dimensione dei blocchi passati agli algoritmi di hash
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+# Ogni quanti blocchi verificati viene salvato il file di avanzamento della verifica
+HASH_TREE_CHECKPOINT_BLOCKS = 64
+
+# Archivi analizzabili senza estrazione e profondità massima degli archivi annidati
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tgz', '.tar.gz', '.tbz2', '.tar.bz2', '.txz', '.tar.xz')
+MAX_ARCHIVE_DEPTH = 3
+
+def format_exif_value(value, limit=MAX_INLINE_VALUE_LENGTH):
+    """
+    Converte un valore EXIF in testo per la visualizzazione.
+    Restituisce (testo, troncato): per i valori lunghi il testo è solo un'anteprima
+    e la conversione completa viene rimandata all'espansione.
+    """
+    value = exif_python_value(value)
+    if isinstance(value, bytes):
+        if len(value) > limit:
+            return value[:limit // 2].hex(' '), True
+        try:
+            return value.decode('utf-8'), False
+        except UnicodeDecodeError:
+            return str(value), False
+    text = str(value)
+    if len(text) > limit:
+        return text[:limit], True
+    return text, False
+
+def format_full_exif_value(value):
+    """Converte per intero un valore EXIF (usato quando l'utente espande un valore troncato)"""
+    value = exif_python_value(value)
+    if isinstance(value, bytes):
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return value.hex(' ')
+    return str(value)
+
+# Tag con data e ora EXIF ('AAAA:MM:GG hh:mm:ss') e, per il GPS, con la sola data
+EXIF_DATETIME_TAGS = frozenset(('DateTime', 'DateTimeOriginal', 'DateTimeDigitized', 'PreviewDateTime'))
+GPS_DATE_TAGS = frozenset(('GPSDateStamp',))
+# Tag UNDEFINED che contengono testo ASCII (versioni) o un solo valore numerico
+EXIF_ASCII_BYTES_TAGS = frozenset(('ExifVersion', 'FlashPixVersion', 'InteropVersion'))
+EXIF_INTEGER_BYTES_TAGS = frozenset(('FileSource', 'SceneType', 'GPSVersionID', 'ComponentsConfiguration'))
+# Sotto questa lunghezza i byte vengono esportati in esadecimale, oltre in base64
+EXIF_HEX_MAX_BYTES = 32
+# Codifiche dichiarate negli 8 byte iniziali di UserComment
+USER_COMMENT_CODECS = {b'ASCII\x00\x00\x00': 'ascii', b'JIS\x00\x00\x00\x00\x00': 'iso2022_jp',
+                       b'UNICODE\x00': None, b'\x00' * 8: 'utf-8'}
+
+def exif_binary(value):
+    """Byte in forma JSON tipizzata: {'hex': ...} se brevi, {'base64': ...} altrimenti"""
+    if len(value) <= EXIF_HEX_MAX_BYTES:
+        return {'hex': value.hex()}
+    return {'base64': base64.b64encode(value).decode('ascii')}
+
+def exif_rational(value):
+    """Razionale come numeratore/denominatore (anche con denominatore zero)"""
+    return {'num': value.numerator, 'den': value.denominator}
+
+def exif_user_comment(value):
+    """Testo di UserComment secondo la codifica dichiarata (byte se non decodificabile)"""
+    codec = USER_COMMENT_CODECS.get(value[:8], False)
+    text = value[8:]
+    if codec is None:
+        codec = 'utf-16-be' if text[:1] == b'\x00' else 'utf-16-le'
+    try:
+        if codec:
+            return text.decode(codec).rstrip('\x00 ')
+    except UnicodeDecodeError:
+        pass
+    return exif_binary(value)
+
+def exif_python_value(value):
+    """Valore Python (IFDRational, bytes, tuple) da una forma normalizzata; gli altri restano invariati"""
+    if isinstance(value, dict):
+        if 'num' in value and 'den' in value and len(value) == 2:
+            return IFDRational(value['num'], value['den'])
+        if 'hex' in value and len(value) == 1:
+            return bytes.fromhex(value['hex'])
+        if 'base64' in value and len(value) == 1:
+            return base64.b64decode(value['base64'])
+    elif isinstance(value, list):
+        return tuple(exif_python_value(item) for item in value)
+    return value
+
+class ExifNormalizer:
+    """
+    Conversione dei valori EXIF/GPS letti da Pillow in forme JSON tipizzate e senza perdite:
+    razionali come numeratore/denominatore, byte in esadecimale o base64, IFD annidati con i
+    nomi dei tag, date in ISO 8601 (o come nell'EXIF con export.timestamp_format = "EXIF").
+    Il convertitore di ogni coppia (tag, tipo del valore) viene scelto una volta e messo in cache.
+    """
+    
+    def __init__(self, timestamp_format='ISO8601'):
+        self.iso_dates = str(timestamp_format).upper() != 'EXIF'
+        self.converters = {}
+        self.type_converters = {
+            IFDRational: exif_rational,
+            bytes: exif_binary,
+            str: None, int: None, bool: None, type(None): None,
+            float: lambda value: value if math.isfinite(value) else None,
+            tuple: self.sequence,
+            list: self.sequence,
+            dict: lambda value: self.tags(value),
+        }
+        
+    def tags(self, tags, gps=False):
+        """Dizionario di tag normalizzato (chiavi con il nome del tag)"""
+        converters = self.converters
+        normalized = {}
+        for key, value in tags.items():
+            try:
+                name, converter = converters[gps, key, type(value)]
+            except KeyError:
+                name, converter = converters[gps, key, type(value)] = self.select(key, type(value), gps)
+            normalized[name] = value if converter is None else converter(value)
+        return normalized
+        
+    def select(self, key, value_type, gps):
+        """(nome del tag, convertitore) per il tipo di valore; convertitore None se il valore è già serializzabile"""
+        name = key if isinstance(key, str) else (GPSTAGS if gps else TAGS).get(key, str(key))
+        if value_type is dict:
+            return name, lambda value: self.tags(value, gps=name == 'GPSInfo')
+        if value_type is str and self.iso_dates:
+            if name in EXIF_DATETIME_TAGS:
+                return name, lambda value: exif_datetime_to_iso(value) or value
+            if gps and name in GPS_DATE_TAGS:
+                return name, lambda value: value.replace(':', '-') if re.fullmatch(r'\d{4}:\d\d:\d\d', value) else value
+        if value_type is bytes:
+            if name == 'UserComment':
+                return name, exif_user_comment
+            if name in EXIF_ASCII_BYTES_TAGS:
+                return name, lambda value: value.decode('ascii') if value.isascii() else exif_binary(value)
+            if name in EXIF_INTEGER_BYTES_TAGS:
+                return name, lambda value: value[0] if len(value) == 1 else list(value)
+        return name, self.converter_for_type(value_type)
+        
+    def converter_for_type(self, value_type):
+        if value_type in self.type_converters:
+            return self.type_converters[value_type]
+        converter = next((converter for base, converter in self.type_converters.items()
+                          if issubclass(value_type, base)), str)
+        self.type_converters[value_type] = converter
+        return converter
+        
+    def value(self, value):
+        converter = self.converter_for_type(type(value))
+        return value if converter is None else converter(value)
+        
+    def sequence(self, values):
+        # Le sequenze più frequenti sono di razionali (coordinate e ora GPS, LensSpecification)
+        return [exif_rational(value) if type(value) is IFDRational else self.value(value) for value in values]
+        
+    def result(self, result):
+        """Copia del risultato con le sezioni EXIF e GPS normalizzate (le altre sono già serializzabili)"""
+        normalized = dict(result)
+        if result.get('exif'):
+            normalized['exif'] = self.tags(result['exif'])
+        if result.get('gps'):
+            normalized['gps'] = self.tags(result['gps'], gps=True)
+        if result.get('carved_images'):
+            normalized['carved_images'] = [self.result(carved) for carved in result['carved_images']]
+        return normalized
+
+# Normalizzatori per formato delle date, condivisi (la cache dei convertitori vale per tutte le analisi)
+exif_normalizers = {}
+
+def exif_normalizer(config=None):
+    """Normalizzatore EXIF per export.timestamp_format della configurazione"""
+    timestamp_format = (config or DEFAULT_CONFIG)['export']['timestamp_format']
+    normalizer = exif_normalizers.get(timestamp_format)
+    if normalizer is None:
+        normalizer = exif_normalizers[timestamp_format] = ExifNormalizer(timestamp_format)
+    return normalizer
+
+def serialize_result(result, normalizer=None):
+    """Risultato in JSON con i valori EXIF/GPS normalizzati"""
+    return json.dumps((normalizer or exif_normalizer()).result(result), ensure_ascii=False, default=str)
+
+def check_and_install_dependencies():
+    """
+    Controlla e installa automaticamente le dipendenze necessarie
+    """
+    required_packages = {
+        'Pillow': '>=10.0.0',
+        'requests': '>=2.31.0',
+        'folium': '>=0.14.0',
+        'Jinja2': '>=3.0',
+        'tkintermapview': '>=1.29',
+        'numpy': '>=1.24'
+    }
+    
+    missing_packages = []
+    outdated_packages = []
+    
+    print("🔍 Controllo dipendenze...")
+    
+    for package_name, version_req in required_packages.items():
+        try:
+            # Controlla se il pacchetto è installato
+            installed_version = version(package_name)
+            print(f"✅ {package_name} {installed_version} - OK")
+            
+            # Per semplicità, consideriamo tutti i pacchetti installati come aggiornati
+            # In futuro si potrebbe implementare un controllo più sofisticato delle versioni
+                
+        except PackageNotFoundError:
+            print(f"❌ {package_name} - Non installato")
+            missing_packages.append(package_name)
+    
+    # Installa pacchetti mancanti o da aggiornare
+    packages_to_install = missing_packages + outdated_packages
+    
+    if packages_to_install:
+        print(f"\n📦 Installazione/aggiornamento di {len(packages_to_install)} pacchetti...")
+        print("⏳ Potrebbe richiedere alcuni minuti...")
+        
+        for package in packages_to_install:
+            try:
+                print(f"📥 Installando {package}...")
+                subprocess.check_call([
+                    sys.executable, "-m", "pip", "install", "--upgrade", package
+                ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                print(f"✅ {package} installato/aggiornato con successo")
+            except subprocess.CalledProcessError as e:
+                print(f"❌ Errore nell'installazione di {package}: {e}")
+                print(f"💡 Prova manualmente: pip install --upgrade {package}")
+                return False
+    
+    print("\n Tutte le dipendenze sono aggiornate!")
+    return True
+
+def show_dependency_status():
+    """
+    Mostra lo stato delle dipendenze in una finestra di dialogo
+    """
+    try:
+        import tkinter as tk
+        from tkinter import messagebox
+        
+        required_packages = ['Pillow', 'requests', 'folium', 'Jinja2', 'tkintermapview', 'numpy']
+        status_info = []
+        
+        for package in required_packages:
+            try:
+                pkg_version = version(package)
+                status_info.append(f"✅ {package}: v{pkg_version}")
+            except PackageNotFoundError:
+                status_info.append(f"❌ {package}: Non installato")
+        
+        status_message = "Stato Dipendenze:\n\n" + "\n".join(status_info)
+        status_message += "\n\nTutte le dipendenze vengono controllate e aggiornate automaticamente all'avvio."
+        
+        # Crea una finestra temporanea per il messaggio
+        temp_root = tk.Tk()
+        temp_root.withdraw()  # Nasconde la finestra principale
+        
+        messagebox.showinfo("Stato Dipendenze", status_message)
+        temp_root.destroy()
+        
+    except Exception as e:
+        print(f"Errore nel mostrare lo stato delle dipendenze: {e}")
+
+def merge_config(defaults, overrides):
+    """Unisce ricorsivamente la configurazione letta con i valori predefiniti"""
+    merged = dict(defaults)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def load_config(path=CONFIG_PATH):
+    """Carica config.json; in caso di errore usa la configurazione predefinita"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return merge_config(DEFAULT_CONFIG, json.load(f))
+    except FileNotFoundError:
+        return merge_config(DEFAULT_CONFIG, {})
+    except (OSError, ValueError) as e:
+        print(f"Errore lettura configurazione {path}: {e}")
+        return merge_config(DEFAULT_CONFIG, {})
+
+# Estensioni RAW con struttura TIFF (le anteprime JPEG incorporate vengono usate come anteprima)
+RAW_EXTENSIONS = ('.dng', '.cr2', '.nef', '.nrw', '.arw', '.pef', '.srw')
+# Brand ISO BMFF dei file HEIF/HEIC (box ftyp)
+HEIF_BRANDS = (b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1')
+
+class FormatHandler:
+    """
+    Gestore di un formato di evidenza: riconoscimento dai magic bytes, apertura per i soli
+    metadati (header, senza decodificare i pixel) e immagine decodificabile per anteprime,
+    miniature ed ELA. Gli hash restano calcolati sui byte del file, uguali per ogni formato.
+    """
+    name = None
+    signatures = ()
+    extensions = ()
+    
+    def matches(self, header, extension=''):
+        """True se i primi byte del file appartengono a questo formato"""
+        return any(header.startswith(signature) for signature in self.signatures)
+        
+    def can_decode(self):
+        """False se manca il decoder: l'evidenza viene analizzata solo per metadati e hash"""
+        return True
+        
+    def open_image(self, source):
+        """Immagine Pillow con header e metadati (la decodifica avviene solo se richiesta)"""
+        return Image.open(source)
+        
+    def open_preview(self, source):
+        """Immagine decodificabile da usare per anteprima, miniature ed ELA"""
+        return self.open_image(source)
+
+class PillowFormatHandler(FormatHandler):
+    """Formati decodificati direttamente da Pillow"""
+    
+    def __init__(self, name, signatures, extensions):
+        self.name = name
+        self.signatures = signatures
+        self.extensions = extensions
+
+class WebPFormatHandler(PillowFormatHandler):
+    """WebP: contenitore RIFF con identificativo WEBP"""
+    
+    def __init__(self):
+        super().__init__('WEBP', (), ('.webp',))
+        
+    def matches(self, header, extension=''):
+        return header[:4] == b'RIFF' and header[8:12] == b'WEBP'
+
+class HeifFormatHandler(FormatHandler):
+    """
+    HEIF/HEIC degli smartphone. I metadati vengono letti dai box ISO BMFF senza decoder;
+    la decodifica dei pixel richiede il pacchetto opzionale pillow-heif.
+    """
+    name = 'HEIF'
+    extensions = ('.heic', '.heif', '.hif')
+    
+    def matches(self, header, extension=''):
+        return header[4:8] == b'ftyp' and header[8:12] in HEIF_BRANDS
+        
+    def can_decode(self):
+        return pillow_heif is not None
+
+class RawFormatHandler(FormatHandler):
+    """
+    RAW con struttura TIFF (DNG, CR2, NEF, ARW, ...). Pillow legge header ed EXIF dell'IFD0;
+    come anteprima si usa il JPEG incorporato più grande invece di eseguire il demosaicing.
+    """
+    name = 'RAW'
+    extensions = RAW_EXTENSIONS
+    
+    def matches(self, header, extension=''):
+        if header[:4] == b'II*\x00' and header[8:10] == b'CR':
+            return True
+        return header[:4] in (b'II*\x00', b'MM\x00*') and extension in self.extensions
+        
+    def open_preview(self, source):
+        if isinstance(source, (str, os.PathLike)):
+            with EvidenceFile(source) as evidence:
+                preview = raw_preview_bytes(evidence.buffer)
+        else:
+            source.seek(0)
+            preview = raw_preview_bytes(source.read())
+        return Image.open(io.BytesIO(preview)) if preview else self.open_image(source)
+
+# Registro dei gestori: il primo che riconosce l'header viene usato (i RAW prima dei TIFF generici)
+FORMAT_HANDLERS = [
+    PillowFormatHandler('JPEG', (b'\xff\xd8\xff',), ('.jpg', '.jpeg')),
+    PillowFormatHandler('PNG', (b'\x89PNG\r\n\x1a\n',), ('.png',)),
+    RawFormatHandler(),
+    PillowFormatHandler('TIFF', (b'II*\x00', b'MM\x00*'), ('.tiff', '.tif')),
+    PillowFormatHandler('GIF', (b'GIF87a', b'GIF89a'), ('.gif',)),
+    PillowFormatHandler('BMP', (b'BM',), ('.bmp',)),
+    WebPFormatHandler(),
+    HeifFormatHandler(),
+]
+
+def register_format_handler(handler, before=None):
+    """Aggiunge un gestore di formato al registro (prima di quello con nome before, se indicato)"""
+    names = [registered.name for registered in FORMAT_HANDLERS]
+    FORMAT_HANDLERS.insert(names.index(before) if before in names else len(FORMAT_HANDLERS), handler)
+
+def format_handler_for(header, extension=''):
+    """Gestore del formato riconosciuto dai primi byte (None se sconosciuto)"""
+    extension = extension.lower()
+    for handler in FORMAT_HANDLERS:
+        if handler.matches(header, extension):
+            return handler
+    return None
+
+def format_handler_for_path(path):
+    """Gestore del formato di un file, dai suoi primi byte e dall'estensione"""
+    with open(path, 'rb') as f:
+        return format_handler_for(f.read(16), os.path.splitext(path)[1])
+
+def detect_image_format(header, extension=''):
+    """Riconosce il formato dai primi byte del file (None se sconosciuto)"""
+    handler = format_handler_for(header, extension)
+    return handler.name if handler else None
+
+def check_evidence_file(image_path, config, require_extension=True):
+    """
+    Verifica formato, dimensione e numero di pixel prima di qualsiasi decodifica.
+    Restituisce un dizionario con 'status':
+    - 'ok': l'immagine può essere decodificata
+    - 'degraded': file troppo grande, decompression bomb o formato senza decoder, solo metadati e hash
+    - 'rejected': formato non supportato
+    """
+    analysis_config = config['analysis']
+    result = {'status': 'ok', 'reason': '', 'format': None, 'size': 0, 'pixels': None}
+    
+    extension = os.path.splitext(image_path)[1].lower()
+    if require_extension and extension not in analysis_config['supported_formats']:
+        result.update(status='rejected', reason=f"Estensione non supportata: {extension or 'nessuna'}")
+        return result
+    
+    with open(image_path, 'rb') as f:
+        result['size'] = os.fstat(f.fileno()).st_size
+        handler = format_handler_for(f.read(16), extension)
+    if handler is None:
+        result.update(status='rejected', reason="Firma del file non riconosciuta come immagine supportata")
+        return result
+    result['format'] = handler.name
+    
+    max_size = analysis_config['max_file_size_mb'] * 1024 * 1024
+    if result['size'] > max_size:
+        result.update(status='degraded',
+                      reason=f"File di {result['size'] / (1024 * 1024):.1f} MB oltre il limite di "
+                             f"{analysis_config['max_file_size_mb']} MB")
+    
+    # L'apertura legge solo l'header: le dimensioni sono note prima della decodifica
+    try:
+        with handler.open_image(image_path) as image:
+            result['pixels'] = image.size[0] * image.size[1]
+    except Image.DecompressionBombError as e:
+        result.update(status='degraded', reason=f"Possibile decompression bomb: {e}")
+        return result
+    except Exception as e:
+        result.update(status='degraded', reason=f"Header immagine non leggibile: {e}")
+        return result
+    
+    max_pixels = analysis_config['max_image_pixels']
+    if max_pixels and result['pixels'] > max_pixels and result['status'] == 'ok':
+        result.update(status='degraded',
+                      reason=f"{result['pixels']:,} pixel oltre il limite di {max_pixels:,}")
+    if not handler.can_decode() and result['status'] == 'ok':
+        result.update(status='degraded',
+                      reason=f"Decodifica {handler.name} non disponibile (installare pillow-heif): solo metadati e hash")
+    return result
+
+def write_json_atomic(path, data):
+    """Scrive un file JSON in modo atomico (file temporaneo + rename)"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def merkle_root(block_hashes):
+    """
+    Calcola la radice Merkle (SHA256) degli hash dei blocchi.
+    Foglie e nodi interni usano prefissi distinti (0x00/0x01) e un nodo dispari
+    viene promosso al livello superiore senza duplicarlo.
+    """
+    level = [hashlib.sha256(b'\x00' + bytes.fromhex(h)).digest() for h in block_hashes]
+    if not level:
+        return hashlib.sha256(b'').hexdigest()
+    while len(level) > 1:
+        next_level = [hashlib.sha256(b'\x01' + level[i] + level[i + 1]).digest()
+                      for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0].hex()
+
+def make_hash_tree(block_hashes, block_size, file_size):
+    """Costruisce il manifest a blocchi (hash tree) salvato accanto agli hash classici"""
+    return {
+        'algorithm': 'sha256',
+        'block_size': block_size,
+        'file_size': file_size,
+        'block_count': len(block_hashes),
+        'merkle_root': merkle_root(block_hashes),
+        'blocks': list(block_hashes),
+    }
+
+def load_hash_manifest(path):
+    """Legge un manifest hash tree da file: manifest singolo o report JSON esportato"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if 'blocks' in data and 'merkle_root' in data:
+        return data
+    manifest = data.get('metadata', {}).get('forensic', {}).get('hash_tree')
+    if not manifest:
+        raise ValueError("Il file non contiene un manifest hash tree")
+    return manifest
+
+def hash_blocks(evidence, indices, block_size, workers):
+    """Calcola in parallelo lo SHA256 dei blocchi indicati; restituisce coppie (indice, hash)"""
+    def hash_block(index):
+        return index, hashlib.sha256(evidence.read_block(index * block_size, block_size)).hexdigest()
+    
+    # hashlib rilascia il GIL sui blocchi grandi: i thread lavorano davvero in parallelo
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        yield from executor.map(hash_block, indices)
+
+def verify_hash_tree(image_path, manifest, workers=4, progress_path=None, progress_callback=None):
+    """
+    Riverifica un file rispetto al suo manifest hash tree.
+    I blocchi vengono verificati in parallelo; se progress_path è indicato, gli hash già
+    calcolati vengono salvati periodicamente e una verifica interrotta riprende da lì.
+    Restituisce lo stato e l'elenco dei blocchi danneggiati (indice, offset, lunghezza).
+    """
+    block_size = manifest['block_size']
+    expected_blocks = manifest['blocks']
+    
+    # Riprende una verifica precedente dello stesso manifest
+    computed = {}
+    if progress_path and os.path.exists(progress_path):
+        try:
+            with open(progress_path, 'r', encoding='utf-8') as f:
+                progress = json.load(f)
+            if progress.get('merkle_root') == manifest['merkle_root']:
+                computed = {int(index): value for index, value in progress['blocks'].items()}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Avanzamento verifica non leggibile, si riparte da zero: {e}")
+    resumed_blocks = len(computed)
+    
+    with EvidenceFile(image_path) as evidence:
+        file_size = evidence.size
+        block_count = (file_size + block_size - 1) // block_size
+        pending = [index for index in range(block_count) if index not in computed]
+        
+        batch_size = max(1, workers) * HASH_TREE_CHECKPOINT_BLOCKS
+        for start in range(0, len(pending), batch_size):
+            for index, value in hash_blocks(evidence, pending[start:start + batch_size], block_size, workers):
+                computed[index] = value
+            if progress_path:
+                write_json_atomic(progress_path, {'merkle_root': manifest['merkle_root'],
+                                                  'blocks': computed})
+            if progress_callback:
+                progress_callback(len(computed), block_count)
+    
+    actual_blocks = [computed[index] for index in range(block_count)]
+    damaged_blocks = []
+    for index in range(max(block_count, len(expected_blocks))):
+        expected = expected_blocks[index] if index < len(expected_blocks) else None
+        actual = actual_blocks[index] if index < block_count else None
+        if expected != actual:
+            offset = index * block_size
+            length = min(block_size, max(file_size, manifest['file_size']) - offset)
+            damaged_blocks.append({'index': index, 'offset': offset, 'length': length})
+    
+    root = merkle_root(actual_blocks)
+    if progress_path and os.path.exists(progress_path):
+        os.remove(progress_path)
+    
+    return {
+        'status': 'intact' if root == manifest['merkle_root'] and not damaged_blocks else 'damaged',
+        'file_size': file_size,
+        'expected_file_size': manifest['file_size'],
+        'merkle_root': root,
+        'expected_merkle_root': manifest['merkle_root'],
+        'damaged_blocks': damaged_blocks,
+        'resumed_blocks': resumed_blocks,
+    }
+
+class MemoryViewReader(io.RawIOBase):
+    """File object in sola lettura su un memoryview, usato per aprire con Pillow la mappatura senza copiarla"""
+    
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+        self.position = 0
+        
+    def readable(self):
+        return True
+        
+    def seekable(self):
+        return True
+        
+    def tell(self):
+        return self.position
+        
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = len(self.view) + offset
+        else:
+            raise ValueError(f"whence non valido: {whence}")
+        if position < 0:
+            raise ValueError("posizione negativa")
+        self.position = position
+        return position
+        
+    def read(self, size=-1):
+        if size is None or size < 0:
+            end = len(self.view)
+        else:
+            end = min(len(self.view), self.position + size)
+        if end <= self.position:
+            return b''
+        data = self.view[self.position:end].tobytes()
+        self.position = end
+        return data
+        
+    def readinto(self, buffer):
+        end = min(len(self.view), self.position + len(buffer))
+        size = max(0, end - self.position)
+        buffer[:size] = self.view[self.position:end]
+        self.position += size
+        return size
+
+class EvidenceBlockReader(MemoryViewReader):
+    """
+    File object posizionabile sopra EvidenceFile.read_block, per i file non mappati: ogni
+    lettura è contata in evidence.reads e i byte letti in bytes_read
+    """
+    
+    def __init__(self, evidence):
+        super().__init__(None)
+        self.evidence = evidence
+        self.length = evidence.size
+        self.bytes_read = 0
+        
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_END:
+            offset, whence = self.length + offset, io.SEEK_SET
+        return super().seek(offset, whence)
+        
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length - self.position
+        buffer = bytearray(max(0, min(size, self.length - self.position)))
+        return bytes(buffer[:self.readinto(buffer)])
+        
+    def readinto(self, buffer):
+        data = self.evidence.read_block(self.position, len(buffer)) if len(buffer) else b''
+        buffer[:len(data)] = data
+        self.position += len(data)
+        self.bytes_read += len(data)
+        return len(data)
+
+class HeaderReader(io.BytesIO):
+    """Primi byte di un file più lungo: truncated indica se il parsing ha chiesto dati oltre il prefisso"""
+    
+    def __init__(self, data, file_size):
+        super().__init__(data)
+        self.length = len(data)
+        self.more = self.length < file_size
+        self.truncated = False
+        
+    def read(self, size=-1):
+        end = self.tell() + size if size is not None and size >= 0 else None
+        data = super().read(size)
+        if self.more and (end is None or end > self.length):
+            self.truncated = True
+        return data
+        
+    def readinto(self, buffer):
+        size = super().readinto(buffer)
+        if self.more and size < len(buffer):
+            self.truncated = True
+        return size
+
+class EvidenceFile:
+    """
+    Accesso a un file di evidenza tramite un'unica mappatura in memoria (mmap):
+    hash, lettura dell'header e Pillow leggono dalla stessa mappatura senza copie.
+    Per le sorgenti non mappabili (file vuoti, filesystem senza mmap) si legge a blocchi
+    dal file; le sorgenti non posizionabili (pipe) vengono caricate in memoria.
+    """
+    
+    def __init__(self, path, use_mmap=True):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = None
+        self.data = None
+        self.view = None
+        self.lock = threading.Lock()
+        # Letture effettive dal file (0 quando si legge dalla mappatura)
+        self.reads = 0
+        try:
+            if not use_mmap:
+                raise ValueError("mappatura disabilitata")
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.map)
+        except (ValueError, OSError):
+            if not self.file.seekable():
+                self.data = self.file.read()
+                self.view = memoryview(self.data)
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        
+    @property
+    def buffer(self):
+        """Contenuto con find() e slicing (mmap o bytes) per la ricerca di firme; None in lettura a blocchi"""
+        return self.map if self.map is not None else self.data
+        
+    @property
+    def size(self):
+        if self.view is not None:
+            return len(self.view)
+        return os.fstat(self.file.fileno()).st_size
+        
+    def header(self, size=64):
+        """Restituisce i primi byte del file (firma del formato)"""
+        if self.view is not None:
+            return self.view[:size].tobytes()
+        self.file.seek(0)
+        self.reads += 1
+        return self.file.read(size)
+        
+    def open_stream(self):
+        """Restituisce un file object posizionabile da passare a Image.open"""
+        if self.view is not None:
+            return MemoryViewReader(self.view)
+        return io.BufferedReader(EvidenceBlockReader(self))
+        
+    def open_image(self):
+        """Apre l'immagine con Pillow leggendo dalla mappatura"""
+        return Image.open(self.open_stream())
+        
+    def iter_chunks(self, chunk_size=HASH_CHUNK_SIZE):
+        """Itera sul contenuto a blocchi: slice della mappatura (senza copie) o letture dal file"""
+        if self.view is not None:
+            if self.map is not None and hasattr(self.map, 'madvise'):
+                self.map.madvise(mmap.MADV_SEQUENTIAL)
+            for offset in range(0, len(self.view), chunk_size):
+                yield self.view[offset:offset + chunk_size]
+        else:
+            self.file.seek(0)
+            buffer = bytearray(chunk_size)
+            chunk = memoryview(buffer)
+            while True:
+                size = self.file.readinto(buffer)
+                self.reads += 1
+                if not size:
+                    break
+                yield chunk[:size]
+        
+    def hashes(self, algorithms=('md5', 'sha1', 'sha256')):
+        """Calcola più hash con un'unica lettura del contenuto"""
+        hashers = {name: hashlib.new(name) for name in algorithms}
+        for chunk in self.iter_chunks():
+            for hasher in hashers.values():
+                hasher.update(chunk)
+        return {name.upper(): hasher.hexdigest() for name, hasher in hashers.items()}
+        
+    def hashes_with_tree(self, block_size, algorithms=('md5', 'sha1', 'sha256'), on_chunk=None):
+        """
+        Calcola nella stessa lettura gli hash classici e il manifest hash tree a blocchi;
+        on_chunk riceve ogni blocco letto (es. per conservare l'header senza rileggerlo)
+        """
+        hashers = {name: hashlib.new(name) for name in algorithms}
+        block_hashes = []
+        for chunk in self.iter_chunks(block_size):
+            if on_chunk:
+                on_chunk(chunk)
+            for hasher in hashers.values():
+                hasher.update(chunk)
+            block_hashes.append(hashlib.sha256(chunk).hexdigest())
+        hashes = {name.upper(): hasher.hexdigest() for name, hasher in hashers.items()}
+        return hashes, make_hash_tree(block_hashes, block_size, self.size)
+        
+    def read_block(self, offset, size):
+        """Legge un blocco a una posizione arbitraria; sicuro da usare da più thread"""
+        if self.view is not None:
+            return self.view[offset:offset + size]
+        self.reads += 1
+        if hasattr(os, 'pread'):
+            return os.pread(self.file.fileno(), size, offset)
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(size)
+        
+    def close(self):
+        """Rilascia mappatura e file"""
+        try:
+            if self.view is not None:
+                self.view.release()
+            if self.map is not None:
+                self.map.close()
+        except BufferError:
+            # Un lettore ancora attivo referenzia la mappatura: la libera il garbage collector
+            pass
+        self.view = None
+        self.map = None
+        self.data = None
+        self.file.close()
+
+def device_name(make, model):
+    """Nome del dispositivo da Make e Model EXIF, senza ripetere il produttore già incluso nel modello"""
+    make, model = make or '', model or ''
+    return model if model.startswith(make) else f"{make} {model}".strip()
+
+def file_info_from_stat(path, stats):
+    """Informazioni sul file di evidenza (nome, percorso, dimensione e date) dal suo stat"""
+    return {
+        'name': os.path.basename(path),
+        'path': path,
+        'size': stats.st_size,
+        'creation_time': datetime.fromtimestamp(stats.st_ctime).isoformat(),
+        'modification_time': datetime.fromtimestamp(stats.st_mtime).isoformat(),
+        'access_time': datetime.fromtimestamp(stats.st_atime).isoformat(),
+    }
+
+def read_error_result(file_info, error):
+    """Risultato di un file non leggibile (rimosso o inaccessibile dopo l'enumerazione)"""
+    return {'exif': {}, 'gps': {}, 'error': f"Errore di lettura: {error}",
+            'forensic': {'file_info': file_info, 'hashes': {}}}
+
+def read_image_summary(image_path):
+    """
+    Legge i campi di riepilogo (data scatto, dispositivo, presenza GPS) dall'header EXIF
+    senza decodificare i pixel dell'immagine
+    """
+    summary = {'capture_time': '', 'device': '', 'gps': False}
+    try:
+        handler = format_handler_for_path(image_path)
+        if handler is None:
+            return summary
+        with handler.open_image(image_path) as image:
+            exif = image.getexif()
+            exif_ifd = exif.get_ifd(0x8769)
+            summary['capture_time'] = str(exif_ifd.get(36867) or exif.get(306) or '')
+            make = str(exif.get(271, '')).strip()
+            model = str(exif.get(272, '')).strip()
+            summary['device'] = device_name(make, model)
+            gps_ifd = exif.get_ifd(0x8825)
+            summary['gps'] = bool(gps_ifd.get(2) and gps_ifd.get(4))
+    except Exception:
+        # File illeggibili o senza EXIF: la riga resta con i campi vuoti
+        pass
+    return summary
+
+def dms_to_decimal(dms, ref):
+    """Converte da gradi/minuti/secondi a decimale"""
+    degrees = float(dms[0])
+    minutes = float(dms[1])
+    seconds = float(dms[2])
+    
+    decimal = degrees + (minutes / 60.0) + (seconds / 3600.0)
+    
+    if ref in ['S', 'W']:
+        decimal = -decimal
+        
+    return decimal
+
+def gps_to_decimal(gps_info):
+    """Converte le coordinate GPS in formato decimale; (None, None) se assenti o non valide"""
+    try:
+        lat = gps_info.get('GPSLatitude')
+        lon = gps_info.get('GPSLongitude')
+        if lat and lon:
+            return (dms_to_decimal(lat, gps_info.get('GPSLatitudeRef')),
+                    dms_to_decimal(lon, gps_info.get('GPSLongitudeRef')))
+    except Exception as e:
+        print(f"Errore conversione coordinate: {e}")
+    return None, None
+
+def read_exif_metadata(image):
+    """Restituisce (exif, gps) di un'immagine aperta, con i nomi dei tag come nella scheda EXIF"""
+    exif_data = merged_exif_tags(image.getexif())
+    if not exif_data:
+        return {}, {}
+    return name_exif_tags(exif_data)
+
+def merged_exif_tags(exif):
+    """
+    Tag dell'IFD0 uniti a quelli dell'IFD EXIF, con l'IFD GPS come dizionario sotto GPSInfo
+    (la stessa forma di _getexif dei JPEG, per ogni formato e solo con l'API pubblica di Image.Exif)
+    """
+    merged = dict(exif)
+    merged.update(exif.get_ifd(0x8769))
+    if 0x8825 in exif:
+        merged[0x8825] = exif.get_ifd(0x8825)
+    return merged
+
+def name_exif_tags(exif_data):
+    """(exif, gps) con i nomi dei tag da un dizionario EXIF per identificativo numerico"""
+    exif_info = {TAGS.get(tag_id, tag_id): value for tag_id, value in exif_data.items()}
+    gps_raw = exif_info.get('GPSInfo')
+    gps_info = {}
+    if isinstance(gps_raw, dict):
+        gps_info = {GPSTAGS.get(tag_id, tag_id): value for tag_id, value in gps_raw.items()}
+    return exif_info, gps_info
+
+# Nomi dei dataset IPTC-IIM (record, dataset) più usati in ambito forense
+IPTC_TAGS = {
+    (1, 90): 'CodedCharacterSet', (2, 0): 'RecordVersion', (2, 5): 'ObjectName', (2, 15): 'Category',
+    (2, 25): 'Keywords', (2, 40): 'SpecialInstructions', (2, 55): 'DateCreated', (2, 60): 'TimeCreated',
+    (2, 62): 'DigitalCreationDate', (2, 63): 'DigitalCreationTime', (2, 65): 'OriginatingProgram',
+    (2, 70): 'ProgramVersion', (2, 80): 'By-line', (2, 85): 'By-lineTitle', (2, 90): 'City',
+    (2, 92): 'Sub-location', (2, 95): 'Province-State', (2, 100): 'Country-PrimaryLocationCode',
+    (2, 101): 'Country-PrimaryLocationName', (2, 105): 'Headline', (2, 110): 'Credit', (2, 115): 'Source',
+    (2, 116): 'CopyrightNotice', (2, 120): 'Caption-Abstract', (2, 122): 'Writer-Editor',
+}
+
+# Prefissi XMP standard, usati quando il pacchetto non dichiara il proprio
+XMP_NAMESPACES = {
+    'http://ns.adobe.com/exif/1.0/': 'exif', 'http://ns.adobe.com/tiff/1.0/': 'tiff',
+    'http://ns.adobe.com/xap/1.0/': 'xmp', 'http://ns.adobe.com/xap/1.0/mm/': 'xmpMM',
+    'http://ns.adobe.com/photoshop/1.0/': 'photoshop', 'http://purl.org/dc/elements/1.1/': 'dc',
+    'http://ns.adobe.com/camera-raw-settings/1.0/': 'crs', 'http://ns.adobe.com/lightroom/1.0/': 'lr',
+    'http://iptc.org/std/Iptc4xmpCore/1.0/xmlns/': 'Iptc4xmpCore', 'http://ns.google.com/photos/1.0/camera/': 'GCamera',
+    'http://www.w3.org/1999/02/22-rdf-syntax-ns#': 'rdf',
+}
+
+# Tag delle MakerNote per produttore (i tag non elencati vengono mostrati in esadecimale)
+MAKERNOTE_TAGS = {
+    'Canon': {0x0001: 'CameraSettings', 0x0004: 'ShotInfo', 0x0006: 'ImageType', 0x0007: 'FirmwareVersion',
+              0x0008: 'FileNumber', 0x0009: 'OwnerName', 0x000C: 'SerialNumber', 0x0010: 'ModelID',
+              0x0095: 'LensModel', 0x0096: 'InternalSerialNumber'},
+    'Nikon': {0x0001: 'MakerNoteVersion', 0x0002: 'ISO', 0x0004: 'Quality', 0x0005: 'WhiteBalance',
+              0x0007: 'FocusMode', 0x001D: 'SerialNumber', 0x0084: 'Lens', 0x00A7: 'ShutterCount'},
+    'Apple': {0x0001: 'MakerNoteVersion', 0x000A: 'HDRImageType', 0x000B: 'BurstUUID', 0x0011: 'ContentIdentifier'},
+    'Fujifilm': {0x0000: 'Version', 0x0010: 'InternalSerialNumber', 0x1000: 'Quality', 0x1001: 'Sharpness',
+                 0x1002: 'WhiteBalance'},
+    'Olympus': {0x0200: 'SpecialMode', 0x0207: 'CameraType', 0x0209: 'CameraID'},
+    'Panasonic': {0x0001: 'ImageQuality', 0x0003: 'WhiteBalance', 0x0025: 'InternalSerialNumber'},
+    'Sony': {0xB027: 'LensType'},
+}
+
+# Struttura delle MakerNote: (intestazione, produttore, offset header TIFF interno, offset IFD,
+# ordine dei byte, base degli offset dei valori: inizio MakerNote o header TIFF dell'EXIF)
+MAKERNOTE_LAYOUTS = (
+    (b'Nikon\x00\x02', 'Nikon', 10, None, 'header', 'tiff_header'),
+    (b'Apple iOS\x00', 'Apple', None, 14, 'big', 'makernote'),
+    (b'FUJIFILM', 'Fujifilm', None, None, 'little', 'makernote'),
+    (b'OLYMPUS\x00', 'Olympus', 8, 12, 'header', 'makernote'),
+    (b'OLYMP\x00', 'Olympus', None, 8, 'exif', 'exif'),
+    (b'Panasonic\x00', 'Panasonic', None, 12, 'exif', 'exif'),
+    (b'SONY DSC \x00', 'Sony', None, 12, 'exif', 'exif'),
+)
+
+def parse_iptc(data):
+    """Decodifica i dataset IPTC-IIM; i dataset ripetuti (es. Keywords) diventano liste"""
+    iptc = {}
+    pos = 0
+    while pos + 5 <= len(data) and data[pos] == 0x1C:
+        record, dataset = data[pos + 1], data[pos + 2]
+        length = int.from_bytes(data[pos + 3:pos + 5], 'big')
+        pos += 5
+        if length & 0x8000:
+            # Lunghezza estesa: i byte successivi contengono la lunghezza effettiva
+            size = length & 0x7FFF
+            length = int.from_bytes(data[pos:pos + size], 'big')
+            pos += size
+        raw = bytes(data[pos:pos + length])
+        pos += length
+        try:
+            value = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            value = raw.decode('latin-1')
+        name = IPTC_TAGS.get((record, dataset), f"{record}:{dataset}")
+        if name in iptc:
+            if not isinstance(iptc[name], list):
+                iptc[name] = [iptc[name]]
+            iptc[name].append(value)
+        else:
+            iptc[name] = value
+    return iptc
+
+def parse_xmp(packet):
+    """Appiattisce un pacchetto XMP in {prefisso:proprietà: valore}; le liste rdf restano liste"""
+    if isinstance(packet, str):
+        packet = packet.encode('utf-8')
+    start = packet.find(b'<x:xmpmeta')
+    if start < 0:
+        start = packet.find(b'<rdf:RDF')
+    end_tag = b'</x:xmpmeta>' if packet[start:start + 10] == b'<x:xmpmeta' else b'</rdf:RDF>'
+    end = packet.find(end_tag, start)
+    if start < 0 or end < 0:
+        return {}
+    packet = packet[start:end + len(end_tag)]
+    
+    prefixes = dict(XMP_NAMESPACES)
+    prefixes.update((uri.decode('utf-8', 'replace'), prefix.decode('ascii'))
+                    for prefix, uri in re.findall(rb'xmlns:([\w.-]+)="([^"]*)"', packet))
+    
+    def qualified(name):
+        if name.startswith('{'):
+            uri, local = name[1:].split('}', 1)
+            return f"{prefixes.get(uri, uri)}:{local}"
+        return name
+    
+    rdf = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+    xmp = {}
+    root = ElementTree.fromstring(packet)
+    for description in root.iter(f'{rdf}Description'):
+        for name, value in description.attrib.items():
+            if not name.startswith(rdf):
+                xmp[qualified(name)] = value
+        for child in description:
+            container = next((element for element in child if element.tag in
+                              (f'{rdf}Seq', f'{rdf}Bag', f'{rdf}Alt')), None)
+            if container is not None:
+                xmp[qualified(child.tag)] = [(item.text or '').strip() for item in container]
+            elif len(child) == 0:
+                xmp[qualified(child.tag)] = (child.text or '').strip()
+    return xmp
+
+def xmp_coordinate(value):
+    """Converte una coordinata XMP ('41,53.412N' o '41,53,24.7N') in gradi decimali"""
+    value = value.strip()
+    ref, parts = value[-1].upper(), value[:-1].split(',')
+    decimal = sum(float(part) / 60 ** index for index, part in enumerate(parts))
+    return -decimal if ref in ('S', 'W') else decimal
+
+def decode_ifd_value(buffer, byte_order, value_type, count, value_field, base):
+    """Valore di una voce IFD: inline nei 4 byte dell'entry o all'offset indicato (relativo a base)"""
+    size = TIFF_TYPE_SIZES.get(value_type, 1) * count
+    if size <= 4:
+        raw = value_field[:size]
+    else:
+        if base is None:
+            return None
+        offset = base + int.from_bytes(value_field, byte_order)
+        if offset + size > len(buffer):
+            return None
+        raw = bytes(buffer[offset:offset + size])
+    
+    if value_type == 2:
+        return raw.split(b'\x00', 1)[0].decode('latin-1').strip()
+    if value_type in (7, 1) and count > 16:
+        return f"<{count} bytes>"
+    if value_type == 7 and raw.isascii() and raw.decode('ascii').isprintable():
+        return raw.decode('ascii')
+    if value_type in (7, 1, 6):
+        values = list(raw)
+    elif value_type in (5, 10):
+        signed = value_type == 10
+        values = []
+        for index in range(count):
+            numerator = int.from_bytes(raw[index * 8:index * 8 + 4], byte_order, signed=signed)
+            denominator = int.from_bytes(raw[index * 8 + 4:index * 8 + 8], byte_order, signed=signed)
+            values.append(numerator / denominator if denominator else None)
+    else:
+        width = TIFF_TYPE_SIZES.get(value_type, 1)
+        signed = value_type in (8, 9)
+        values = [int.from_bytes(raw[index * width:(index + 1) * width], byte_order, signed=signed)
+                  for index in range(count)]
+    return values[0] if len(values) == 1 else values
+
+def decode_makernote(makernote, exif_tiff=None, make=''):
+    """
+    Decodifica la MakerNote con la struttura del produttore (MAKERNOTE_LAYOUTS) e i nomi dei
+    tag di MAKERNOTE_TAGS. Se gli offset sono relativi all'EXIF e l'header TIFF non è noto,
+    vengono decodificati solo i valori inline.
+    """
+    if not isinstance(makernote, bytes) or len(makernote) < 8:
+        return {}
+    
+    layout = next((layout for layout in MAKERNOTE_LAYOUTS if makernote.startswith(layout[0])), None)
+    if layout is None:
+        vendor = next((name for name in MAKERNOTE_TAGS if name.lower() in make.lower()), make or 'Sconosciuto')
+        layout = (b'', vendor, None, 0, 'exif', 'exif')
+    _, vendor, header_offset, ifd_offset, byte_order, base = layout
+    
+    exif_order = 'little' if exif_tiff and exif_tiff[:2] == b'II' else 'big'
+    if byte_order == 'header':
+        byte_order = 'little' if makernote[header_offset:header_offset + 2] == b'II' else 'big'
+    elif byte_order == 'exif':
+        byte_order = exif_order
+    
+    buffer, start = makernote, 0
+    if base == 'exif':
+        # Offset relativi all'header TIFF dell'EXIF: si individua la MakerNote al suo interno
+        position = exif_tiff.find(makernote) if exif_tiff else -1
+        if position >= 0:
+            buffer, start, value_base = exif_tiff, position, 0
+        else:
+            value_base = None
+    elif base == 'tiff_header':
+        value_base = header_offset
+    else:
+        value_base = 0
+    
+    if vendor == 'Nikon':
+        ifd_offset = header_offset + int.from_bytes(makernote[header_offset + 4:header_offset + 8], byte_order)
+    elif vendor == 'Fujifilm':
+        ifd_offset = int.from_bytes(makernote[8:12], 'little')
+    
+    names = MAKERNOTE_TAGS.get(vendor, {})
+    tags = {}
+    pos = start + ifd_offset
+    count = int.from_bytes(buffer[pos:pos + 2], byte_order)
+    if count > 512 or pos + 2 + count * 12 > len(buffer):
+        return {'vendor': vendor, 'tags': {}}
+    for entry in range(pos + 2, pos + 2 + count * 12, 12):
+        tag = int.from_bytes(buffer[entry:entry + 2], byte_order)
+        value_type = int.from_bytes(buffer[entry + 2:entry + 4], byte_order)
+        value_count = int.from_bytes(buffer[entry + 4:entry + 8], byte_order)
+        if value_type not in TIFF_TYPE_SIZES or value_count > 1 << 20:
+            continue
+        value = decode_ifd_value(buffer, byte_order, value_type, value_count, buffer[entry + 8:entry + 12], value_base)
+        if value is not None:
+            tags[names.get(tag, f"0x{tag:04X}")] = value
+    return {'vendor': vendor, 'tags': tags}
+
+class ExtendedMetadata:
+    """
+    Blocchi XMP, IPTC e MakerNote di un'immagine. Alla creazione vengono copiati solo i byte
+    grezzi; ogni blocco viene decodificato al primo accesso, così chi legge solo il GPS non
+    paga la decodifica della MakerNote.
+    """
+    
+    def __init__(self, image, exif=None):
+        info = getattr(image, 'info', {})
+        tag_v2 = getattr(image, 'tag_v2', {})
+        self.xmp_packet = info.get('xmp') or info.get('XML:com.adobe.xmp') or tag_v2.get(700)
+        photoshop = info.get('photoshop') or {}
+        self.iptc_data = photoshop.get(0x0404) or tag_v2.get(33723)
+        if isinstance(self.iptc_data, (tuple, list)):
+            self.iptc_data = bytes(self.iptc_data)
+        self.makernote_data = (exif or {}).get('MakerNote')
+        raw_exif = info.get('exif')
+        self.exif_tiff = raw_exif[6:] if raw_exif and raw_exif.startswith(b'Exif\x00\x00') else raw_exif
+        self.make = str((exif or {}).get('Make') or '')
+        self.decoded = {}
+        
+    def decode(self, name, parser, *args):
+        """Decodifica un blocco una sola volta; un blocco illeggibile diventa un errore nel risultato"""
+        if name not in self.decoded:
+            try:
+                self.decoded[name] = parser(*args) if args[0] else {}
+            except Exception as e:
+                self.decoded[name] = {'error': f"Blocco {name} non decodificabile: {e}"}
+        return self.decoded[name]
+        
+    @property
+    def xmp(self):
+        return self.decode('xmp', parse_xmp, self.xmp_packet)
+        
+    @property
+    def iptc(self):
+        return self.decode('iptc', parse_iptc, self.iptc_data)
+        
+    @property
+    def makernote(self):
+        return self.decode('makernote', decode_makernote, self.makernote_data, self.exif_tiff, self.make)
+        
+    def xmp_coordinates(self):
+        """Coordinate GPS dal pacchetto XMP (spesso l'unica fonte nei file modificati); (None, None) se assenti"""
+        xmp = self.xmp
+        try:
+            return xmp_coordinate(xmp['exif:GPSLatitude']), xmp_coordinate(xmp['exif:GPSLongitude'])
+        except (KeyError, ValueError, IndexError, AttributeError):
+            return None, None
+        
+    def to_dict(self, config):
+        """Blocchi da includere nei risultati secondo analysis.extended_metadata"""
+        settings = config['analysis']['extended_metadata']
+        blocks = {}
+        for name in ('xmp', 'iptc', 'makernote'):
+            if settings[name]:
+                value = getattr(self, name)
+                if value:
+                    blocks[name] = value
+        return blocks
+
+def iter_bmff_boxes(data, start=0, end=None):
+    """Box ISO BMFF in data[start:end]: (tipo, inizio contenuto, fine box)"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size = int.from_bytes(data[pos:pos + 4], 'big')
+        box_type = bytes(data[pos + 4:pos + 8])
+        header = 8
+        if size == 1:
+            size = int.from_bytes(data[pos + 8:pos + 16], 'big')
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield box_type, pos + header, pos + size
+        pos += size
+
+def read_heif_meta_box(stream):
+    """Legge solo il box 'meta' di primo livello (i dati dell'immagine in 'mdat' vengono saltati)"""
+    stream.seek(0)
+    while True:
+        header = stream.read(16)
+        if len(header) < 8:
+            return None
+        size = int.from_bytes(header[:4], 'big')
+        box_type = header[4:8]
+        header_size = 8
+        if size == 1:
+            size = int.from_bytes(header[8:16], 'big')
+            header_size = 16
+        if box_type == b'meta':
+            stream.seek(stream.tell() - len(header) + header_size)
+            return stream.read(size - header_size)
+        if size < header_size:
+            return None
+        stream.seek(stream.tell() - len(header) + size)
+
+def parse_heif_metadata(stream):
+    """
+    Metadati di un file HEIF dai box ISO BMFF: dimensioni (ispe), payload EXIF e pacchetto XMP
+    individuati tramite iinf/iloc. Legge solo il box meta e gli extent dei metadati.
+    """
+    meta = read_heif_meta_box(stream)
+    if meta is None:
+        raise SyntaxError("box meta HEIF non trovato")
+    
+    # meta è una full box: 4 byte di versione/flag prima dei box figli
+    items, locations, sizes = {}, {}, []
+    for box_type, start, end in iter_bmff_boxes(meta, 4):
+        if box_type == b'iinf':
+            version = meta[start]
+            first = start + (6 if version == 0 else 8)
+            for entry_type, entry_start, entry_end in iter_bmff_boxes(meta, first, end):
+                if entry_type != b'infe' or meta[entry_start] < 2:
+                    continue
+                id_size = 2 if meta[entry_start] == 2 else 4
+                pos = entry_start + 4
+                item_id = int.from_bytes(meta[pos:pos + id_size], 'big')
+                pos += id_size + 2
+                item_type = bytes(meta[pos:pos + 4])
+                content_type = b''
+                if item_type == b'mime':
+                    name_end = meta.index(b'\x00', pos + 4, entry_end)
+                    content_type = bytes(meta[name_end + 1:entry_end]).split(b'\x00', 1)[0]
+                items[item_id] = (item_type, content_type)
+        elif box_type == b'iloc':
+            version = meta[start]
+            offset_size, length_size = meta[start + 4] >> 4, meta[start + 4] & 0x0F
+            base_offset_size, index_size = meta[start + 5] >> 4, meta[start + 5] & 0x0F
+            id_size = 2 if version < 2 else 4
+            pos = start + 6
+            item_count = int.from_bytes(meta[pos:pos + id_size], 'big')
+            pos += id_size
+            
+            def read_int(size):
+                nonlocal pos
+                value = int.from_bytes(meta[pos:pos + size], 'big')
+                pos += size
+                return value
+            
+            for _ in range(item_count):
+                item_id = read_int(id_size)
+                construction_method = read_int(2) & 0x0F if version in (1, 2) else 0
+                read_int(2)
+                base_offset = read_int(base_offset_size)
+                extents = []
+                for _ in range(read_int(2)):
+                    if version in (1, 2) and index_size:
+                        read_int(index_size)
+                    extents.append((base_offset + read_int(offset_size), read_int(length_size)))
+                if construction_method == 0:
+                    locations[item_id] = extents
+        elif box_type == b'iprp':
+            for property_type, property_start, property_end in iter_bmff_boxes(meta, start, end):
+                if property_type != b'ipco':
+                    continue
+                for item_property, value_start, _ in iter_bmff_boxes(meta, property_start, property_end):
+                    if item_property == b'ispe':
+                        sizes.append((int.from_bytes(meta[value_start + 4:value_start + 8], 'big'),
+                                      int.from_bytes(meta[value_start + 8:value_start + 12], 'big')))
+    
+    def item_data(item_id):
+        chunks = []
+        for offset, length in locations.get(item_id, ()):
+            stream.seek(offset)
+            chunks.append(stream.read(length))
+        return b''.join(chunks)
+    
+    metadata = {'size': max(sizes, key=lambda size: size[0] * size[1]) if sizes else (0, 0)}
+    for item_id, (item_type, content_type) in items.items():
+        if item_type == b'Exif' and 'exif' not in metadata:
+            payload = item_data(item_id)
+            # I primi 4 byte indicano l'offset dell'header TIFF nel payload
+            tiff_offset = int.from_bytes(payload[:4], 'big') + 4
+            metadata['exif'] = payload[tiff_offset:]
+            metadata['exif_extents'] = locations.get(item_id, [])
+            metadata['exif_tiff_offset'] = tiff_offset
+        elif item_type == b'mime' and b'rdf+xml' in content_type and 'xmp' not in metadata:
+            metadata['xmp'] = item_data(item_id)
+            metadata['xmp_extents'] = locations.get(item_id, [])
+    return metadata
+
+class HeifMetadataImageFile(ImageFile.ImageFile):
+    """
+    Plugin Pillow per HEIF senza decoder: espone dimensioni, EXIF e XMP come un'immagine
+    normale, ma i pixel non possono essere caricati. Registrato solo se pillow-heif manca.
+    """
+    format = 'HEIF'
+    format_description = "HEIF/HEIC (solo metadati)"
+    
+    def _open(self):
+        metadata = parse_heif_metadata(self.fp)
+        self._mode = 'RGB'
+        self._size = metadata['size']
+        if metadata.get('exif'):
+            self.info['exif'] = b'Exif\x00\x00' + metadata['exif']
+        if metadata.get('xmp'):
+            self.info['xmp'] = metadata['xmp']
+        self.tile = []
+        
+    def _getexif(self):
+        if 'exif' not in self.info:
+            return None
+        return merged_exif_tags(self.getexif())
+
+if pillow_heif is None:
+    Image.register_open(HeifMetadataImageFile.format, HeifMetadataImageFile,
+                        lambda prefix: prefix[4:8] == b'ftyp' and prefix[8:12] in HEIF_BRANDS)
+    Image.register_extensions(HeifMetadataImageFile.format, HeifFormatHandler.extensions)
+
+def raw_preview_bytes(buffer):
+    """
+    JPEG incorporato più grande di un RAW con struttura TIFF: percorre la catena degli IFD
+    e i SubIFD cercando JPEGInterchangeFormat o strip con compressione JPEG.
+    Le anteprime non decodificabili da Pillow (JPEG lossless dei DNG) vengono ignorate.
+    """
+    byte_order = 'little' if buffer[:2] == b'II' else 'big'
+    pending = [int.from_bytes(buffer[4:8], byte_order)]
+    visited = set()
+    candidates = []
+    while pending:
+        offset = pending.pop()
+        if offset in visited or not 8 <= offset <= len(buffer) - 2:
+            continue
+        visited.add(offset)
+        count = int.from_bytes(buffer[offset:offset + 2], byte_order)
+        end = offset + 2 + count * 12
+        if end + 4 > len(buffer):
+            continue
+        tags = {}
+        for entry in range(offset + 2, end, 12):
+            tag = int.from_bytes(buffer[entry:entry + 2], byte_order)
+            value_type = int.from_bytes(buffer[entry + 2:entry + 4], byte_order)
+            value_count = int.from_bytes(buffer[entry + 4:entry + 8], byte_order)
+            if tag in (0x0103, 0x0111, 0x0117, 0x014A, 0x0201, 0x0202) and value_type in (3, 4, 13):
+                value = decode_ifd_value(buffer, byte_order, value_type, value_count, buffer[entry + 8:entry + 12], 0)
+                tags[tag] = value if isinstance(value, list) else [value]
+        if 0x0201 in tags and 0x0202 in tags:
+            candidates.append((tags[0x0201][0], tags[0x0202][0]))
+        if tags.get(0x0103, [0])[0] in (6, 7) and len(tags.get(0x0111, ())) == 1 and 0x0117 in tags:
+            candidates.append((tags[0x0111][0], tags[0x0117][0]))
+        pending.extend(tags.get(0x014A, ()))
+        pending.append(int.from_bytes(buffer[end:end + 4], byte_order))
+    
+    for offset, length in sorted(candidates, key=lambda candidate: -candidate[1]):
+        data = bytes(buffer[offset:offset + length])
+        structure = jpeg_header_structure(data)
+        if structure and any(marker in structure['markers'] for marker in ('SOF0', 'SOF1', 'SOF2')):
+            return data
+    return None
+
+def exif_blob_location(header):
+    """
+    Posizione (offset, lunghezza) del blocco EXIF (header TIFF) nell'intestazione di un JPEG,
+    PNG o WebP; None se non si trova nell'intestazione (in TIFF e RAW l'EXIF è il file stesso)
+    """
+    if header[:2] == b'\xff\xd8':
+        pos = 2
+        while pos + 4 <= len(header) and header[pos] == 0xFF:
+            marker = header[pos + 1]
+            if marker == 0xFF:
+                pos += 1
+                continue
+            if marker == 0xDA or 0xD0 <= marker <= 0xD9:
+                break
+            length = int.from_bytes(header[pos + 2:pos + 4], 'big')
+            if marker == 0xE1 and header[pos + 4:pos + 10] == b'Exif\x00\x00':
+                return pos + 10, length - 8
+            pos += 2 + length
+    elif header[:8] == b'\x89PNG\r\n\x1a\n':
+        pos = 8
+        while pos + 8 <= len(header):
+            length = int.from_bytes(header[pos:pos + 4], 'big')
+            chunk_type = header[pos + 4:pos + 8]
+            if chunk_type == b'eXIf':
+                return pos + 8, length
+            if chunk_type in (b'IDAT', b'IEND'):
+                break
+            pos += 12 + length
+    elif header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        pos = 12
+        while pos + 8 <= len(header):
+            chunk_type = header[pos:pos + 4]
+            length = int.from_bytes(header[pos + 4:pos + 8], 'little')
+            if chunk_type == b'EXIF':
+                prefix = 6 if header[pos + 8:pos + 14] == b'Exif\x00\x00' else 0
+                return pos + 8 + prefix, length - prefix
+            pos += 8 + length + (length & 1)
+    return None
+
+def analyze_image_stream(stream, file_info, config, hashes=None):
+    """
+    Analisi senza interfaccia di un'immagine letta da un file object posizionabile
+    (membro di un archivio, buffer in memoria). Restituisce un dizionario con la stessa
+    struttura di GeoImageAnalyzer.metadata.
+    """
+    result = {
+        'exif': {},
+        'gps': {},
+        'forensic': {'file_info': file_info, 'hashes': hashes or {}},
+    }
+    
+    if hashes is None:
+        stream.seek(0)
+        hashers = {name: hashlib.new(name) for name in ('md5', 'sha1', 'sha256')}
+        for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+            for hasher in hashers.values():
+                hasher.update(chunk)
+        result['forensic']['hashes'] = {name.upper(): hasher.hexdigest()
+                                        for name, hasher in hashers.items()}
+    
+    try:
+        stream.seek(0)
+        with Image.open(stream) as image:
+            result['forensic']['image_info'] = {
+                'format': image.format,
+                'mode': image.mode,
+                'width': image.size[0],
+                'height': image.size[1],
+                'quantization_digest': quantization_digest(getattr(image, 'quantization', None)),
+            }
+            result['exif'], result['gps'] = read_exif_metadata(image)
+            extended = ExtendedMetadata(image, result['exif'])
+    except Exception as e:
+        result['error'] = f"Errore nella lettura dell'immagine: {e}"
+        return result
+    
+    stream.seek(0)
+    header = stream.read(config['analysis']['manipulation']['header_bytes'])
+    result['forensic']['manipulation'] = manipulation_indicators(header, result['exif'], file_info, config)
+    exif_location = exif_blob_location(header)
+    if exif_location:
+        result['forensic']['image_info']['exif_location'] = list(exif_location)
+    result.update(extended.to_dict(config))
+    
+    lat, lon = gps_to_decimal(result['gps'])
+    if lat is not None and lon is not None:
+        result['coordinates'] = {'lat': lat, 'lon': lon, 'address': None}
+    else:
+        lat, lon = extended.xmp_coordinates()
+        if lat is not None and lon is not None:
+            result['coordinates'] = {'lat': lat, 'lon': lon, 'address': None, 'source': 'XMP'}
+    return result
+
+def jpeg_extent(buffer, start, limit):
+    """
+    Percorre i segmenti di un JPEG che inizia a start e restituisce (fine, intervalli APP1 Exif,
+    presenza MPF), oppure None se la struttura non è valida. I dati compressi vengono
+    saltati con find() cercando il primo marker che non sia stuffing (FF00) o restart.
+    """
+    pos = start + 2
+    exif_ranges = []
+    has_mpf = False
+    while pos + 2 <= limit:
+        if buffer[pos] != 0xFF:
+            return None
+        marker = buffer[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker == 0xD9:
+            return pos + 2, exif_ranges, has_mpf
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            pos += 2
+            continue
+        if pos + 4 > limit:
+            return None
+        length = int.from_bytes(buffer[pos + 2:pos + 4], 'big')
+        if length < 2:
+            return None
+        segment_start = pos + 4
+        pos += 2 + length
+        if marker == 0xE1 and buffer[segment_start:segment_start + 6] == b'Exif\x00\x00':
+            exif_ranges.append((segment_start, pos))
+        elif marker == 0xE2 and buffer[segment_start:segment_start + 4] == b'MPF\x00':
+            has_mpf = True
+        elif marker == 0xDA:
+            # Dati compressi: avanza fino al prossimo marker reale
+            while True:
+                pos = buffer.find(b'\xff', pos, limit)
+                if pos < 0 or pos + 1 >= limit:
+                    return None
+                following = buffer[pos + 1]
+                if following == 0x00 or 0xD0 <= following <= 0xD7:
+                    pos += 2
+                elif following == 0xFF:
+                    pos += 1
+                else:
+                    break
+    return None
+
+def png_extent(buffer, start, limit):
+    """Restituisce la fine di un PNG che inizia a start (dopo il chunk IEND), None se non valido"""
+    pos = start + 8
+    while pos + 12 <= limit:
+        length = int.from_bytes(buffer[pos:pos + 4], 'big')
+        chunk_type = buffer[pos + 4:pos + 8]
+        if not chunk_type.isalpha():
+            return None
+        pos += 12 + length
+        if chunk_type == b'IEND':
+            return pos if pos <= limit else None
+    return None
+
+# Dimensione in byte dei tipi di campo TIFF
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4, 16: 8}
+
+def tiff_extent(buffer, start, limit):
+    """
+    Stima la fine di un TIFF che inizia a start come massimo tra la fine delle IFD,
+    dei valori dei tag e delle strip/tile referenziate. None se la struttura non è valida.
+    """
+    order = 'little' if buffer[start:start + 2] == b'II' else 'big'
+    
+    def read_int(offset, size):
+        if offset + size > limit:
+            raise ValueError("offset TIFF fuori dal buffer")
+        return int.from_bytes(buffer[offset:offset + size], order)
+    
+    try:
+        end = start + 8
+        ifd_offset = read_int(start + 4, 4)
+        visited = set()
+        while ifd_offset and ifd_offset not in visited and len(visited) < 64:
+            visited.add(ifd_offset)
+            ifd = start + ifd_offset
+            entry_count = read_int(ifd, 2)
+            if entry_count == 0 or entry_count > 1000:
+                return None
+            end = max(end, ifd + 2 + entry_count * 12 + 4)
+            arrays = {}
+            for index in range(entry_count):
+                entry = ifd + 2 + index * 12
+                tag = read_int(entry, 2)
+                field_type = read_int(entry + 2, 2)
+                count = read_int(entry + 4, 4)
+                type_size = TIFF_TYPE_SIZES.get(field_type)
+                if type_size is None:
+                    return None
+                data_size = type_size * count
+                data = entry + 8 if data_size <= 4 else start + read_int(entry + 8, 4)
+                if data_size > 4:
+                    end = max(end, data + data_size)
+                # Offset e dimensioni di strip (273/279) e tile (324/325)
+                if tag in (273, 279, 324, 325) and type_size in (2, 4) and count <= 1000000:
+                    arrays[tag] = [read_int(data + i * type_size, type_size) for i in range(count)]
+            for offsets_tag, counts_tag in ((273, 279), (324, 325)):
+                for offset, size in zip(arrays.get(offsets_tag, ()), arrays.get(counts_tag, ())):
+                    end = max(end, start + offset + size)
+            ifd_offset = read_int(ifd + 2 + entry_count * 12, 4)
+    except ValueError:
+        return None
+    return end if end <= limit else None
+
+# Firme cercate dal carving e relativi formati
+CARVING_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'II*\x00', 'TIFF'),
+    (b'MM\x00*', 'TIFF'),
+)
+
+def carve_images(evidence, max_size=None):
+    """
+    Cerca immagini JPEG/PNG/TIFF incorporate o concatenate nel file (o immagine disco)
+    con find() sulla mappatura, senza cicli byte per byte in Python. Ogni risultato indica
+    offset, lunghezza, formato e tipo:
+    - 'primary': l'immagine all'inizio del file
+    - 'exif_thumbnail': miniatura nel segmento APP1 Exif di un altro JPEG (IFD1)
+    - 'embedded': immagine contenuta in un'altra immagine
+    - 'mpf_image': immagine MPF (anteprima/secondaria) accodata a un JPEG con segmento MPF
+    - 'appended': immagine accodata subito dopo la fine di un'altra
+    - 'carved': immagine trovata in dati non allocati o arbitrari
+    """
+    buffer = evidence.buffer
+    if buffer is None:
+        return []
+    limit = len(buffer)
+    
+    candidates = []
+    for signature, image_format in CARVING_SIGNATURES:
+        pos = buffer.find(signature)
+        while pos >= 0:
+            candidates.append((pos, image_format))
+            pos = buffer.find(signature, pos + 1)
+    candidates.sort()
+    
+    carved = []
+    regions = []
+    last_top_level = None
+    for offset, image_format in candidates:
+        parent = None
+        for region in reversed(regions):
+            if region['offset'] < offset < region['end']:
+                parent = region
+                break
+        in_exif = parent is not None and any(a <= offset < b for a, b in parent['exif_ranges'])
+        # Un header TIFF dentro un APP1 Exif è il blocco EXIF stesso, non un'immagine
+        if image_format == 'TIFF' and in_exif:
+            continue
+        
+        exif_ranges, has_mpf = [], False
+        if image_format == 'JPEG':
+            extent = jpeg_extent(buffer, offset, limit)
+            if extent is None:
+                continue
+            end, exif_ranges, has_mpf = extent
+        elif image_format == 'PNG':
+            end = png_extent(buffer, offset, limit)
+        else:
+            end = tiff_extent(buffer, offset, limit)
+        if end is None or (max_size and end - offset > max_size):
+            continue
+        
+        # Conferma che Pillow riconosca l'immagine (solo header)
+        try:
+            with Image.open(MemoryViewReader(evidence.view[offset:end])) as image:
+                width, height = image.size
+        except Exception:
+            continue
+        
+        if offset == 0:
+            kind = 'primary'
+        elif parent is not None:
+            kind = 'exif_thumbnail' if in_exif else 'embedded'
+        elif last_top_level and offset == last_top_level['end']:
+            previous_mpf = last_top_level['has_mpf'] or last_top_level['kind'] == 'mpf_image'
+            kind = 'mpf_image' if previous_mpf else 'appended'
+        else:
+            kind = 'carved'
+        
+        region = {
+            'offset': offset,
+            'end': end,
+            'length': end - offset,
+            'format': image_format,
+            'kind': kind,
+            'width': width,
+            'height': height,
+            'parent_offset': parent['offset'] if parent else None,
+            'exif_ranges': exif_ranges,
+            'has_mpf': has_mpf,
+        }
+        regions.append(region)
+        carved.append(region)
+        if parent is None:
+            last_top_level = region
+    
+    return [{key: value for key, value in region.items() if key not in ('exif_ranges', 'has_mpf', 'end')}
+            for region in carved]
+
+def analyze_carved_images(evidence, config, include_primary=False):
+    """Esegue il carving e la stessa analisi EXIF/GPS su ogni immagine trovata"""
+    max_size = config['analysis']['max_file_size_mb'] * 1024 * 1024
+    results = []
+    for carved in carve_images(evidence, max_size):
+        if carved['kind'] == 'primary' and not include_primary:
+            continue
+        offset, length = carved['offset'], carved['length']
+        file_info = {
+            'name': f"{os.path.basename(evidence.path)}@{offset:#x}.{carved['format'].lower()}",
+            'path': f"{evidence.path}@{offset}",
+            'size': length,
+            'carved_from': evidence.path,
+            'offset': offset,
+            'kind': carved['kind'],
+            'parent_offset': carved['parent_offset'],
+        }
+        results.append(analyze_image_stream(MemoryViewReader(evidence.view[offset:offset + length]),
+                                            file_info, config))
+    return results
+
+def analyze_evidence_path(image_path, config, stats=None, check=None):
+    """
+    Analisi senza interfaccia di un file su disco: controllo dei limiti, hash classici e
+    hash tree, EXIF/GPS, tutto dalla stessa mappatura del file. Restituisce un dizionario
+    con la stessa struttura di GeoImageAnalyzer.metadata.
+    """
+    stats = stats or os.stat(image_path)
+    check = check or check_evidence_file(image_path, config)
+    file_info = file_info_from_stat(image_path, stats)
+    if check['status'] == 'rejected':
+        return {'exif': {}, 'gps': {}, 'forensic': {'file_info': file_info, 'hashes': {}},
+                'evidence_check': check}
+    
+    block_size = int(config['analysis']['hash_tree']['block_size_mb'] * 1024 * 1024)
+    with EvidenceFile(image_path) as evidence:
+        hashes, hash_tree = evidence.hashes_with_tree(block_size)
+        with evidence.open_stream() as stream:
+            result = analyze_image_stream(stream, file_info, config, hashes=hashes)
+    result['forensic']['hash_tree'] = hash_tree
+    result['evidence_check'] = check
+    return result
+
+# Tag eliminati dalle copie anonimizzate: numeri di serie (corpo, obiettivo, DNG), MakerNote che li
+# contiene nei formati proprietari e XMP incorporato nel TIFF (può ripetere GPS e seriali)
+REDACTED_TAGS = frozenset((0xA431, 0xA435, 0xC62F, 0x927C, 0x02BC))
+# Con security.anonymize_sensitive_data anche descrizione, autore, computer, copyright, IPTC,
+# blocco Photoshop, commento, ID univoco e proprietario della fotocamera
+SENSITIVE_TAGS = frozenset((0x010E, 0x013B, 0x013C, 0x8298, 0x83BB, 0x8649, 0x9286, 0xA420, 0xA430))
+GPS_IFD_TAG = 0x8825
+# Puntatori a sotto-IFD da percorrere (EXIF, interoperabilità, SubIFDs dei RAW)
+TIFF_SUB_IFD_TAGS = (0x8769, 0xA005, 0x014A)
+JPEG_XMP_IDENTIFIERS = (b'http://ns.adobe.com/xap/1.0/\x00', b'http://ns.adobe.com/xmp/extension/\x00')
+PNG_TEXT_CHUNKS = (b'tEXt', b'zTXt', b'iTXt')
+
+class MetadataRedaction:
+    """
+    Rimozione dei metadati sensibili da un'immagine senza spostare alcun byte: le voci eliminate
+    vengono compattate all'interno del loro IFD e i loro valori azzerati, i pacchetti XMP
+    sostituiti da spazi. Le modifiche sono patch (offset, byte) della stessa lunghezza dei byte
+    originali, applicate mentre il file viene copiato: i dati compressi restano identici.
+    """
+    
+    def __init__(self, buffer, anonymize=False):
+        self.buffer = buffer
+        self.anonymize = anonymize
+        self.tags = REDACTED_TAGS | SENSITIVE_TAGS if anonymize else REDACTED_TAGS
+        self.patches = []
+        self.removed = []
+        # Voci TIFF eliminate (GPS e tag): sulla copia già redatta deve restare vuota
+        self.tiff_entries = []
+        
+    def patch(self, offset, data):
+        if data:
+            self.patches.append((offset, bytes(data)))
+            
+    def blank(self, offset, length, fill=b'\x00'):
+        length = min(length, len(self.buffer) - offset)
+        if length > 0:
+            self.patch(offset, fill * length)
+            
+    def regions(self):
+        """Patch unite in regioni disgiunte e ordinate (le patch successive prevalgono sulle precedenti)"""
+        spans = []
+        for offset, data in sorted(self.patches, key=lambda patch: patch[0]):
+            end = offset + len(data)
+            if spans and offset <= spans[-1][1]:
+                spans[-1][1] = max(spans[-1][1], end)
+            else:
+                spans.append([offset, end])
+        regions = []
+        for start, end in spans:
+            region = bytearray(self.buffer[start:end])
+            for offset, data in self.patches:
+                if start <= offset < end:
+                    region[offset - start:offset - start + len(data)] = data
+            regions.append((start, bytes(region)))
+        return regions
+        
+    def patched(self, start, end):
+        """Byte di buffer[start:end] con le patch già registrate"""
+        data = bytearray(self.buffer[start:end])
+        for offset, patch in self.patches:
+            if offset < end and offset + len(patch) > start:
+                low = max(offset, start)
+                high = min(offset + len(patch), end)
+                data[low - start:high - start] = patch[low - offset:high - offset]
+        return data
+        
+    def redact(self, format_name):
+        """Registra le patch per il formato indicato (ValueError se il formato non è supportato)"""
+        redactor = {'JPEG': self.redact_jpeg_stream, 'PNG': self.redact_png, 'WEBP': self.redact_webp,
+                    'HEIF': self.redact_heif, 'TIFF': self.redact_tiff, 'RAW': self.redact_tiff,
+                    'BMP': lambda: None}.get(format_name)
+        if redactor is None:
+            raise ValueError(f"formato {format_name} non supportato per la redazione")
+        redactor()
+        return self
+        
+    def redact_tiff(self, base=0, limit=None):
+        """Elimina l'IFD GPS e i tag da rimuovere dal blocco TIFF che inizia a base (offset relativi a base)"""
+        buffer = self.buffer
+        limit = len(buffer) if limit is None else limit
+        order = {b'II': 'little', b'MM': 'big'}.get(bytes(buffer[base:base + 2]))
+        if order is None or int.from_bytes(buffer[base + 2:base + 4], order) != 42:
+            raise ValueError("header TIFF non valido (BigTIFF non supportato)")
+        
+        def read(position, size):
+            return int.from_bytes(buffer[position:position + size], order)
+        
+        def values(entry, value_type, count):
+            """Offset contenuti in una voce (inline se occupano al più 4 byte)"""
+            size = TIFF_TYPE_SIZES.get(value_type, 4)
+            position = entry + 8 if size * count <= 4 else base + read(entry + 8, 4)
+            return [read(position + index * size, size) for index in range(min(count, 64))
+                    if position + (index + 1) * size <= limit]
+        
+        def blank_value(entry, value_type, count):
+            size = TIFF_TYPE_SIZES.get(value_type, 1) * count
+            if size > 4:
+                offset = base + read(entry + 8, 4)
+                if offset < limit:
+                    self.blank(offset, min(size, limit - offset))
+        
+        def blank_ifd(position):
+            """Azzera un IFD intero (voci e valori fuori linea), usato per l'IFD GPS"""
+            count = read(position, 2)
+            if position + 6 + 12 * count > limit:
+                return
+            for index in range(count):
+                entry = position + 2 + 12 * index
+                blank_value(entry, read(entry + 2, 2), read(entry + 4, 4))
+            self.blank(position, 6 + 12 * count)
+        
+        pending = [read(base + 4, 4)]
+        visited = set()
+        while pending:
+            offset = pending.pop()
+            position = base + offset
+            if not offset or offset in visited or position + 2 > limit:
+                continue
+            visited.add(offset)
+            count = read(position, 2)
+            if position + 6 + 12 * count > limit:
+                continue
+            kept = []
+            thumbnail = {}
+            for index in range(count):
+                entry = position + 2 + 12 * index
+                tag, value_type, value_count = read(entry, 2), read(entry + 2, 2), read(entry + 4, 4)
+                if tag == GPS_IFD_TAG:
+                    for gps_offset in values(entry, value_type, 1):
+                        if base + gps_offset + 2 <= limit:
+                            blank_ifd(base + gps_offset)
+                    self.removed.append('GPSInfo')
+                    self.tiff_entries.append('GPSInfo')
+                elif tag in self.tags:
+                    blank_value(entry, value_type, value_count)
+                    self.removed.append(TAGS.get(tag, f"0x{tag:04X}"))
+                    self.tiff_entries.append(TAGS.get(tag, f"0x{tag:04X}"))
+                else:
+                    kept.append(bytes(buffer[entry:entry + 12]))
+                    if tag in TIFF_SUB_IFD_TAGS:
+                        pending.extend(values(entry, value_type, value_count))
+                    elif tag in (0x0201, 0x0202):
+                        thumbnail[tag] = values(entry, value_type, 1)
+            if thumbnail.get(0x0201) and thumbnail.get(0x0202):
+                # Miniatura JPEG dell'IFD1: ha un proprio APP1 che può ripetere GPS e seriali
+                start = base + thumbnail[0x0201][0]
+                end = min(start + thumbnail[0x0202][0], limit)
+                if start < end and bytes(buffer[start:start + 2]) == b'\xff\xd8':
+                    self.redact_jpeg(start, end)
+            next_ifd = read(position + 2 + 12 * count, 4)
+            pending.append(next_ifd)
+            if len(kept) < count:
+                # Stessa lunghezza: voci rimaste, puntatore al prossimo IFD e riempimento a zero
+                self.patch(position, len(kept).to_bytes(2, order) + b''.join(kept)
+                           + next_ifd.to_bytes(4, order) + bytes(12 * (count - len(kept))))
+        
+    def redact_jpeg_stream(self):
+        """JPEG principale e immagini successive (anteprime MPF, JPEG accodati), ognuna con i propri metadati"""
+        buffer = self.buffer
+        start = 0
+        while start >= 0:
+            extent = jpeg_extent(buffer, start, len(buffer))
+            if extent is None and start > 0:
+                # Firma casuale nei dati compressi: non è un JPEG
+                start = buffer.find(b'\xff\xd8\xff', start + 3)
+                continue
+            end = extent[0] if extent else len(buffer)
+            self.redact_jpeg(start, end)
+            start = buffer.find(b'\xff\xd8\xff', end) if extent else -1
+            
+    def redact_jpeg(self, start, limit):
+        """Segmenti di metadati di un JPEG fino allo Start Of Scan"""
+        buffer = self.buffer
+        pos = start + 2
+        while pos + 4 <= limit and buffer[pos] == 0xFF:
+            marker = buffer[pos + 1]
+            if marker == 0xFF:
+                pos += 1
+                continue
+            if marker in (0xDA, 0xD9):
+                break
+            segment_start = pos + 4
+            segment_end = min(pos + 2 + int.from_bytes(buffer[pos + 2:pos + 4], 'big'), limit)
+            identifier = bytes(buffer[segment_start:segment_start + 35])
+            if marker == 0xE1 and identifier.startswith(b'Exif\x00\x00'):
+                self.redact_tiff(segment_start + 6, segment_end)
+            elif marker == 0xE1 and identifier.startswith(JPEG_XMP_IDENTIFIERS):
+                prefix = next(len(name) for name in JPEG_XMP_IDENTIFIERS if identifier.startswith(name))
+                self.blank(segment_start + prefix, segment_end - segment_start - prefix, b' ')
+                self.removed.append('XMP')
+            elif marker == 0xED and self.anonymize and identifier.startswith(b'Photoshop 3.0\x00'):
+                self.blank(segment_start + 14, segment_end - segment_start - 14)
+                self.removed.append('IPTC')
+            elif marker == 0xFE and self.anonymize:
+                self.blank(segment_start, segment_end - segment_start, b' ')
+                self.removed.append('Comment')
+            pos = segment_end
+            
+    def redact_png(self):
+        """Chunk eXIf, XMP e profili EXIF testuali (con anonymize tutti i testi); CRC ricalcolati"""
+        buffer = self.buffer
+        pos = 8
+        while pos + 12 <= len(buffer):
+            length = int.from_bytes(buffer[pos:pos + 4], 'big')
+            chunk_type = bytes(buffer[pos + 4:pos + 8])
+            data_start, data_end = pos + 8, pos + 8 + length
+            if data_end + 4 > len(buffer) or chunk_type == b'IEND':
+                break
+            changed = False
+            if chunk_type == b'eXIf':
+                patches = len(self.patches)
+                self.redact_tiff(data_start, data_end)
+                changed = len(self.patches) > patches
+            elif chunk_type in PNG_TEXT_CHUNKS:
+                keyword_end = bytes(buffer[data_start:min(data_start + 80, data_end)]).find(b'\x00')
+                keyword = bytes(buffer[data_start:data_start + max(keyword_end, 0)])
+                if keyword_end > 0 and (self.anonymize or keyword == b'XML:com.adobe.xmp'
+                                        or keyword.startswith(b'Raw profile type')):
+                    text_start = data_start + keyword_end + 1
+                    if chunk_type == b'iTXt':
+                        # Testo non compresso (flag e metodo a zero), lingua e parola chiave tradotta invariate
+                        header = bytes(buffer[text_start + 2:data_end])
+                        language_end = header.find(b'\x00')
+                        translated_end = header.find(b'\x00', language_end + 1)
+                        self.patch(text_start, b'\x00\x00')
+                        text_start += 2 + translated_end + 1
+                    elif chunk_type == b'zTXt':
+                        # Il testo compresso diventa un tEXt di spazi
+                        self.patch(pos + 4, b'tEXt')
+                    self.blank(text_start, data_end - text_start, b' ')
+                    self.removed.append('XMP' if keyword == b'XML:com.adobe.xmp' else keyword.decode('latin-1'))
+                    changed = True
+            if changed:
+                crc = zlib.crc32(self.patched(pos + 4, data_end))
+                self.patch(data_end, crc.to_bytes(4, 'big'))
+            pos = data_end + 4
+            
+    def redact_webp(self):
+        """Chunk EXIF e XMP di un WebP (RIFF, senza checksum)"""
+        buffer = self.buffer
+        pos = 12
+        while pos + 8 <= len(buffer):
+            chunk_type = bytes(buffer[pos:pos + 4])
+            length = int.from_bytes(buffer[pos + 4:pos + 8], 'little')
+            data_start, data_end = pos + 8, min(pos + 8 + length, len(buffer))
+            if chunk_type == b'EXIF':
+                prefix = 6 if bytes(buffer[data_start:data_start + 6]) == b'Exif\x00\x00' else 0
+                self.redact_tiff(data_start + prefix, data_end)
+            elif chunk_type == b'XMP ':
+                self.blank(data_start, data_end - data_start, b' ')
+                self.removed.append('XMP')
+            pos += 8 + length + (length & 1)
+            
+    def redact_heif(self):
+        """Item Exif e XMP di un HEIF individuati tramite iloc (i box non cambiano)"""
+        metadata = parse_heif_metadata(MemoryViewReader(memoryview(self.buffer)))
+        extents = metadata.get('exif_extents') or []
+        if extents:
+            # L'item Exif può essere diviso in più extent: redazione sull'item ricostruito e
+            # patch riportate sugli extent del file, divise ai loro confini
+            item = b''.join(bytes(self.buffer[offset:offset + length]) for offset, length in extents)
+            redaction = MetadataRedaction(item, self.anonymize)
+            redaction.redact_tiff(metadata['exif_tiff_offset'], len(item))
+            for item_offset, data in redaction.patches:
+                start = 0
+                for offset, length in extents:
+                    low, high = max(item_offset, start), min(item_offset + len(data), start + length)
+                    if low < high:
+                        self.patch(offset + low - start, data[low - item_offset:high - item_offset])
+                    start += length
+            self.removed.extend(redaction.removed)
+            self.tiff_entries.extend(redaction.tiff_entries)
+        for offset, length in metadata.get('xmp_extents') or []:
+            self.blank(offset, length, b' ')
+        if metadata.get('xmp_extents'):
+            self.removed.append('XMP')
+
+def redact_image_file(source_path, output_path, anonymize=False):
+    """
+    Scrive una copia anonimizzata (senza GPS, seriali e XMP) copiando il file a blocchi con le
+    patch dei metadati applicate al volo; i pixel non vengono decodificati né ricompressi.
+    La copia viene scritta in un file temporaneo e rinominata solo dopo la verifica.
+    Restituisce la voce del manifesto: hash SHA256 di origine e copia, metadati rimossi.
+    """
+    with EvidenceFile(source_path) as evidence:
+        buffer = evidence.buffer
+        if buffer is None:
+            buffer = evidence.file.read()
+        view = memoryview(buffer)
+        handler = format_handler_for(bytes(view[:16]), os.path.splitext(source_path)[1])
+        if handler is None:
+            raise ValueError("formato non riconosciuto")
+        redaction = MetadataRedaction(buffer, anonymize).redact(handler.name)
+        
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        temp_path = f"{output_path}.tmp"
+        source_hash, output_hash = hashlib.sha256(), hashlib.sha256()
+        try:
+            with open(temp_path, 'wb') as output:
+                position = 0
+                for offset, data in redaction.regions() + [(len(view), b'')]:
+                    for chunk_start in range(position, offset, HASH_CHUNK_SIZE):
+                        chunk = view[chunk_start:min(chunk_start + HASH_CHUNK_SIZE, offset)]
+                        source_hash.update(chunk)
+                        output_hash.update(chunk)
+                        output.write(chunk)
+                    source_hash.update(view[offset:offset + len(data)])
+                    output_hash.update(data)
+                    output.write(data)
+                    position = offset + len(data)
+            verify_redacted_file(temp_path, handler, anonymize)
+            os.replace(temp_path, output_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return {
+        'source': source_path,
+        'output': output_path,
+        'format': handler.name,
+        'sha256_source': source_hash.hexdigest(),
+        'sha256_redacted': output_hash.hexdigest(),
+        'removed': sorted(set(redaction.removed)),
+        'bytes_rewritten': sum(len(data) for offset, data in redaction.regions()),
+    }
+
+def verify_redacted_file(path, handler, anonymize=False):
+    """
+    Controlla la copia redatta: ValueError se restano GPS o tag da rimuovere.
+    La verifica strutturale ripercorre tutti gli IFD (anche IFD1 e miniatura JPEG) con lo stesso
+    parser della redazione; quella con Pillow rilegge IFD0, IFD EXIF e IFD1.
+    """
+    with EvidenceFile(path) as evidence:
+        buffer = evidence.buffer if evidence.buffer is not None else evidence.file.read()
+        remaining = MetadataRedaction(buffer, anonymize).redact(handler.name).tiff_entries
+    tags = REDACTED_TAGS | SENSITIVE_TAGS if anonymize else REDACTED_TAGS
+    try:
+        with handler.open_image(path) as image:
+            exif = image.getexif()
+            for ifd in (exif, exif.get_ifd(0x8769), exif.get_ifd(ExifTags.IFD.IFD1)):
+                remaining.extend(TAGS.get(tag, f"0x{tag:04X}") for tag in tags | {GPS_IFD_TAG} if tag in ifd)
+    except (OSError, SyntaxError, AttributeError):
+        # Pillow non apre tutti i formati redatti (es. RAW proprietari): resta la verifica strutturale
+        pass
+    if remaining:
+        raise ValueError("metadati ancora presenti dopo la redazione: " + ", ".join(sorted(set(remaining))))
+
+def redact_images(sources, source_root, output_root, config, workers=None):
+    """
+    Copie anonimizzate di più immagini, in parallelo (il lavoro è dominato dall'I/O).
+    sources sono percorsi sotto source_root, ricreati sotto output_root; produce una voce del
+    manifesto per ogni file, con 'error' se la copia non è stata prodotta.
+    """
+    redaction_config = config['security']['redaction']
+    anonymize = config['security']['anonymize_sensitive_data']
+    
+    def redact(path):
+        output_path = os.path.join(output_root, os.path.relpath(path, source_root))
+        try:
+            return redact_image_file(path, output_path, anonymize)
+        except (OSError, ValueError, SyntaxError) as e:
+            return {'source': path, 'output': None, 'error': str(e)}
+    
+    with ThreadPoolExecutor(max_workers=workers or redaction_config['workers']) as executor:
+        yield from executor.map(redact, sources)
+
+def export_redacted_copies(paths, source_root, output_root, config, workers=None, progress=None):
+    """Copie anonimizzate di paths sotto output_root e manifesto con gli hash di origine e copia"""
+    start = time.perf_counter()
+    entries = []
+    for count, entry in enumerate(redact_images(paths, source_root, output_root, config, workers), start=1):
+        entries.append(entry)
+        if progress:
+            progress(count, entry)
+    manifest = {
+        'redaction_info': {
+            'timestamp': datetime.now().isoformat(),
+            'analyzer': 'GeoImage Analyzer v1.0',
+            'source': os.path.abspath(source_root),
+            'output': os.path.abspath(output_root),
+            'anonymize_sensitive_data': config['security']['anonymize_sensitive_data'],
+            'files': len(entries),
+            'redacted': sum(1 for entry in entries if not entry.get('error')),
+            'errors': sum(1 for entry in entries if entry.get('error')),
+            'elapsed_seconds': round(time.perf_counter() - start, 3),
+        },
+        'files': entries,
+    }
+    os.makedirs(output_root, exist_ok=True)
+    write_json_atomic(os.path.join(output_root, config['security']['redaction']['manifest']), manifest)
+    return manifest
+
+def compile_globs(patterns):
+    """Compila più glob in un'unica espressione regolare (None se non ci sono pattern)"""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(pattern)})" for pattern in patterns),
+                      re.IGNORECASE)
+
+def scan_directory(root, config, include=None, exclude=None, sniff=None, error_callback=None,
+                   directory_cache=None):
+    """
+    Percorre ricorsivamente una cartella con os.scandir e produce (percorso, stat) delle
+    immagini trovate. Il tipo delle voci viene dal DirEntry (senza stat aggiuntive) e lo
+    stat viene richiesto solo per i file selezionati, riusando quello in cache nel DirEntry.
+    I glob di inclusione/esclusione si applicano al percorso relativo e al nome; le cartelle
+    escluse non vengono nemmeno aperte. I file con estensione supportata vengono selezionati
+    senza aprirli (la firma è verificata da check_evidence_file); con sniff i file con
+    estensione diversa vengono riconosciuti leggendone i primi byte.
+    Le cartelle e i file non leggibili sono segnalati a error_callback(percorso, errore).
+    Con directory_cache (dizionario riusato tra scansioni successive) le cartelle con data di
+    modifica invariata non vengono rilette: si riusano voci e stat della scansione precedente.
+    """
+    scanner_config = config['analysis']['scanner']
+    supported_formats = set(config['analysis']['supported_formats'])
+    include_re = compile_globs(include if include is not None else scanner_config['include'])
+    exclude_re = compile_globs(exclude if exclude is not None else scanner_config['exclude'])
+    if sniff is None:
+        sniff = scanner_config['sniff_unknown_extensions']
+    
+    def excluded(relative_path, name):
+        return exclude_re is not None and (exclude_re.match(relative_path) or exclude_re.match(name))
+    
+    def report(path, error):
+        if error_callback:
+            error_callback(path, error)
+    
+    stack = [(root, '')]
+    while stack:
+        directory, relative_dir = stack.pop()
+        try:
+            if directory_cache is not None:
+                mtime = os.stat(directory).st_mtime_ns
+                cached = directory_cache.get(directory)
+                if cached and cached[0] == mtime:
+                    stack.extend(cached[1])
+                    yield from cached[2]
+                    continue
+                subdirectories, images = [], []
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    relative_path = f"{relative_dir}{entry.name}"
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not excluded(relative_path, entry.name):
+                                stack.append((entry.path, relative_path + '/'))
+                                if directory_cache is not None:
+                                    subdirectories.append(stack[-1])
+                            continue
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                    except OSError:
+                        continue
+                    
+                    if excluded(relative_path, entry.name):
+                        continue
+                    if include_re is not None and not (include_re.match(relative_path)
+                                                       or include_re.match(entry.name)):
+                        continue
+                    
+                    extension = os.path.splitext(entry.name)[1].lower()
+                    try:
+                        if extension not in supported_formats:
+                            if not sniff:
+                                continue
+                            with open(entry.path, 'rb') as f:
+                                if detect_image_format(f.read(16), extension) is None:
+                                    continue
+                        image = (entry.path, entry.stat(follow_symlinks=False))
+                    except OSError as e:
+                        report(entry.path, e)
+                        continue
+                    if directory_cache is not None:
+                        images.append(image)
+                    yield image
+            if directory_cache is not None:
+                directory_cache[directory] = (mtime, subdirectories, images)
+        except OSError as e:
+            if directory_cache is not None:
+                directory_cache.pop(directory, None)
+            # Una sottocartella rimossa dopo la scansione precedente non è un errore
+            if directory == root or not isinstance(e, FileNotFoundError):
+                report(directory, e)
+
+def watch_directory(root, config, callback, stop_event, interval=None, **scan_options):
+    """
+    Controlla periodicamente una cartella di deposito (polling) e chiama callback(percorso, stat)
+    per ogni immagine nuova. Un file viene segnalato solo quando dimensione e data di modifica
+    restano invariate tra due controlli, cioè quando la copia è terminata. Vengono rilette solo
+    le cartelle la cui data di modifica è cambiata (nuovi file, rinomine); i file ancora in
+    copia vengono ricontrollati con uno stat.
+    """
+    if interval is None:
+        interval = config['analysis']['scanner']['watch_interval_seconds']
+    known = {}
+    pending = {}
+    directory_cache = {}
+    while not stop_event.is_set():
+        for path, stats in scan_directory(root, config, directory_cache=directory_cache, **scan_options):
+            if path in pending:
+                # Lo stat in cache della cartella non cambia durante la copia: va riletto
+                try:
+                    stats = os.stat(path)
+                except OSError:
+                    del pending[path]
+                    continue
+            signature = (stats.st_size, stats.st_mtime_ns)
+            if known.get(path) == signature:
+                continue
+            if pending.get(path) == signature:
+                known[path] = signature
+                del pending[path]
+                callback(path, stats)
+            else:
+                pending[path] = signature
+        stop_event.wait(interval)
+
+def reverse_geocode(lat, lon, config):
+    """
+    Ottiene l'indirizzo dalle coordinate (usando OpenStreetMap). I risultati sono in cache
+    per coordinate arrotondate (~10 m) e le richieste rispettano l'intervallo minimo del servizio.
+    """
+    key = (round(lat, 4), round(lon, 4))
+    with geocode_lock:
+        if key in geocode_cache:
+            return geocode_cache[key]
+        wait = geocode_last_request[0] + GEOCODE_MIN_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        geocode_last_request[0] = time.monotonic()
+    
+    geocoding_config = config['geolocation']['reverse_geocoding']
+    address = None
+    try:
+        url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lon}&zoom=18&addressdetails=1"
+        headers = {'User-Agent': geocoding_config['user_agent']}
+        
+        response = requests.get(url, headers=headers, timeout=geocoding_config['timeout_seconds'])
+        if response.status_code == 200:
+            data = response.json()
+            address = data.get('display_name', 'Indirizzo non trovato')
+            
+    except Exception as e:
+        print(f"Errore reverse geocoding: {e}")
+        return None
+    
+    with geocode_lock:
+        geocode_cache[key] = address
+    return address
+
+# Schema MBTiles (metadata, tiles con righe TMS) più tile_usage per l'espulsione LRU
+TILE_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row);
+CREATE TABLE IF NOT EXISTS tile_usage (
+    zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, size INTEGER, last_access REAL,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+);
+CREATE INDEX IF NOT EXISTS tile_usage_access ON tile_usage (last_access);
+"""
+
+# Aggiornamenti dell'ultimo accesso tenuti in memoria prima di essere scritti nel database
+TILE_ACCESS_FLUSH = 256
+
+def tile_coordinates(lat, lon, zoom):
+    """Tile (x, y) dello schema XYZ (Web Mercator) che contiene il punto"""
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tiles_in_area(lat_min, lon_min, lat_max, lon_max, min_zoom, max_zoom):
+    """Tile (zoom, x, y) che coprono il rettangolo, per ogni livello di zoom"""
+    for zoom in range(min_zoom, max_zoom + 1):
+        x_min, y_min = tile_coordinates(lat_max, lon_min, zoom)
+        x_max, y_max = tile_coordinates(lat_min, lon_max, zoom)
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                yield zoom, x, y
+
+class TileCache:
+    """
+    Archivio locale delle tile della mappa in formato MBTiles (SQLite), usato come sorgente
+    del widget mappa. Le tile mancanti vengono scaricate solo se la rete è consentita e,
+    oltre max_size_mb, vengono eliminate quelle usate meno di recente. Dopo un errore di
+    rete i download restano sospesi per retry_seconds: offline la mappa non attende i timeout.
+    """
+    
+    def __init__(self, path, config, user_agent):
+        self.path = path
+        self.tile_server = config['tile_server']
+        self.offline = config['offline']
+        self.max_size = config['max_size_mb'] * 1024 * 1024
+        self.timeout = config['timeout_seconds']
+        self.retry_seconds = config['retry_seconds']
+        self.network_retry_at = 0.0
+        self.accessed = {}
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(TILE_CACHE_SCHEMA)
+        with self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)", [
+                ('name', 'GeoImage Analyzer tile cache'), ('format', 'png'), ('type', 'baselayer'),
+                ('version', '1.1'), ('description', self.tile_server),
+            ])
+        self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM tile_usage").fetchone()[0]
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        
+    @staticmethod
+    def key(zoom, x, y):
+        """Chiave MBTiles: le righe seguono lo schema TMS (origine in basso)"""
+        return zoom, x, (1 << zoom) - 1 - y
+        
+    def get(self, zoom, x, y):
+        """Tile dalla cache locale (None se assente)"""
+        key = self.key(zoom, x, y)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            self.accessed[key] = time.time()
+            if len(self.accessed) >= TILE_ACCESS_FLUSH:
+                self.flush_access()
+        return row[0]
+        
+    def contains(self, zoom, x, y):
+        """True se la tile è già nella cache"""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                self.key(zoom, x, y)
+            ).fetchone() is not None
+        
+    def put(self, zoom, x, y, data):
+        """Salva una tile ed elimina le meno usate se la cache supera la dimensione massima"""
+        key = self.key(zoom, x, y)
+        with self.lock:
+            previous = self.connection.execute(
+                "SELECT size FROM tile_usage WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", key
+            ).fetchone()
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (*key, data))
+                self.connection.execute("INSERT OR REPLACE INTO tile_usage VALUES (?, ?, ?, ?, ?)",
+                                        (*key, len(data), time.time()))
+            self.size += len(data) - (previous[0] if previous else 0)
+            if self.max_size and self.size > self.max_size:
+                self.evict()
+                
+    def flush_access(self):
+        """Scrive gli ultimi accessi accumulati (chiamato con il lock acquisito)"""
+        if not self.accessed:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE tile_usage SET last_access = ? WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                [(accessed, *key) for key, accessed in self.accessed.items()]
+            )
+        self.accessed.clear()
+        
+    def evict(self):
+        """Elimina le tile usate meno di recente fino al 90% della dimensione massima (con il lock)"""
+        self.flush_access()
+        target = self.max_size * 0.9
+        while self.size > target:
+            rows = self.connection.execute(
+                "SELECT zoom_level, tile_column, tile_row, size FROM tile_usage ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            removed = []
+            for zoom, column, row, size in rows:
+                removed.append((zoom, column, row))
+                self.size -= size
+                if self.size <= target:
+                    break
+            with self.connection:
+                where = "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?"
+                self.connection.executemany(f"DELETE FROM tiles {where}", removed)
+                self.connection.executemany(f"DELETE FROM tile_usage {where}", removed)
+                
+    def network_available(self):
+        """False in modalità offline o durante la pausa dopo un errore di rete"""
+        return not self.offline and time.monotonic() >= self.network_retry_at
+        
+    def download(self, zoom, x, y):
+        """Scarica una tile dal server configurato (None se non disponibile)"""
+        if not self.network_available():
+            return None
+        url = self.tile_server.replace('{z}', str(zoom)).replace('{x}', str(x)).replace('{y}', str(y))
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException:
+            self.network_retry_at = time.monotonic() + self.retry_seconds
+            return None
+        if response.status_code != 200 or not response.content:
+            return None
+        return response.content
+        
+    def tile(self, zoom, x, y):
+        """Tile dalla cache o, se manca e la rete è disponibile, dal server (salvata in cache)"""
+        data = self.get(zoom, x, y)
+        if data is None:
+            data = self.download(zoom, x, y)
+            if data is not None:
+                self.put(zoom, x, y, data)
+        return data
+        
+    def prefetch(self, tiles, progress=None, stop_event=None):
+        """
+        Scarica in sequenza le tile non ancora in cache (una richiesta alla volta, come
+        richiesto dalle policy dei server di tile). Si interrompe se la rete non è disponibile.
+        """
+        statistics = {'tiles': len(tiles), 'downloaded': 0, 'cached': 0, 'failed': 0, 'bytes': 0}
+        for count, (zoom, x, y) in enumerate(tiles, start=1):
+            if stop_event is not None and stop_event.is_set():
+                break
+            if self.contains(zoom, x, y):
+                statistics['cached'] += 1
+            else:
+                data = self.download(zoom, x, y)
+                if data is None:
+                    statistics['failed'] += 1
+                    if not self.network_available():
+                        break
+                else:
+                    self.put(zoom, x, y, data)
+                    statistics['downloaded'] += 1
+                    statistics['bytes'] += len(data)
+            if progress:
+                progress(count, statistics)
+        statistics['network_available'] = self.network_available()
+        return statistics
+        
+    def close(self):
+        """Salva gli ultimi accessi e chiude il database"""
+        with self.lock:
+            self.flush_access()
+            self.connection.close()
+
+def open_tile_cache(config):
+    """Cache delle tile configurata in geolocation.tile_cache (None se non utilizzabile)"""
+    geolocation_config = config['geolocation']
+    try:
+        return TileCache(geolocation_config['tile_cache']['path'], geolocation_config['tile_cache'],
+                         geolocation_config['reverse_geocoding']['user_agent'])
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠️ Cache delle tile non disponibile: {e}")
+        return None
+
+def create_map_widget(parent, tile_cache, **kwargs):
+    """
+    Widget TkinterMapView che legge le tile dalla cache locale: la classe viene creata qui
+    perché tkintermapview può essere importato solo dopo l'installazione delle dipendenze.
+    """
+    if tile_cache is None:
+        return tkintermapview.TkinterMapView(parent, **kwargs)
+    
+    class CachedMapView(tkintermapview.TkinterMapView):
+        def request_image(self, zoom, x, y, db_cursor=None):
+            # Chiamato dai thread di caricamento del widget al posto della richiesta HTTP diretta
+            data = tile_cache.tile(zoom, x, y)
+            if data is None or not self.running:
+                return self.empty_tile_image
+            try:
+                image_tk = ImageTk.PhotoImage(Image.open(io.BytesIO(data)))
+            except Exception:
+                return self.empty_tile_image
+            self.tile_image_cache[f"{zoom}{x}{y}"] = image_tk
+            return image_tk
+    
+    widget = CachedMapView(parent, **kwargs)
+    widget.set_tile_server(tile_cache.tile_server)
+    return widget
+
+class AnalysisPipeline:
+    """
+    Pipeline a stadi per l'analisi di molti file: lettura -> hash -> EXIF/GPS -> geocoding -> report.
+    Gli stadi sono collegati da code limitate: quando uno stadio è saturo gli stadi a monte
+    si bloccano (backpressure), quindi la memoria resta limitata qualunque sia il numero di
+    file in ingresso. Ogni stadio ha il proprio numero di thread: più thread per gli stadi
+    di I/O (lettura, geocoding), meno per quelli di calcolo (hash e parsing, che in hashlib
+    e nei decoder di Pillow rilasciano il GIL).
+    """
+    
+    def __init__(self, config, geocode=False):
+        self.config = config
+        self.geocode = geocode
+        pipeline_config = config['advanced']['pipeline']
+        self.queue_size = pipeline_config['queue_size']
+        self.block_size = int(config['analysis']['hash_tree']['block_size_mb'] * 1024 * 1024)
+        self.stages = [
+            ('read', self.read_stage, pipeline_config['read_workers']),
+            ('hash', self.hash_stage, pipeline_config['hash_workers']),
+            ('parse', self.parse_stage, pipeline_config['parse_workers']),
+        ]
+        if geocode:
+            self.stages.append(('geocode', self.geocode_stage, pipeline_config['geocode_workers']))
+        self.statistics = {name: {'items': 0, 'busy_seconds': 0.0, 'workers': workers}
+                           for name, _, workers in self.stages}
+        self.statistics_lock = threading.Lock()
+        
+    def read_stage(self, item):
+        """Controlla i limiti e apre la mappatura del file"""
+        path, stats = item['path'], item['stats']
+        item['check'] = check_evidence_file(path, self.config, require_extension=False)
+        item['file_info'] = file_info_from_stat(path, stats)
+        if item['check']['status'] == 'rejected':
+            item['result'] = {'exif': {}, 'gps': {}, 'evidence_check': item['check'],
+                              'forensic': {'file_info': item['file_info'], 'hashes': {}}}
+        else:
+            item['evidence'] = EvidenceFile(path)
+        return item
+        
+    def hash_stage(self, item):
+        """Hash classici e hash tree in un'unica lettura della mappatura"""
+        item['hashes'], item['hash_tree'] = item['evidence'].hashes_with_tree(self.block_size)
+        return item
+        
+    def parse_stage(self, item):
+        """EXIF/GPS dalla stessa mappatura; al termine la mappatura viene chiusa"""
+        evidence = item.pop('evidence')
+        try:
+            with evidence.open_stream() as stream:
+                result = analyze_image_stream(stream, item['file_info'], self.config, hashes=item['hashes'])
+        finally:
+            evidence.close()
+        result['forensic']['hash_tree'] = item['hash_tree']
+        result['evidence_check'] = item['check']
+        item['result'] = result
+        return item
+        
+    def geocode_stage(self, item):
+        """Reverse geocoding delle coordinate (con cache e limite di richieste)"""
+        coordinates = item['result'].get('coordinates')
+        if coordinates:
+            coordinates['address'] = reverse_geocode(coordinates['lat'], coordinates['lon'], self.config)
+        return item
+        
+    def run(self, sources):
+        """
+        Elabora le coppie (percorso, stat) di sources e produce i risultati man mano che
+        escono dall'ultimo stadio (l'ordine può differire da quello di ingresso).
+        Se il consumatore smette di iterare (eccezione, interruzione, break) i thread vengono
+        fermati, le code svuotate e le mappature ancora aperte chiuse.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        finished = object()
+        stop = threading.Event()
+        
+        def release(item):
+            """Chiude la mappatura di un elemento che non proseguirà nella pipeline"""
+            if isinstance(item, dict) and 'evidence' in item:
+                item.pop('evidence').close()
+        
+        def put(target, item):
+            # Con timeout: un consumatore fermo non deve bloccare per sempre gli stadi a monte
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            release(item)
+            return False
+        
+        def get(source):
+            while not stop.is_set():
+                try:
+                    return source.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return finished
+        
+        def producer():
+            try:
+                for path, stats in sources:
+                    if not put(queues[0], {'path': path, 'stats': stats}):
+                        return
+            finally:
+                for _ in range(self.stages[0][2]):
+                    put(queues[0], finished)
+        
+        def worker(index, name, function, remaining):
+            input_queue, output_queue = queues[index], queues[index + 1]
+            while True:
+                item = get(input_queue)
+                if item is finished:
+                    break
+                # Gli elementi già completati (es. file rifiutati) attraversano gli stadi successivi
+                if 'result' not in item or name == 'geocode':
+                    started = time.perf_counter()
+                    try:
+                        item = function(item)
+                    except Exception as e:
+                        release(item)
+                        item['result'] = {'exif': {}, 'gps': {}, 'error': f"Errore nello stadio {name}: {e}",
+                                          'forensic': {'file_info': item.get('file_info', {'path': item['path']}),
+                                                       'hashes': item.get('hashes', {})}}
+                    with self.statistics_lock:
+                        self.statistics[name]['items'] += 1
+                        self.statistics[name]['busy_seconds'] += time.perf_counter() - started
+                if not put(output_queue, item):
+                    break
+            # L'ultimo thread dello stadio propaga la chiusura allo stadio successivo
+            with self.statistics_lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                next_workers = self.stages[index + 1][2] if index + 1 < len(self.stages) else 1
+                for _ in range(next_workers):
+                    put(output_queue, finished)
+        
+        threads = [threading.Thread(target=producer, daemon=True)]
+        for index, (name, function, workers) in enumerate(self.stages):
+            remaining = [workers]
+            threads.extend(threading.Thread(target=worker, args=(index, name, function, remaining), daemon=True)
+                           for _ in range(workers))
+        for thread in threads:
+            thread.start()
+        
+        try:
+            while True:
+                item = get(queues[-1])
+                if item is finished:
+                    break
+                yield item['result']
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            # Elementi rimasti nelle code dopo un'interruzione
+            for pending in queues:
+                while True:
+                    try:
+                        release(pending.get_nowait())
+                    except queue.Empty:
+                        break
+            
+    def summary(self):
+        """Tempo di lavoro per stadio: lo stadio con il tempo per elemento più alto limita il throughput"""
+        lines = []
+        for name, stats in self.statistics.items():
+            per_item = stats['busy_seconds'] / stats['items'] if stats['items'] else 0.0
+            capacity = stats['workers'] / per_item if per_item else float('inf')
+            lines.append(f"{name:<8} {stats['items']:>8,} file  {per_item * 1000:8.1f} ms/file  "
+                         f"{stats['workers']} thread  capacità ~{capacity:,.0f} file/s")
+        return lines
+
+def is_archive_name(name):
+    """Indica se il nome di un file corrisponde a un archivio ZIP/TAR supportato"""
+    return name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def iter_archive_images(archive_path, config, fileobj=None, chain=(), depth=0):
+    """
+    Itera sulle immagini contenute in un archivio ZIP/TAR, anche annidato, senza estrarre
+    nulla su disco. Produce tuple (catena, nome membro, dimensione, stream); lo stream va
+    consumato prima di passare al membro successivo (i TAR annidati sono letti in streaming).
+    """
+    supported_formats = config['analysis']['supported_formats']
+    max_size = config['analysis']['max_file_size_mb'] * 1024 * 1024
+    
+    def wanted(name):
+        return os.path.splitext(name)[1].lower() in supported_formats
+    
+    def nested(name, stream, size):
+        if depth + 1 >= MAX_ARCHIVE_DEPTH:
+            print(f"⚠️ Archivio annidato oltre la profondità massima ignorato: {name}")
+            return
+        # Uno ZIP richiede accesso casuale: se lo stream non lo consente viene letto in memoria
+        try:
+            seekable = stream.seekable()
+        except (AttributeError, OSError):
+            # I membri di un TAR letto in streaming non espongono seekable()
+            seekable = False
+        if name.lower().endswith('.zip') and not seekable:
+            if size > max_size:
+                print(f"⚠️ ZIP annidato non posizionabile oltre il limite di dimensione ignorato: {name}")
+                return
+            stream = io.BytesIO(stream.read())
+        yield from iter_archive_images(archive_path, config, fileobj=stream,
+                                       chain=chain + (name,), depth=depth + 1)
+    
+    if fileobj is None:
+        is_zip = zipfile.is_zipfile(archive_path)
+    else:
+        is_zip = chain[-1].lower().endswith('.zip')
+    
+    if is_zip:
+        with zipfile.ZipFile(fileobj if fileobj is not None else archive_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                if wanted(info.filename) or is_archive_name(info.filename):
+                    with archive.open(info) as member:
+                        if is_archive_name(info.filename):
+                            yield from nested(info.filename, member, info.file_size)
+                        else:
+                            yield chain, info.filename, info.file_size, member
+    else:
+        # Gli archivi annidati sono letti in modalità streaming: nessun seek all'indietro
+        mode = 'r:*' if fileobj is None else 'r|*'
+        with tarfile.open(name=None if fileobj else archive_path, fileobj=fileobj, mode=mode) as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                if wanted(member.name) or is_archive_name(member.name):
+                    stream = archive.extractfile(member)
+                    if is_archive_name(member.name):
+                        yield from nested(member.name, stream, member.size)
+                    else:
+                        yield chain, member.name, member.size, stream
+
+def analyze_archive(archive_path, config, progress_callback=None):
+    """
+    Analizza tutte le immagini di un archivio leggendo i membri direttamente dallo stream.
+    I membri entro analysis.max_file_size_mb vengono letti in memoria una sola volta
+    (hash ed EXIF dallo stesso buffer); quelli più grandi vengono solo hashati in streaming.
+    """
+    max_size = config['analysis']['max_file_size_mb'] * 1024 * 1024
+    
+    for count, (chain, member_name, size, stream) in enumerate(
+            iter_archive_images(archive_path, config), start=1):
+        file_info = {
+            'name': os.path.basename(member_name),
+            'path': "!".join((archive_path,) + chain + (member_name,)),
+            'size': size,
+            'archive': archive_path,
+            'archive_chain': list(chain),
+            'member': member_name,
+        }
+        
+        if size > max_size:
+            hashers = {name: hashlib.new(name) for name in ('md5', 'sha1', 'sha256')}
+            for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+            result = {
+                'exif': {},
+                'gps': {},
+                'forensic': {'file_info': file_info,
+                             'hashes': {name.upper(): hasher.hexdigest()
+                                        for name, hasher in hashers.items()}},
+                'evidence_check': {'status': 'degraded',
+                                   'reason': f"Membro di {size / (1024 * 1024):.1f} MB oltre il limite di "
+                                             f"{config['analysis']['max_file_size_mb']} MB"},
+            }
+        else:
+            # BytesIO condivide il buffer dei bytes letti: nessuna copia aggiuntiva
+            result = analyze_image_stream(io.BytesIO(stream.read()), file_info, config)
+        
+        if progress_callback:
+            progress_callback(count, file_info['path'])
+        yield result
+
+class JsonResultsWriter:
+    """
+    Report JSON scritto in streaming: ogni risultato viene serializzato appena disponibile.
+    Le statistiche del caso, se indicate, vengono aggiunte dopo i risultati alla chiusura.
+    """
+    
+    def __init__(self, output_path, analysis_info, statistics=None, normalizer=None):
+        self.file = open(output_path, 'w', encoding='utf-8')
+        self.count = 0
+        self.statistics = statistics
+        self.normalizer = normalizer
+        self.file.write('{\n  "analysis_info": ')
+        self.file.write(json.dumps(analysis_info, ensure_ascii=False, default=str))
+        self.file.write(',\n  "results": [')
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        
+    def write(self, result):
+        self.write_serialized(serialize_result(result, self.normalizer))
+        
+    def write_serialized(self, text):
+        """Aggiunge un risultato già serializzato in JSON (ad esempio una riga del giornale)"""
+        self.file.write(',\n    ' if self.count else '\n    ')
+        self.file.write(text)
+        self.count += 1
+        
+    def close(self):
+        if not self.file.closed:
+            self.file.write('\n  ]')
+            if self.statistics is not None:
+                self.file.write(',\n  "case_statistics": ')
+                self.file.write(json.dumps(self.statistics.to_dict(), ensure_ascii=False, default=str))
+            self.file.write('\n}\n')
+            self.file.close()
+
+def write_json_results(output_path, results, analysis_info, statistics=None, normalizer=None):
+    """Scrive i risultati in un report JSON man mano che vengono prodotti"""
+    with JsonResultsWriter(output_path, analysis_info, statistics, normalizer) as writer:
+        for result in results:
+            writer.write(result)
+    return writer.count
+
+class BatchJournal:
+    """
+    Giornale di una scansione ripristinabile: ogni risultato completato viene accodato in
+    <report>.journal.jsonl e periodicamente il checkpoint <report>.checkpoint.json (scritto
+    con rename atomico) registra quanti byte del giornale sono consolidati su disco (fsync).
+    Alla ripresa il giornale viene troncato all'ultimo checkpoint, quindi una riga scritta
+    a metà da un processo interrotto non entra nel report; i file completati e non
+    modificati da allora vengono saltati.
+    """
+    
+    def __init__(self, output_path, identity, config, restart=False, normalizer=None):
+        self.journal_path = f"{output_path}.journal.jsonl"
+        self.checkpoint_path = f"{output_path}.checkpoint.json"
+        self.identity = identity
+        self.normalizer = normalizer
+        self.interval_files = config['interval_files']
+        self.interval_seconds = config['interval_seconds']
+        # Percorso -> (riga del giornale, dimensione, data di modifica) dell'ultimo risultato
+        self.completed = {}
+        self.lines = 0
+        
+        checkpoint = None
+        if not restart and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('identity') != identity:
+                raise ValueError(f"Il checkpoint {self.checkpoint_path} appartiene a un'altra scansione "
+                                 f"(usare --restart per ripartire da zero)")
+        if checkpoint and os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(checkpoint['journal_bytes'])
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    file_info = json.loads(line)['forensic']['file_info']
+                    self.completed[file_info.get('path')] = (self.lines, file_info.get('size'),
+                                                             file_info.get('modification_time'))
+                    self.lines += 1
+            self.file = open(self.journal_path, 'ab')
+        else:
+            self.file = open(self.journal_path, 'wb')
+        self.resumed = len(self.completed)
+        self.pending = 0
+        self.last_checkpoint = time.monotonic()
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        
+    def is_completed(self, path, stats):
+        """True se il file è già nel giornale e non è cambiato da allora"""
+        entry = self.completed.get(path)
+        return (entry is not None and entry[1] == stats.st_size
+                and entry[2] == datetime.fromtimestamp(stats.st_mtime).isoformat())
+        
+    def write(self, result):
+        """Accoda un risultato; ogni interval_files risultati o interval_seconds scrive il checkpoint"""
+        file_info = result['forensic']['file_info']
+        self.file.write(serialize_result(result, self.normalizer).encode('utf-8') + b'\n')
+        self.completed[file_info.get('path')] = (self.lines, file_info.get('size'), file_info.get('modification_time'))
+        self.lines += 1
+        self.pending += 1
+        if self.pending >= self.interval_files or time.monotonic() - self.last_checkpoint >= self.interval_seconds:
+            self.checkpoint()
+            
+    def checkpoint(self):
+        """Consolida il giornale su disco e registra la sua lunghezza nel checkpoint"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        write_json_atomic(self.checkpoint_path, {
+            'identity': self.identity,
+            'journal_bytes': self.file.tell(),
+            'files': self.lines,
+            'updated': datetime.now().isoformat(),
+        })
+        self.pending = 0
+        self.last_checkpoint = time.monotonic()
+        
+    def results(self):
+        """Risultati serializzati del giornale, solo l'ultimo per ogni file (un file modificato viene rianalizzato)"""
+        self.file.flush()
+        keep = {entry[0] for entry in self.completed.values()}
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for index, line in enumerate(f):
+                if index in keep:
+                    yield line.rstrip('\n')
+                    
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            
+    def finish(self):
+        """Chiude il giornale e rimuove giornale e checkpoint (report completato)"""
+        self.close()
+        for path in (self.checkpoint_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+def write_journal_report(journal, output_path, analysis_info, collectors, statistics=None):
+    """Report JSON finale dal giornale; i collettori ricevono ogni risultato (deserializzato solo se servono)"""
+    with JsonResultsWriter(output_path, analysis_info, statistics) as writer:
+        for line in journal.results():
+            writer.write_serialized(line)
+            if collectors:
+                result = json.loads(line)
+                for collect in collectors:
+                    collect(result)
+    return writer.count
+
+async def analyze_files_async(sources, config, on_result, concurrency=None, hash_files=True):
+    """
+    Modalità batch per storage ad alta latenza (NFS/SMB): molte letture in corso insieme.
+    Lettura, hash e parsing di ogni file avvengono in un pool di thread limitato da concurrency,
+    così il loop degli eventi non esegue lavoro di CPU. Gli hash vengono calcolati con letture
+    sequenziali a blocchi (senza mmap, che su filesystem di rete serializza i page fault) e
+    l'header (analysis.async_io.header_bytes) da cui si estraggono EXIF e GPS viene preso dai
+    primi blocchi; solo se il parsing chiede dati oltre l'header (e il file è entro
+    max_file_size_mb) si rilegge dal file ciò che serve. Restituisce le statistiche:
+    file, letture effettive dal file, byte, IOPS.
+    """
+    async_config = config['advanced']['async_io']
+    concurrency = concurrency or async_config['concurrency']
+    header_bytes = async_config['header_bytes']
+    max_size = config['analysis']['max_file_size_mb'] * 1024 * 1024
+    block_size = int(config['analysis']['hash_tree']['block_size_mb'] * 1024 * 1024)
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    statistics = {'files': 0, 'reads': 0, 'bytes': 0}
+    
+    def analyze_file(path, file_info):
+        """Eseguita nel pool: restituisce (risultato, letture, byte letti)"""
+        check = check_evidence_file(path, config, require_extension=False)
+        if check['status'] == 'rejected':
+            return ({'exif': {}, 'gps': {}, 'evidence_check': check,
+                     'forensic': {'file_info': file_info, 'hashes': {}}}, 0, 0)
+        with EvidenceFile(path, use_mmap=False) as evidence:
+            hashes, hash_tree = {}, None
+            if hash_files:
+                header = bytearray()
+                
+                def keep_header(chunk):
+                    if len(header) < header_bytes:
+                        header.extend(chunk[:header_bytes - len(header)])
+                
+                hashes, hash_tree = evidence.hashes_with_tree(block_size, on_chunk=keep_header)
+                header = bytes(header)
+                read_bytes = file_info['size']
+            else:
+                header = evidence.header(header_bytes)
+                read_bytes = len(header)
+            
+            stream = HeaderReader(header, file_info['size'])
+            result = analyze_image_stream(stream, file_info, config, hashes=hashes)
+            if result.get('error') and stream.truncated and file_info['size'] <= max_size:
+                # Header insufficiente (es. IFD TIFF in fondo al file): parsing dal file, letto solo dove serve
+                with evidence.open_stream() as stream:
+                    result = analyze_image_stream(stream, file_info, config, hashes=hashes)
+                    read_bytes += stream.raw.bytes_read
+            if hash_tree:
+                result['forensic']['hash_tree'] = hash_tree
+            result['evidence_check'] = check
+            return result, evidence.reads, read_bytes
+    
+    async def process(path, stats):
+        file_info = file_info_from_stat(path, stats)
+        try:
+            result, reads, read_bytes = await loop.run_in_executor(executor, analyze_file, path, file_info)
+            statistics['reads'] += reads
+            statistics['bytes'] += read_bytes
+        except Exception as e:
+            result = read_error_result(file_info, e)
+        statistics['files'] += 1
+        on_result(result)
+    
+    # Finestra scorrevole: al massimo 2 x concurrency file in corso, il resto resta nel generatore
+    started = time.perf_counter()
+    pending = set()
+    try:
+        for path, stats in sources:
+            pending.add(asyncio.ensure_future(process(path, stats)))
+            if len(pending) >= concurrency * 2:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if pending:
+            await asyncio.wait(pending)
+    finally:
+        executor.shutdown(wait=True)
+    
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    statistics.update(
+        seconds=elapsed,
+        files_per_second=statistics['files'] / elapsed,
+        iops=statistics['reads'] / elapsed,
+        mb_per_second=statistics['bytes'] / elapsed / (1024 * 1024),
+        concurrency=concurrency,
+    )
+    return statistics
+
+def analyze_uploaded_image(data, name, config, hash_file=True):
+    """Analisi di un'immagine ricevuta in memoria (stessa struttura di analyze_evidence_path)"""
+    file_info = {'name': name, 'path': None, 'size': len(data), 'uploaded': True}
+    with io.BytesIO(data) as stream:
+        return analyze_image_stream(stream, file_info, config, hashes=None if hash_file else {})
+
+class AnalysisRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    API HTTP dell'analizzatore:
+    - GET /health: stato del server, richieste in corso e statistiche
+    - POST /analyze con JSON {"path": ..., "metadata_only": false}: analisi di un file locale
+      (solo sotto le cartelle consentite con --allow-root o allowed_roots)
+    - POST /analyze con il file nel corpo (?name=...&metadata_only=1): analisi dell'upload
+    Con metadata_only gli hash non vengono calcolati (solo EXIF/GPS dall'header).
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'GeoImageAnalyzer/1.0'
+    # Una connessione keep-alive inattiva libera il worker dopo questo tempo
+    timeout = 10
+    # Header e corpo sono scritti separatamente: senza TCP_NODELAY ogni risposta keep-alive attende l'ACK ritardato
+    disable_nagle_algorithm = True
+    
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+        
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        
+    def send_error_json(self, status, message):
+        self.server.count('errors')
+        self.send_json(status, {'error': message})
+        
+    def do_GET(self):
+        if urlsplit(self.path).path != '/health':
+            self.send_error_json(404, "Endpoint non trovato")
+            return
+        self.send_json(200, self.server.health())
+        
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/analyze':
+            self.send_error_json(404, "Endpoint non trovato")
+            return
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self.send_error_json(411, "Content-Length obbligatorio")
+            return
+        if length < 0:
+            # rfile.read(-1) leggerebbe fino alla chiusura, senza limite di dimensione
+            self.send_error_json(400, "Content-Length negativo")
+            self.close_connection = True
+            return
+        if length > self.server.max_upload:
+            self.send_error_json(413, f"Corpo di {length:,} byte oltre il limite di {self.server.max_upload:,}")
+            self.close_connection = True
+            return
+        body = self.rfile.read(length)
+        query = parse_qs(url.query)
+        metadata_only = query.get('metadata_only', ['0'])[0].lower() in ('1', 'true', 'yes')
+        
+        start = time.perf_counter()
+        try:
+            if self.headers.get('Content-Type', '').split(';')[0].strip() == 'application/json':
+                request = json.loads(body or b'{}')
+                if not isinstance(request, dict):
+                    raise ValueError("Il corpo JSON deve essere un oggetto, es. {\"path\": ...}")
+                result = self.analyze_path(request.get('path'), request.get('metadata_only', metadata_only))
+            else:
+                if detect_image_format(body[:16], os.path.splitext(query.get('name', [''])[0])[1].lower()) is None:
+                    self.send_error_json(415, "Firma del file non riconosciuta come immagine supportata")
+                    return
+                result = analyze_uploaded_image(body, query.get('name', ['upload'])[0], self.server.config,
+                                                hash_file=not metadata_only)
+        except PermissionError as e:
+            self.send_error_json(403, str(e))
+            return
+        except (FileNotFoundError, IsADirectoryError) as e:
+            self.send_error_json(404, f"File non trovato: {e.filename}")
+            return
+        except ValueError as e:
+            self.send_error_json(400, str(e))
+            return
+        except Exception as e:
+            self.send_error_json(500, f"Errore nell'analisi: {e}")
+            return
+        self.server.count('analyzed', time.perf_counter() - start)
+        self.send_json(200, exif_normalizer(self.server.config).result(result))
+        
+    def analyze_path(self, path, metadata_only):
+        """Analisi di un file locale, consentita solo sotto le cartelle di allowed_roots (senza cartelle solo upload)"""
+        if not isinstance(path, str) or not path:
+            raise ValueError("Campo 'path' mancante")
+        roots = self.server.allowed_roots
+        if not roots:
+            raise PermissionError("Analisi per percorso disabilitata: nessuna cartella consentita (usare l'upload)")
+        path = os.path.realpath(path)
+        if not any(os.path.commonpath([root, path]) == root for root in roots):
+            raise PermissionError(f"Percorso fuori dalle cartelle consentite: {path}")
+        config = self.server.config
+        check = check_evidence_file(path, config, require_extension=False)
+        if check['status'] == 'rejected':
+            raise ValueError(check['reason'])
+        if not metadata_only:
+            return analyze_evidence_path(path, config, check=check)
+        
+        stats = os.stat(path)
+        file_info = file_info_from_stat(path, stats)
+        with open(path, 'rb') as stream:
+            result = analyze_image_stream(stream, file_info, config, hashes={})
+        result['evidence_check'] = check
+        return result
+
+class AnalysisHTTPServer(http.server.HTTPServer):
+    """
+    Server HTTP locale con pool di worker limitato: ogni connessione viene servita da uno
+    dei workers thread, al massimo queue_size connessioni attendono in coda e oltre il limite
+    il client riceve subito 503 con Retry-After invece di accumulare thread e memoria.
+    """
+    request_queue_size = 128
+    
+    def __init__(self, address, config, workers=None, verbose=False, allowed_roots=None):
+        api_config = config['advanced']['api_server']
+        super().__init__(address, AnalysisRequestHandler)
+        self.config = config
+        self.verbose = verbose
+        self.workers = workers or api_config['workers']
+        self.queue_size = api_config['queue_size']
+        self.max_upload = int(api_config['max_upload_mb'] * 1024 * 1024)
+        self.allowed_roots = [os.path.realpath(root)
+                              for root in list(api_config['allowed_roots']) + list(allowed_roots or [])]
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='api')
+        self.slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self.statistics_lock = threading.Lock()
+        self.statistics = {'connections': 0, 'rejected': 0, 'analyzed': 0, 'errors': 0, 'analysis_seconds': 0.0}
+        self.started = time.time()
+        
+    def count(self, key, seconds=None):
+        with self.statistics_lock:
+            self.statistics[key] += 1
+            if seconds is not None:
+                self.statistics['analysis_seconds'] += seconds
+        
+    def health(self):
+        with self.statistics_lock:
+            statistics = dict(self.statistics)
+        return {'status': 'ok', 'uptime_seconds': round(time.time() - self.started, 1),
+                'workers': self.workers, 'queue_size': self.queue_size, 'statistics': statistics}
+        
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            # Coda piena: risposta immediata senza occupare un worker
+            self.count('rejected')
+            try:
+                request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\n"
+                                b"Content-Type: application/json\r\nContent-Length: 24\r\nConnection: close\r\n\r\n"
+                                b'{"error": "server busy"}')
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        self.count('connections')
+        self.executor.submit(self.process_request_worker, request, client_address)
+        
+    def process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+            
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+CASE_DATABASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    case_id INTEGER NOT NULL REFERENCES cases(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    name TEXT,
+    size INTEGER,
+    md5 TEXT,
+    sha1 TEXT,
+    sha256 TEXT,
+    merkle_root TEXT,
+    format TEXT,
+    width INTEGER,
+    height INTEGER,
+    make TEXT,
+    model TEXT,
+    software TEXT,
+    capture_time TEXT,
+    analyzed_at TEXT NOT NULL,
+    error TEXT,
+    exif_offset INTEGER,
+    exif_length INTEGER,
+    UNIQUE (case_id, path)
+);
+CREATE TABLE IF NOT EXISTS exif (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS gps_points (
+    file_id INTEGER PRIMARY KEY REFERENCES files(id) ON DELETE CASCADE,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    altitude REAL
+);
+CREATE TABLE IF NOT EXISTS addresses (
+    file_id INTEGER PRIMARY KEY REFERENCES files(id) ON DELETE CASCADE,
+    address TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_md5 ON files(md5);
+CREATE INDEX IF NOT EXISTS files_sha1 ON files(sha1);
+CREATE INDEX IF NOT EXISTS files_sha256 ON files(sha256);
+CREATE INDEX IF NOT EXISTS files_device ON files(make, model);
+CREATE INDEX IF NOT EXISTS files_capture_time ON files(capture_time);
+CREATE INDEX IF NOT EXISTS exif_file ON exif(file_id);
+CREATE INDEX IF NOT EXISTS exif_tag ON exif(tag, value);
+CREATE INDEX IF NOT EXISTS gps_position ON gps_points(latitude, longitude);
+"""
+
+def exif_datetime_to_iso(value):
+    """Converte una data EXIF ('AAAA:MM:GG hh:mm:ss', o già normalizzata in ISO 8601) in ISO 8601; None se non valida"""
+    text = str(value).strip().rstrip('\x00')
+    try:
+        if len(text) == 19 and text[4] == ':' and text[7] == ':' and text[10] == ' ':
+            # Forma standard: conversione diretta (fromisoformat valida la data), molto più rapida di strptime
+            return datetime.fromisoformat(f"{text[:4]}-{text[5:7]}-{text[8:10]}T{text[11:]}").isoformat()
+        if 'T' in text:
+            return datetime.fromisoformat(text).isoformat()
+        return datetime.strptime(text, '%Y:%m:%d %H:%M:%S').isoformat()
+    except ValueError:
+        return None
+
+def intern_text(value):
+    """Stringa internata (una sola copia in memoria per valore), None se vuota"""
+    return sys.intern(str(value).strip()) if value else None
+
+class ResultRecord:
+    """
+    Risultato in forma compatta per tenere in memoria molti file (query e mappe del caso):
+    attributi in __slots__, marca, modello, software, formato e caso internati, MD5/SHA1/SHA256
+    in un unico blocco di byte. L'EXIF grezzo non viene copiato: restano offset e lunghezza
+    del blocco nel file di origine, da cui read_exif() lo rilegge quando serve.
+    """
+    __slots__ = ('path', 'stored_name', 'case_name', 'source', 'size', 'digests', 'merkle_digest', 'format',
+                 'width', 'height', 'make', 'model', 'software', 'capture_time', 'error',
+                 'latitude', 'longitude', 'address', 'exif_offset', 'exif_length')
+    
+    def __init__(self, path, name=None, case_name=None, source=None, size=None, digests=None, merkle_digest=None,
+                 format=None, width=None, height=None, make=None, model=None, software=None, capture_time=None,
+                 error=None, latitude=None, longitude=None, address=None, exif_offset=None, exif_length=None):
+        self.path = path
+        # Il nome viene conservato solo se diverso da quello del percorso (membri d'archivio, carving)
+        self.stored_name = name if name and name != os.path.basename(path or '') else None
+        self.case_name = intern_text(case_name)
+        self.source = source
+        self.size = size
+        self.digests = digests
+        self.merkle_digest = merkle_digest
+        self.format = intern_text(format)
+        self.width = width
+        self.height = height
+        self.make = intern_text(make)
+        self.model = intern_text(model)
+        self.software = intern_text(software)
+        self.capture_time = capture_time
+        self.error = error
+        self.latitude = latitude
+        self.longitude = longitude
+        self.address = address
+        self.exif_offset = exif_offset
+        self.exif_length = exif_length
+        
+    @classmethod
+    def from_result(cls, result, case_name=None):
+        """Record di un risultato (stessa struttura di GeoImageAnalyzer.metadata)"""
+        forensic = result.get('forensic') or {}
+        file_info = forensic.get('file_info') or {}
+        hashes = forensic.get('hashes') or {}
+        image_info = forensic.get('image_info') or {}
+        exif = result.get('exif') or {}
+        coordinates = result.get('coordinates') or {}
+        
+        # Offset dell'EXIF nel file su disco: per il carving a partire dall'immagine individuata,
+        # per i membri d'archivio non c'è un file da cui rileggerlo
+        exif_offset = exif_length = None
+        exif_location = image_info.get('exif_location')
+        if exif_location and 'archive' not in file_info:
+            exif_offset = (file_info.get('offset') or 0) + exif_location[0]
+            exif_length = exif_location[1]
+        
+        merkle_root = (forensic.get('hash_tree') or {}).get('merkle_root')
+        return cls(file_info.get('path') or file_info.get('name'), file_info.get('name'), case_name,
+                   file_info.get('carved_from'), file_info.get('size'),
+                   pack_digests(hashes.get('MD5'), hashes.get('SHA1'), hashes.get('SHA256')),
+                   bytes.fromhex(merkle_root) if merkle_root else None,
+                   image_info.get('format'), image_info.get('width'), image_info.get('height'),
+                   exif.get('Make'), exif.get('Model'), exif.get('Software'),
+                   exif_datetime_to_iso(exif.get('DateTimeOriginal') or exif.get('DateTime') or ''),
+                   result.get('error'), coordinates.get('lat'), coordinates.get('lon'), coordinates.get('address'),
+                   exif_offset, exif_length)
+        
+    @classmethod
+    def from_row(cls, row):
+        """Record di una riga restituita dalle query del database del caso"""
+        merkle_root = row['merkle_root']
+        return cls(row['path'], row['name'], row['case_name'], None, row['size'],
+                   pack_digests(row['md5'], row['sha1'], row['sha256']),
+                   bytes.fromhex(merkle_root) if merkle_root else None,
+                   row['format'], row['width'], row['height'], row['make'], row['model'], row['software'],
+                   row['capture_time'], row['error'], row['latitude'], row['longitude'], row['address'],
+                   row['exif_offset'], row['exif_length'])
+        
+    @property
+    def name(self):
+        return self.stored_name or os.path.basename(self.path or '')
+        
+    @property
+    def md5(self):
+        return self.digests[:16].hex() if self.digests else None
+        
+    @property
+    def sha1(self):
+        return self.digests[16:36].hex() if self.digests else None
+        
+    @property
+    def sha256(self):
+        return self.digests[36:].hex() if self.digests else None
+        
+    @property
+    def merkle_root(self):
+        return self.merkle_digest.hex() if self.merkle_digest else None
+        
+    @property
+    def device(self):
+        return device_name(self.make, self.model)
+        
+    def read_exif(self):
+        """(exif, gps) riletti dal file di origine; dizionari vuoti se il file non è disponibile"""
+        try:
+            if self.exif_offset is not None:
+                with open(self.source or self.path, 'rb') as f:
+                    f.seek(self.exif_offset)
+                    exif = Image.Exif()
+                    exif.load(f.read(self.exif_length))
+                return name_exif_tags(merged_exif_tags(exif))
+            if self.source:
+                # Immagine individuata con il carving senza un blocco EXIF localizzato
+                return {}, {}
+            with format_handler_for_path(self.path).open_image(self.path) as image:
+                return read_exif_metadata(image)
+        except (OSError, SyntaxError, ValueError):
+            return {}, {}
+
+def pack_digests(md5, sha1, sha256):
+    """MD5, SHA1 e SHA256 esadecimali in un unico blocco di 68 byte (None se manca un hash)"""
+    if not (md5 and sha1 and sha256):
+        return None
+    return bytes.fromhex(md5 + sha1 + sha256)
+
+class CaseDatabase:
+    """
+    Database del caso (SQLite in modalità WAL): file, hash, EXIF, punti GPS e indirizzi in
+    tabelle normalizzate e indicizzate. I risultati vengono accodati con store() e scritti
+    a gruppi di batch_size in un'unica transazione; le query valgono su tutti i casi.
+    """
+    
+    def __init__(self, path, case_name=None, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(CASE_DATABASE_SCHEMA)
+        # Database creati prima dell'aggiunta della posizione dell'EXIF nel file
+        columns = {row['name'] for row in self.connection.execute("PRAGMA table_info(files)")}
+        for column in ('exif_offset', 'exif_length'):
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE files ADD COLUMN {column} INTEGER")
+        self.case_id = None
+        self.case_name = None
+        if case_name:
+            self.open_case(case_name)
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        
+    def open_case(self, name):
+        """Seleziona (creandolo se necessario) il caso in cui salvare i risultati"""
+        self.flush()
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO cases (name, created) VALUES (?, ?)",
+                                    (name, datetime.now().isoformat()))
+        self.case_id = self.connection.execute("SELECT id FROM cases WHERE name = ?", (name,)).fetchone()[0]
+        self.case_name = name
+        return self.case_id
+        
+    def store(self, result):
+        """Accoda un risultato (stessa struttura di GeoImageAnalyzer.metadata)"""
+        self.pending.append(result)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return result
+        
+    def store_all(self, results):
+        """Salva una sequenza di risultati e restituisce quanti ne sono stati salvati"""
+        count = 0
+        for result in results:
+            self.store(result)
+            count += 1
+        self.flush()
+        return count
+        
+    def flush(self):
+        """Scrive i risultati accodati in un'unica transazione"""
+        if not self.pending:
+            return
+        if self.case_id is None:
+            raise ValueError("Nessun caso aperto nel database")
+        
+        analyzed_at = datetime.now().isoformat()
+        exif_rows, gps_rows, address_rows = [], [], []
+        with self.connection:
+            cursor = self.connection.cursor()
+            for result in self.pending:
+                record = ResultRecord.from_result(result)
+                exif = result.get('exif') or {}
+                # La posizione dell'EXIF è relativa al file su disco: non vale per le immagini del carving
+                exif_location = (None, None) if record.source else (record.exif_offset, record.exif_length)
+                
+                # Una nuova analisi dello stesso file sostituisce la precedente (con le righe collegate)
+                cursor.execute("DELETE FROM files WHERE case_id = ? AND path = ?", (self.case_id, record.path))
+                cursor.execute(
+                    "INSERT INTO files (case_id, path, name, size, md5, sha1, sha256, merkle_root, format, width,"
+                    " height, make, model, software, capture_time, analyzed_at, error, exif_offset, exif_length)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self.case_id, record.path, record.name, record.size, record.md5, record.sha1, record.sha256,
+                     record.merkle_root, record.format, record.width, record.height,
+                     record.make, record.model, record.software, record.capture_time,
+                     analyzed_at, record.error, *exif_location)
+                )
+                file_id = cursor.lastrowid
+                exif_rows.extend((file_id, str(tag), format_full_exif_value(value))
+                                 for tag, value in exif.items() if tag != 'GPSInfo')
+                
+                coordinates = result.get('coordinates')
+                if coordinates:
+                    altitude = result.get('gps', {}).get('GPSAltitude')
+                    try:
+                        altitude = float(altitude) if altitude is not None else None
+                    except (TypeError, ValueError, ZeroDivisionError):
+                        altitude = None
+                    gps_rows.append((file_id, coordinates['lat'], coordinates['lon'], altitude))
+                    if coordinates.get('address'):
+                        address_rows.append((file_id, coordinates['address']))
+            
+            cursor.executemany("INSERT INTO exif (file_id, tag, value) VALUES (?, ?, ?)", exif_rows)
+            cursor.executemany("INSERT INTO gps_points (file_id, latitude, longitude, altitude)"
+                               " VALUES (?, ?, ?, ?)", gps_rows)
+            cursor.executemany("INSERT INTO addresses (file_id, address) VALUES (?, ?)", address_rows)
+        self.pending = []
+        
+    def query(self, where, parameters=()):
+        """File di tutti i casi che soddisfano la condizione (ResultRecord con caso, coordinate e indirizzo)"""
+        self.flush()
+        rows = self.connection.execute(
+            "SELECT cases.name AS case_name, files.*, gps_points.latitude, gps_points.longitude,"
+            " addresses.address FROM files JOIN cases ON cases.id = files.case_id"
+            " LEFT JOIN gps_points ON gps_points.file_id = files.id"
+            " LEFT JOIN addresses ON addresses.file_id = files.id"
+            f" WHERE {where} ORDER BY files.capture_time, files.path",
+            parameters
+        )
+        return [ResultRecord.from_row(row) for row in rows]
+        
+    def find_by_hash(self, value):
+        """File con l'hash indicato (MD5, SHA1 o SHA256, riconosciuto dalla lunghezza)"""
+        column = {32: 'md5', 40: 'sha1', 64: 'sha256'}.get(len(value.strip()))
+        if not column:
+            raise ValueError(f"Hash non riconosciuto: {value}")
+        return self.query(f"files.{column} = ?", (value.strip().lower(),))
+        
+    def find_by_device(self, make=None, model=None):
+        """File scattati da un dispositivo (Make/Model esatti)"""
+        conditions, parameters = [], []
+        if make:
+            conditions.append("files.make = ?")
+            parameters.append(make)
+        if model:
+            conditions.append("files.model = ?")
+            parameters.append(model)
+        return self.query(" AND ".join(conditions) or "1", parameters)
+        
+    def find_by_time(self, start, end):
+        """File con data di scatto nell'intervallo (estremi ISO 8601 inclusi)"""
+        return self.query("files.capture_time BETWEEN ? AND ?", (start, end))
+        
+    def find_in_area(self, min_lat, min_lon, max_lat, max_lon):
+        """File con coordinate GPS nel rettangolo indicato"""
+        return self.query("gps_points.latitude BETWEEN ? AND ? AND gps_points.longitude BETWEEN ? AND ?",
+                          (min_lat, max_lat, min_lon, max_lon))
+        
+    def close(self):
+        """Scrive i risultati in sospeso e chiude il database"""
+        try:
+            self.flush()
+        finally:
+            self.connection.close()
+
+def quantization_digest(tables):
+    """Impronta breve delle tabelle di quantizzazione di un JPEG (None per gli altri formati)"""
+    if not tables:
+        return None
+    digest = hashlib.sha1()
+    for table_id in sorted(tables):
+        digest.update(bytes([table_id]))
+        digest.update(b''.join(int(value).to_bytes(2, 'big') for value in tables[table_id]))
+    return digest.hexdigest()[:16]
+
+# Posizione in ordine naturale di ogni coefficiente memorizzato a zig-zag nel segmento DQT
+JPEG_ZIGZAG = (
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63,
+)
+
+# Tabelle di riferimento dello standard JPEG (Annex K), scalate da libjpeg/IJG in base alla qualità
+IJG_LUMINANCE_TABLE = (
+    16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99,
+)
+IJG_CHROMINANCE_TABLE = (
+    17, 18, 24, 47, 99, 99, 99, 99, 18, 21, 26, 66, 99, 99, 99, 99,
+    24, 26, 56, 99, 99, 99, 99, 99, 47, 66, 99, 99, 99, 99, 99, 99,
+) + (99,) * 32
+
+# Software di fotoritocco riconosciuto nel tag Software (confronto senza maiuscole)
+EDITING_SOFTWARE = (
+    'photoshop', 'lightroom', 'gimp', 'affinity', 'pixelmator', 'paint.net', 'snapseed', 'capture one',
+    'darktable', 'luminar', 'imagemagick', 'graphicsmagick', 'picsart', 'facetune', 'canva', 'corel',
+)
+
+JPEG_MARKER_NAMES = {0xC0: 'SOF0', 0xC1: 'SOF1', 0xC2: 'SOF2', 0xC4: 'DHT', 0xDB: 'DQT',
+                     0xDD: 'DRI', 0xDA: 'SOS', 0xFE: 'COM'}
+JPEG_APP_IDENTIFIERS = ((b'JFIF\x00', 'JFIF'), (b'JFXX\x00', 'JFXX'), (b'Exif\x00', 'Exif'),
+                        (b'http://ns.adobe.com/xap/', 'XMP'), (b'ICC_PROFILE\x00', 'ICC'), (b'MPF\x00', 'MPF'),
+                        (b'Photoshop 3.0\x00', 'Photoshop'), (b'Adobe', 'Adobe'), (b'Ducky', 'Ducky'))
+
+# Indice impronta tabelle -> descrizione, costruito una sola volta per file di firme
+quantization_signature_index = {}
+
+def ijg_table(base, quality):
+    """Tabella di quantizzazione che libjpeg genera per la qualità indicata (1-100)"""
+    scale = 5000 // quality if quality < 50 else 200 - quality * 2
+    return [min(max((value * scale + 50) // 100, 1), 255) for value in base]
+
+def quantization_signatures(signatures_file=''):
+    """
+    Indice delle tabelle note: tabelle IJG (libjpeg, usate da GIMP, Pillow, ImageMagick e
+    molti editor) per ogni qualità, più le firme del file JSON opzionale {impronta: descrizione}
+    """
+    index = quantization_signature_index.get(signatures_file)
+    if index is None:
+        index = {}
+        for quality in range(1, 101):
+            luminance = ijg_table(IJG_LUMINANCE_TABLE, quality)
+            label = f"IJG libjpeg qualità {quality}"
+            index[quantization_digest({0: luminance, 1: ijg_table(IJG_CHROMINANCE_TABLE, quality)})] = label
+            index.setdefault(quantization_digest({0: luminance}), label)
+        if signatures_file and os.path.exists(signatures_file):
+            with open(signatures_file, 'r', encoding='utf-8') as f:
+                index.update(json.load(f))
+        quantization_signature_index[signatures_file] = index
+    return index
+
+def jpeg_header_structure(header):
+    """
+    Percorre i segmenti di un JPEG fino allo Start Of Scan (solo intestazione): restituisce
+    l'ordine dei marker e le tabelle di quantizzazione in ordine naturale, come Pillow
+    """
+    structure = {'markers': [], 'quantization': {}}
+    if header[:2] != b'\xff\xd8':
+        return None
+    pos = 2
+    while pos + 4 <= len(header):
+        if header[pos] != 0xFF:
+            break
+        marker = header[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        length = int.from_bytes(header[pos + 2:pos + 4], 'big')
+        segment = header[pos + 4:pos + 2 + length]
+        name = JPEG_MARKER_NAMES.get(marker, f"{marker:02X}")
+        if 0xE0 <= marker <= 0xEF:
+            name = f"APP{marker - 0xE0}"
+            for prefix, identifier in JPEG_APP_IDENTIFIERS:
+                if segment.startswith(prefix):
+                    name += f":{identifier}"
+                    break
+        structure['markers'].append(name)
+        if marker == 0xDA:
+            break
+        if marker == 0xDB:
+            offset = 0
+            while offset < len(segment):
+                precision, table_id = segment[offset] >> 4, segment[offset] & 0x0F
+                width = 2 if precision else 1
+                values = segment[offset + 1:offset + 1 + 64 * width]
+                if len(values) < 64 * width:
+                    break
+                natural = [0] * 64
+                for index in range(64):
+                    natural[JPEG_ZIGZAG[index]] = int.from_bytes(values[index * width:(index + 1) * width], 'big')
+                structure['quantization'][table_id] = natural
+                offset += 1 + 64 * width
+        pos += 2 + length
+    return structure
+
+def manipulation_indicators(header, exif, file_info, config):
+    """
+    Indicatori di possibile manipolazione ricavati dalla sola intestazione: tabelle di
+    quantizzazione confrontate con le firme note, ordine dei marker JPEG, tag Software,
+    coerenza tra date EXIF e tra data di scatto e data di modifica del file.
+    Ogni indicatore ha un peso; la somma dà il punteggio e il livello (nessuno/basso/medio/alto).
+    """
+    settings = config['analysis']['manipulation']
+    indicators = []
+    analysis = {'markers': [], 'quantization_digest': None, 'quantization_match': None}
+    
+    def indicator(weight, description):
+        indicators.append({'weight': weight, 'description': description})
+    
+    structure = jpeg_header_structure(header)
+    make = str(exif.get('Make') or '').strip()
+    if structure:
+        markers = structure['markers']
+        analysis['markers'] = markers
+        digest = quantization_digest(structure['quantization'])
+        analysis['quantization_digest'] = digest
+        match = quantization_signatures(settings['signatures_file']).get(digest) if digest else None
+        analysis['quantization_match'] = match
+        if match and make:
+            indicator(2, f"Tabelle di quantizzazione di un software ({match}) in un'immagine con EXIF di {make}: possibile ricompressione")
+        if 'APP1:Exif' not in markers:
+            indicator(1, "Nessun segmento EXIF: metadati assenti o rimossi")
+        elif 'APP0:JFIF' in markers and markers.index('APP0:JFIF') < markers.index('APP1:Exif'):
+            indicator(1, "Segmento JFIF prima dell'EXIF: ordine tipico di un software, non di una fotocamera")
+        if 'APP13:Photoshop' in markers:
+            indicator(2, "Segmento Photoshop (APP13) presente")
+        if 'APP14:Adobe' in markers:
+            indicator(1, "Segmento Adobe (APP14) presente")
+    
+    software = str(exif.get('Software') or '').strip()
+    editor = next((name for name in EDITING_SOFTWARE if name in software.casefold()), None)
+    if editor:
+        indicator(3, f"Tag Software indica un programma di fotoritocco: {software}")
+    
+    capture_time = exif_datetime_to_iso(exif.get('DateTimeOriginal') or '')
+    modify_time = exif_datetime_to_iso(exif.get('DateTime') or '')
+    if capture_time and modify_time and capture_time != modify_time:
+        delta = (datetime.fromisoformat(modify_time) - datetime.fromisoformat(capture_time)).total_seconds()
+        analysis['exif_modify_delta_seconds'] = delta
+        if delta > 0:
+            indicator(2, f"DateTime (modifica) successiva alla data di scatto di {delta / 3600:,.1f} ore")
+        else:
+            indicator(1, f"DateTime (modifica) precedente alla data di scatto di {-delta / 3600:,.1f} ore")
+    
+    modification_time = file_info.get('modification_time')
+    if capture_time and modification_time:
+        delta = (datetime.fromisoformat(modification_time) - datetime.fromisoformat(capture_time)).total_seconds()
+        analysis['filesystem_delta_seconds'] = delta
+        # Tolleranza per fusi orari e orologi non sincronizzati
+        if delta < -settings['timestamp_tolerance_hours'] * 3600:
+            indicator(2, f"Data di scatto successiva all'ultima modifica del file di {-delta / 3600:,.1f} ore")
+    
+    score = sum(item['weight'] for item in indicators)
+    analysis.update(
+        score=score,
+        level='nessuno' if score == 0 else 'basso' if score <= 2 else 'medio' if score <= 4 else 'alto',
+        indicators=indicators,
+    )
+    return analysis
+
+def makernote_signature(value):
+    """
+    Struttura della MakerNote: intestazione del produttore (es. 'Nikon', 'Apple iOS') e
+    impronta della lista dei tag del primo IFD, cercato agli offset usati dai vari produttori
+    """
+    if not isinstance(value, bytes) or len(value) < 8:
+        return None
+    prefix = value[:12].split(b'\x00', 1)[0].decode('latin-1')
+    vendor = prefix if len(prefix) >= 3 and prefix.isprintable() and prefix.isascii() else ''
+    for offset in (0, 8, 10, 12, 14, 18, 26):
+        for byte_order in ('big', 'little'):
+            count = int.from_bytes(value[offset:offset + 2], byte_order)
+            end = offset + 2 + count * 12
+            if not 2 <= count <= 256 or end > len(value):
+                continue
+            tags = [int.from_bytes(value[pos:pos + 2], byte_order) for pos in range(offset + 2, end, 12)]
+            if all(a < b for a, b in zip(tags, tags[1:])):
+                tag_digest = hashlib.sha1(repr(tags).encode()).hexdigest()[:8]
+                return f"{vendor or 'IFD'}:{count}:{tag_digest}"
+    return vendor or "non strutturata"
+
+def device_signature(result):
+    """
+    Firma del dispositivo di origine dai campi EXIF di un risultato. Con un numero di serie
+    la firma è (marca, modello, seriale); altrimenti si combinano obiettivo, tabelle di
+    quantizzazione e struttura della MakerNote.
+    """
+    exif = result.get('exif') or {}
+    
+    def text(*tags):
+        for tag in tags:
+            value = exif.get(tag)
+            if value:
+                return str(value).strip().rstrip('\x00').strip()
+        return ''
+    
+    signature = {
+        'make': text('Make'),
+        'model': text('Model'),
+        'serial': text('BodySerialNumber', 'CameraSerialNumber', 'SerialNumber'),
+        'lens': text('LensModel'),
+        'quantization': (result.get('forensic', {}).get('image_info') or {}).get('quantization_digest'),
+        'makernote': makernote_signature(exif_python_value(exif.get('MakerNote'))),
+    }
+    if signature['serial']:
+        key = ('serial', signature['make'].casefold(), signature['model'].casefold(), signature['serial'])
+    else:
+        key = ('profile', signature['make'].casefold(), signature['model'].casefold(), signature['lens'],
+               signature['quantization'], signature['makernote'])
+    return key, signature
+
+class DeviceClusters:
+    """
+    Raggruppamento delle immagini per dispositivo di origine: ogni risultato viene aggiunto
+    al gruppo della propria firma in un dizionario, quindi il costo è lineare nel numero di immagini
+    """
+    
+    def __init__(self):
+        self.devices = {}
+        
+    def add(self, result):
+        """Aggiunge un risultato al gruppo del suo dispositivo"""
+        key, signature = device_signature(result)
+        device = self.devices.get(key)
+        if device is None:
+            device = self.devices[key] = {
+                'signature': signature, 'count': 0, 'files': [],
+                'first_capture': None, 'last_capture': None, 'gps_extent': None,
+            }
+        device['count'] += 1
+        device['files'].append(result.get('forensic', {}).get('file_info', {}).get('path'))
+        
+        exif = result.get('exif') or {}
+        capture_time = exif_datetime_to_iso(exif.get('DateTimeOriginal') or exif.get('DateTime') or '')
+        if capture_time:
+            if not device['first_capture'] or capture_time < device['first_capture']:
+                device['first_capture'] = capture_time
+            if not device['last_capture'] or capture_time > device['last_capture']:
+                device['last_capture'] = capture_time
+        
+        coordinates = result.get('coordinates')
+        if coordinates:
+            lat, lon = coordinates['lat'], coordinates['lon']
+            extent = device['gps_extent']
+            if extent is None:
+                device['gps_extent'] = {'min_lat': lat, 'max_lat': lat, 'min_lon': lon, 'max_lon': lon, 'points': 1}
+            else:
+                extent['min_lat'] = min(extent['min_lat'], lat)
+                extent['max_lat'] = max(extent['max_lat'], lat)
+                extent['min_lon'] = min(extent['min_lon'], lon)
+                extent['max_lon'] = max(extent['max_lon'], lon)
+                extent['points'] += 1
+        return result
+        
+    def summary(self):
+        """Riepilogo per dispositivo, dal gruppo più numeroso"""
+        return sorted(self.devices.values(), key=lambda device: -device['count'])
+        
+    @staticmethod
+    def describe(device):
+        """Righe di testo che descrivono un dispositivo del riepilogo"""
+        signature = device['signature']
+        name = device_name(signature['make'], signature['model'])
+        lines = [f"{name or 'Dispositivo sconosciuto'}: {device['count']:,} immagini\n"]
+        details = [f"{label}: {signature[field]}" for field, label in (
+            ('serial', "Seriale"), ('lens', "Obiettivo"),
+            ('quantization', "Tabelle quantizzazione"), ('makernote', "MakerNote"),
+        ) if signature[field]]
+        if details:
+            lines.append("  " + ", ".join(details) + "\n")
+        if device['first_capture']:
+            lines.append(f"  Periodo: {device['first_capture']} - {device['last_capture']}\n")
+        extent = device['gps_extent']
+        if extent:
+            lines.append(f"  Area GPS ({extent['points']:,} punti): lat {extent['min_lat']:.6f} / {extent['max_lat']:.6f}, "
+                         f"lon {extent['min_lon']:.6f} / {extent['max_lon']:.6f}\n")
+        return lines
+
+class TopCounter:
+    """
+    Valori più frequenti in memoria limitata (algoritmo Space-Saving): oltre capacity valori
+    distinti il meno frequente viene sostituito dal nuovo, che ne eredita il conteggio come
+    errore massimo. Il minimo si trova con un heap ricostruito quando le voci superate crescono.
+    """
+    
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.heap = []
+        
+    def add(self, value):
+        count = self.counts.get(value)
+        if count is None:
+            count = 0
+            if len(self.counts) >= self.capacity:
+                count = self.errors[value] = self.evict()
+        self.counts[value] = count + 1
+        heapq.heappush(self.heap, (count + 1, value))
+        if len(self.heap) > 2 * self.capacity:
+            self.heap = [(count, value) for value, count in self.counts.items()]
+            heapq.heapify(self.heap)
+            
+    def evict(self):
+        """Elimina il valore meno frequente e ne restituisce il conteggio"""
+        while True:
+            count, value = heapq.heappop(self.heap)
+            if self.counts.get(value) == count:
+                del self.counts[value]
+                self.errors.pop(value, None)
+                return count
+                
+    @property
+    def approximate(self):
+        return bool(self.errors)
+        
+    def most_common(self, n):
+        return sorted(self.counts.items(), key=lambda item: (-item[1], str(item[0])))[:n]
+
+class CaseStatistics:
+    """
+    Statistiche aggregate del caso calcolate mentre arrivano i risultati, senza conservarli:
+    contatori limitati (TopCounter) per dispositivi, software e luoghi, istogrammi a dimensione
+    fissa per ora e giorno della settimana di scatto e uno per mese (uno slot per mese coperto).
+    """
+    
+    WEEKDAYS = ("Lun", "Mar", "Mer", "Gio", "Ven", "Sab", "Dom")
+    
+    def __init__(self, config=None):
+        settings = (config or DEFAULT_CONFIG)['export']['case_statistics']
+        self.top_n = settings['top_n']
+        self.location_precision = settings['location_precision']
+        self.files = 0
+        self.bytes = 0
+        self.errors = 0
+        self.degraded = 0
+        self.geolocated = 0
+        self.dated = 0
+        self.first_capture = None
+        self.last_capture = None
+        self.by_hour = [0] * 24
+        self.by_weekday = [0] * 7
+        self.by_month = {}
+        self.gps_extent = None
+        self.levels = {}
+        self.devices = TopCounter(settings['counter_capacity'])
+        self.software = TopCounter(settings['counter_capacity'])
+        self.locations = TopCounter(settings['counter_capacity'])
+        
+    def add(self, result):
+        """Aggiorna le statistiche con un risultato"""
+        forensic = result.get('forensic') or {}
+        exif = result.get('exif') or {}
+        self.files += 1
+        self.bytes += (forensic.get('file_info') or {}).get('size') or 0
+        self.errors += bool(result.get('error'))
+        self.degraded += (result.get('evidence_check') or {}).get('status') == 'degraded'
+        
+        def text(tag):
+            return str(exif.get(tag) or '').strip().rstrip('\x00').strip()
+        
+        make, model = text('Make'), text('Model')
+        if make or model:
+            self.devices.add(device_name(make, model))
+        software = text('Software')
+        if software:
+            self.software.add(software)
+            
+        capture_time = exif_datetime_to_iso(exif.get('DateTimeOriginal') or exif.get('DateTime') or '')
+        if capture_time:
+            self.dated += 1
+            self.first_capture = min(self.first_capture or capture_time, capture_time)
+            self.last_capture = max(self.last_capture or capture_time, capture_time)
+            moment = datetime.fromisoformat(capture_time)
+            self.by_hour[moment.hour] += 1
+            self.by_weekday[moment.weekday()] += 1
+            month = capture_time[:7]
+            self.by_month[month] = self.by_month.get(month, 0) + 1
+            
+        coordinates = result.get('coordinates')
+        if coordinates and coordinates.get('lat') is not None:
+            self.geolocated += 1
+            lat, lon = coordinates['lat'], coordinates['lon']
+            extent = self.gps_extent or (lat, lon, lat, lon)
+            self.gps_extent = (min(extent[0], lat), min(extent[1], lon), max(extent[2], lat), max(extent[3], lon))
+            precision = self.location_precision
+            self.locations.add(f"{coordinates['lat']:.{precision}f},{coordinates['lon']:.{precision}f}")
+            
+        level = (forensic.get('manipulation') or {}).get('level')
+        if level:
+            self.levels[level] = self.levels.get(level, 0) + 1
+        return result
+        
+    @property
+    def gps_coverage(self):
+        return self.geolocated / self.files if self.files else 0.0
+        
+    def manipulation_levels(self):
+        """(livello, immagini) dal livello più frequente"""
+        return sorted(self.levels.items(), key=lambda item: (-item[1], item[0]))
+        
+    def to_dict(self):
+        """Statistiche in forma serializzabile per il report JSON"""
+        locations = []
+        for cell, count in self.locations.most_common(self.top_n):
+            lat, lon = cell.split(',')
+            locations.append({'lat': float(lat), 'lon': float(lon), 'count': count})
+        return {
+            'files': self.files,
+            'bytes': self.bytes,
+            'errors': self.errors,
+            'degraded': self.degraded,
+            'gps': {'geolocated': self.geolocated, 'coverage': round(self.gps_coverage, 4),
+                    'extent': list(self.gps_extent) if self.gps_extent else None,
+                    'top_locations': locations, 'location_precision': self.location_precision},
+            'capture_time': {
+                'dated': self.dated, 'first': self.first_capture, 'last': self.last_capture,
+                'by_hour': self.by_hour,
+                'by_weekday': dict(zip(self.WEEKDAYS, self.by_weekday)),
+                'by_month': dict(sorted(self.by_month.items())),
+            },
+            'devices': [{'device': device, 'count': count} for device, count in self.devices.most_common(self.top_n)],
+            'software': [{'software': name, 'count': count} for name, count in self.software.most_common(self.top_n)],
+            'manipulation_levels': dict(sorted(self.levels.items())),
+            # Conteggi approssimati (per eccesso) quando i valori distinti superano counter_capacity
+            'approximate': [name for name, counter in (('devices', self.devices), ('software', self.software),
+                                                       ('locations', self.locations)) if counter.approximate],
+        }
+        
+    def describe(self):
+        """Righe di testo del riepilogo, con istogrammi a barre"""
+        def bars(items):
+            peak = max([count for label, count in items] + [1])
+            return [f"  {label:>7} {count:>8,} {'█' * round(30 * count / peak)}\n" for label, count in items]
+        
+        lines = [
+            f"Immagini: {self.files:,} ({self.bytes / (1024 * 1024):,.1f} MB)",
+            f" - errori: {self.errors:,}, modalità ridotta: {self.degraded:,}\n" if self.errors or self.degraded else "\n",
+            f"Copertura GPS: {self.gps_coverage:.1%} ({self.geolocated:,} immagini geolocalizzate)\n",
+        ]
+        if self.dated:
+            lines.append(f"Periodo di scatto: {self.first_capture} - {self.last_capture} ({self.dated:,} immagini datate)\n")
+        for title, counter in (("DISPOSITIVI", self.devices), ("SOFTWARE", self.software), ("LUOGHI PRINCIPALI", self.locations)):
+            top = counter.most_common(self.top_n)
+            if top:
+                lines.append(f"\n{title}{' (conteggi approssimati)' if counter.approximate else ''}:\n")
+                lines.extend(f"  {count:>8,}  {value}\n" for value, count in top)
+        if self.levels:
+            lines.append("\nLIVELLI DI MANIPOLAZIONE:\n")
+            lines.extend(f"  {count:>8,}  {level}\n" for level, count in sorted(self.levels.items()))
+        if self.dated:
+            lines.append("\nSCATTI PER ORA:\n")
+            lines.extend(bars([(f"{hour:02d}:00", count) for hour, count in enumerate(self.by_hour)]))
+            lines.append("\nSCATTI PER GIORNO DELLA SETTIMANA:\n")
+            lines.extend(bars(list(zip(self.WEEKDAYS, self.by_weekday))))
+            lines.append("\nSCATTI PER MESE:\n")
+            lines.extend(bars(sorted(self.by_month.items())))
+        return lines
+
+# Versione del modello delle mappe HTML: cambiandola le mappe in cache vengono rigenerate
+CASE_MAP_VERSION = 1
+
+# Marker creati nel browser dalle righe [lat, lon, nome, data]; il testo non viene interpretato come HTML
+CASE_MAP_MARKER_CALLBACK = """
+var callback = function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    var popup = document.createElement('div');
+    popup.textContent = row[2];
+    if (row[3]) {
+        popup.appendChild(document.createElement('br'));
+        popup.appendChild(document.createTextNode(row[3]));
+    }
+    marker.bindPopup(popup);
+    return marker;
+};
+"""
+
+class CaseMapPoints:
+    """Punti GPS di un caso raccolti dai risultati, come righe compatte (lat, lon, nome, data)"""
+    
+    def __init__(self):
+        self.points = []
+        
+    def __len__(self):
+        return len(self.points)
+        
+    def add(self, result):
+        """Aggiunge il punto di un risultato geolocalizzato"""
+        coordinates = result.get('coordinates')
+        if not coordinates:
+            return
+        exif = result.get('exif') or {}
+        self.points.append((round(coordinates['lat'], 6), round(coordinates['lon'], 6),
+                            result.get('forensic', {}).get('file_info', {}).get('name') or '',
+                            exif_datetime_to_iso(exif.get('DateTimeOriginal') or exif.get('DateTime') or '')))
+        
+    def add_rows(self, rows):
+        """Aggiunge i punti delle righe restituite dalle query del database del caso"""
+        self.points.extend((round(row.latitude, 6), round(row.longitude, 6), row.name,
+                            row.capture_time) for row in rows if row.latitude is not None)
 
-def check_and_install_dependencies():
+def case_map_geojson(points):
+    """FeatureCollection GeoJSON dei punti (coordinate in ordine lon, lat)"""
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+         'properties': {'name': name, 'capture_time': capture_time}}
+        for lat, lon, name, capture_time in points
+    ]}
+
+def write_case_map(points, output_path, heatmap=False, title=''):
     """
-    Controlla e installa automaticamente le dipendenze necessarie
+    Mappa HTML di un insieme di punti con cluster disegnati nel browser e heatmap opzionale.
+    I punti sono incorporati una sola volta come array compatto (non un marker Folium per
+    punto) e salvati anche come GeoJSON accanto alla mappa. L'impronta di dati e opzioni è
+    scritta in testa al file: se non è cambiata la mappa esistente viene riusata.
+    Restituisce (percorso, riusata).
     """
-    required_packages = {
-        'Pillow': '>=10.0.0',
-        'requests': '>=2.31.0',
-        'folium': '>=0.14.0',
-        'tkintermapview': '>=1.29'
-    }
+    # Ordine stabile: la stessa serie di punti raccolta in ordine diverso (scansione asincrona) ha la stessa impronta
+    points = sorted(points, key=lambda point: point[:3])
+    rows = json.dumps(points, separators=(',', ':'), ensure_ascii=False)
+    digest = hashlib.sha256(f"{CASE_MAP_VERSION}|{heatmap}|{title}|{rows}".encode('utf-8')).hexdigest()
+    stamp = f"<!-- geoimage-map {digest} -->\n"
+    try:
+        with open(output_path, 'r', encoding='utf-8') as f:
+            if f.readline() == stamp:
+                return output_path, True
+    except OSError:
+        pass
     
-    missing_packages = []
-    outdated_packages = []
+    if points:
+        latitudes = [point[0] for point in points]
+        longitudes = [point[1] for point in points]
+        bounds = [[min(latitudes), min(longitudes)], [max(latitudes), max(longitudes)]]
+    else:
+        bounds = None
+    case_map = folium.Map(location=[0, 0], zoom_start=2, prefer_canvas=True)
+    if title:
+        case_map.get_root().title = title
+    FastMarkerCluster([list(point) for point in points], callback=CASE_MAP_MARKER_CALLBACK,
+                      name=f"Immagini ({len(points):,})").add_to(case_map)
+    if heatmap and points:
+        HeatMap([point[:2] for point in points], name="Heatmap", show=False, radius=15).add_to(case_map)
+    folium.LayerControl().add_to(case_map)
+    if bounds:
+        case_map.fit_bounds(bounds)
     
-    print("🔍 Controllo dipendenze...")
+    geojson_path = os.path.splitext(output_path)[0] + ".geojson"
+    with open(geojson_path, 'w', encoding='utf-8') as f:
+        json.dump(case_map_geojson(points), f, separators=(',', ':'), ensure_ascii=False)
+    temp_path = f"{output_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(stamp)
+        f.write(case_map.get_root().render())
+    os.replace(temp_path, output_path)
+    return output_path, False
+
+# Template predefiniti dei report (Jinja2); in export.reports.template_dir
+# file con lo stesso nome li sostituiscono
+REPORT_TEMPLATES = {
+    'image.txt': """=== REPORT COMPLETO ANALISI FORENSE ===
+
+Data/Ora Analisi: {{ info.timestamp }}
+Sistema Operativo: {{ info.system }}
+Analizzatore: {{ info.analyzer }}
+
+SOMMARIO FILE:
+Nome file: {{ file.name or 'N/A' }}
+Percorso: {{ file.path or 'N/A' }}
+Dimensione: {{ file.size if file.size is not none else 'N/A' }} bytes
+
+{% if hashes %}
+HASH CRITTOGRAFICI:
+{% for hash_type, hash_value in hashes.items() %}
+{{ hash_type }}: {{ hash_value }}
+{% endfor %}
+{% if hash_tree %}
+Merkle root ({{ '{:,}'.format(hash_tree.block_count) }} blocchi): {{ hash_tree.merkle_root }}
+{% endif %}
+
+{% endif %}
+{% if coordinates %}
+GEOLOCALIZZAZIONE:
+Latitudine: {{ coordinates.lat }}
+Longitudine: {{ coordinates.lon }}
+Indirizzo: {{ coordinates.address or 'N/A' }}
+
+{% endif %}
+{% if has_exif %}
+DISPOSITIVO DI ORIGINE:
+Marca: {{ device.make or 'N/A' }}
+Modello: {{ device.model or 'N/A' }}
+Software: {{ device.software or 'N/A' }}
+Data scatto: {{ device.capture_time or 'N/A' }}
+
+{% endif %}
+CONCLUSIONI ANALISI:
+{% for conclusion in conclusions %}
+- {{ conclusion }}
+{% endfor %}
+""",
+    'image.html': """<!DOCTYPE html>
+<html lang="it">
+<head>
+<meta charset="utf-8">
+<title>Report forense - {{ file.name }}</title>
+<style>
+body { font-family: 'Segoe UI', sans-serif; margin: 2em; color: #2c3e50; }
+table { border-collapse: collapse; margin-bottom: 1.5em; }
+th, td { border: 1px solid #bdc3c7; padding: 4px 10px; text-align: left; font-family: Consolas, monospace; }
+th { background: #ecf0f1; }
+</style>
+</head>
+<body>
+<h1>Report completo analisi forense</h1>
+<p>{{ info.analyzer }} - {{ info.timestamp }} - {{ info.system }}</p>
+<h2>Sommario file</h2>
+<table>
+<tr><th>Nome file</th><td>{{ file.name or 'N/A' }}</td></tr>
+<tr><th>Percorso</th><td>{{ file.path or 'N/A' }}</td></tr>
+<tr><th>Dimensione</th><td>{{ file.size if file.size is not none else 'N/A' }} bytes</td></tr>
+</table>
+{% if hashes %}
+<h2>Hash crittografici</h2>
+<table>
+{% for hash_type, hash_value in hashes.items() %}
+<tr><th>{{ hash_type }}</th><td>{{ hash_value }}</td></tr>
+{% endfor %}
+{% if hash_tree %}
+<tr><th>Merkle root ({{ '{:,}'.format(hash_tree.block_count) }} blocchi)</th><td>{{ hash_tree.merkle_root }}</td></tr>
+{% endif %}
+</table>
+{% endif %}
+{% if coordinates %}
+<h2>Geolocalizzazione</h2>
+<table>
+<tr><th>Latitudine</th><td>{{ coordinates.lat }}</td></tr>
+<tr><th>Longitudine</th><td>{{ coordinates.lon }}</td></tr>
+<tr><th>Indirizzo</th><td>{{ coordinates.address or 'N/A' }}</td></tr>
+</table>
+{% endif %}
+{% if has_exif %}
+<h2>Dispositivo di origine</h2>
+<table>
+<tr><th>Marca</th><td>{{ device.make or 'N/A' }}</td></tr>
+<tr><th>Modello</th><td>{{ device.model or 'N/A' }}</td></tr>
+<tr><th>Software</th><td>{{ device.software or 'N/A' }}</td></tr>
+<tr><th>Data scatto</th><td>{{ device.capture_time or 'N/A' }}</td></tr>
+</table>
+{% endif %}
+<h2>Conclusioni analisi</h2>
+<ul>
+{% for conclusion in conclusions %}
+<li>{{ conclusion }}</li>
+{% endfor %}
+</ul>
+</body>
+</html>
+""",
+    'case.txt': """=== RIEPILOGO DEL CASO ===
+
+Data/Ora Analisi: {{ info.timestamp }}
+Sistema Operativo: {{ info.system }}
+Analizzatore: {{ info.analyzer }}
+{% if info.scan_root %}
+Origine: {{ info.scan_root }}
+{% endif %}
+
+Immagini analizzate: {{ '{:,}'.format(statistics.files) }}
+Dimensione totale: {{ '{:,}'.format(statistics.bytes) }} bytes
+Immagini geolocalizzate: {{ '{:,}'.format(statistics.geolocated) }}
+Analisi in modalità ridotta: {{ '{:,}'.format(statistics.degraded) }}
+Errori: {{ '{:,}'.format(statistics.errors) }}
+{% if statistics.first_capture %}
+Periodo di scatto: {{ statistics.first_capture }} - {{ statistics.last_capture }}
+{% endif %}
+{% if statistics.gps_extent %}
+Area GPS: lat {{ '%.6f'|format(statistics.gps_extent[0]) }} / {{ '%.6f'|format(statistics.gps_extent[2]) }}, lon {{ '%.6f'|format(statistics.gps_extent[1]) }} / {{ '%.6f'|format(statistics.gps_extent[3]) }}
+{% endif %}
+
+DISPOSITIVI{% if statistics.devices.approximate %} (conteggi approssimati){% endif %}:
+{% for device, count in statistics.devices.most_common(statistics.top_n) %}
+{{ '%8s'|format('{:,}'.format(count)) }}  {{ device }}
+{% else %}
+Nessuna informazione sul dispositivo
+{% endfor %}
+
+INDICATORI DI MANIPOLAZIONE:
+{% for level, count in statistics.manipulation_levels() %}
+{{ '%8s'|format('{:,}'.format(count)) }}  {{ level }}
+{% else %}
+Non valutati
+{% endfor %}
+""",
+    'case.html': """<!DOCTYPE html>
+<html lang="it">
+<head>
+<meta charset="utf-8">
+<title>Riepilogo del caso</title>
+<style>
+body { font-family: 'Segoe UI', sans-serif; margin: 2em; color: #2c3e50; }
+table { border-collapse: collapse; margin-bottom: 1.5em; }
+th, td { border: 1px solid #bdc3c7; padding: 4px 10px; text-align: left; }
+th { background: #ecf0f1; }
+</style>
+</head>
+<body>
+<h1>Riepilogo del caso</h1>
+<p>{{ info.analyzer }} - {{ info.timestamp }} - {{ info.system }}{% if info.scan_root %} - {{ info.scan_root }}{% endif %}</p>
+<table>
+<tr><th>Immagini analizzate</th><td>{{ '{:,}'.format(statistics.files) }}</td></tr>
+<tr><th>Dimensione totale</th><td>{{ '{:,}'.format(statistics.bytes) }} bytes</td></tr>
+<tr><th>Immagini geolocalizzate</th><td>{{ '{:,}'.format(statistics.geolocated) }}</td></tr>
+<tr><th>Analisi in modalità ridotta</th><td>{{ '{:,}'.format(statistics.degraded) }}</td></tr>
+<tr><th>Errori</th><td>{{ '{:,}'.format(statistics.errors) }}</td></tr>
+{% if statistics.first_capture %}
+<tr><th>Periodo di scatto</th><td>{{ statistics.first_capture }} - {{ statistics.last_capture }}</td></tr>
+{% endif %}
+</table>
+<h2>Dispositivi{% if statistics.devices.approximate %} (conteggi approssimati){% endif %}</h2>
+<table>
+<tr><th>Dispositivo</th><th>Immagini</th></tr>
+{% for device, count in statistics.devices.most_common(statistics.top_n) %}
+<tr><td>{{ device }}</td><td>{{ '{:,}'.format(count) }}</td></tr>
+{% endfor %}
+</table>
+<h2>Indicatori di manipolazione</h2>
+<table>
+<tr><th>Livello</th><th>Immagini</th></tr>
+{% for level, count in statistics.manipulation_levels() %}
+<tr><td>{{ level }}</td><td>{{ '{:,}'.format(count) }}</td></tr>
+{% endfor %}
+</table>
+</body>
+</html>
+""",
+}
+
+# Colonne del CSV del caso: intestazione e valore dal contesto del report
+REPORT_CSV_COLUMNS = (
+    ('name', lambda context: context['file'].get('name')),
+    ('path', lambda context: context['file'].get('path')),
+    ('size', lambda context: context['file'].get('size')),
+    ('md5', lambda context: context['hashes'].get('MD5')),
+    ('sha256', lambda context: context['hashes'].get('SHA256')),
+    ('make', lambda context: context['device']['make']),
+    ('model', lambda context: context['device']['model']),
+    ('capture_time', lambda context: context['device']['capture_time']),
+    ('latitude', lambda context: context['coordinates'].get('lat')),
+    ('longitude', lambda context: context['coordinates'].get('lon')),
+    ('address', lambda context: context['coordinates'].get('address')),
+    ('manipulation_level', lambda context: (context['manipulation'] or {}).get('level')),
+    ('status', lambda context: context['evidence_check'].get('status') or ('error' if context['error'] else 'ok')),
+)
+
+def report_context(result):
+    """Dati di un risultato (stessa struttura di GeoImageAnalyzer.metadata) per i template dei report"""
+    forensic = result.get('forensic') or {}
+    exif = result.get('exif') or {}
+    coordinates = result.get('coordinates') or {}
+    evidence_check = result.get('evidence_check') or {}
+    manipulation = forensic.get('manipulation')
     
-    for package_name, version_req in required_packages.items():
-        try:
-            # Controlla se il pacchetto è installato
-            installed_version = version(package_name)
-            print(f"✅ {package_name} {installed_version} - OK")
-            
-            # Per semplicità, consideriamo tutti i pacchetti installati come aggiornati
-            # In futuro si potrebbe implementare un controllo più sofisticato delle versioni
-                
-        except PackageNotFoundError:
-            print(f"❌ {package_name} - Non installato")
-            missing_packages.append(package_name)
+    def text(tag):
+        value = exif.get(tag)
+        return str(value).strip('\x00 ') if value is not None else None
     
-    # Installa pacchetti mancanti o da aggiornare
-    packages_to_install = missing_packages + outdated_packages
+    device = {'make': text('Make'), 'model': text('Model'), 'software': text('Software'),
+              'capture_time': text('DateTimeOriginal')}
     
-    if packages_to_install:
-        print(f"\n📦 Installazione/aggiornamento di {len(packages_to_install)} pacchetti...")
-        print("⏳ Potrebbe richiedere alcuni minuti...")
+    conclusions = ["Analisi metadati EXIF completata"]
+    conclusions.append("Geolocalizzazione estratta con successo" if coordinates
+                       else "Nessuna informazione di geolocalizzazione trovata")
+    conclusions.append("Informazioni dispositivo identificate" if device['make'] or device['model']
+                       else "Informazioni dispositivo limitate")
+    conclusions.append("Hash crittografici calcolati per integrità")
+    carved_images = result.get('carved_images')
+    if carved_images:
+        conclusions.append(f"{len(carved_images)} immagini incorporate o concatenate individuate")
+    if manipulation:
+        conclusions.append(f"Indicatori di manipolazione: livello {manipulation['level']} "
+                           f"(punteggio {manipulation['score']}, {len(manipulation['indicators'])} indicatori)")
+    if evidence_check.get('status') == 'degraded':
+        conclusions.append(f"Analisi in modalità ridotta (solo metadati e hash): {evidence_check['reason']}")
+    if result.get('error'):
+        conclusions.append(f"Errore: {result['error']}")
+    
+    return {
+        'file': forensic.get('file_info') or {},
+        'hashes': forensic.get('hashes') or {},
+        'hash_tree': forensic.get('hash_tree'),
+        'coordinates': coordinates,
+        'has_exif': bool(exif),
+        'device': device,
+        'manipulation': manipulation,
+        'evidence_check': evidence_check,
+        'error': result.get('error'),
+        'conclusions': conclusions,
+    }
+
+class ReportRenderer:
+    """
+    Template dei report compilati da Jinja2 alla prima richiesta e poi riusati: rendere
+    lo stesso risultato con le stesse informazioni di analisi produce sempre lo stesso testo.
+    """
+    
+    def __init__(self, template_dir=''):
+        loaders = [DictLoader(REPORT_TEMPLATES)]
+        if template_dir:
+            loaders.insert(0, FileSystemLoader(template_dir))
+        self.environment = Environment(
+            loader=ChoiceLoader(loaders), autoescape=lambda name: bool(name) and name.endswith('.html'),
+            trim_blocks=True, lstrip_blocks=True, keep_trailing_newline=True, auto_reload=False,
+        )
         
-        for package in packages_to_install:
-            try:
-                print(f"📥 Installando {package}...")
-                subprocess.check_call([
-                    sys.executable, "-m", "pip", "install", "--upgrade", package
-                ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                print(f"✅ {package} installato/aggiornato con successo")
-            except subprocess.CalledProcessError as e:
-                print(f"❌ Errore nell'installazione di {package}: {e}")
-                print(f"💡 Prova manualmente: pip install --upgrade {package}")
-                return False
+    def render(self, name, **context):
+        return self.environment.get_template(name).render(**context)
+        
+    def render_image(self, result, report_format, info):
+        """Report di una singola immagine ('txt' o 'html')"""
+        return self.render(f"image.{report_format}", info=info, **report_context(result))
+
+class ReportWriter:
+    """
+    Report per immagine e del caso in un solo passaggio sui risultati: ogni risultato viene
+    reso nei formati richiesti (un file per immagine in TXT/HTML, una riga del CSV del caso).
+    Il riepilogo case.txt/case.html viene scritto alla chiusura dalle CaseStatistics del caso,
+    alimentate dal chiamante con gli stessi risultati.
+    """
     
-    print("\n Tutte le dipendenze sono aggiornate!")
-    return True
+    def __init__(self, output_dir, formats, info, statistics, renderer=None):
+        self.output_dir = output_dir
+        self.formats = [report_format for report_format in formats if report_format in ('txt', 'html')]
+        self.info = info
+        self.statistics = statistics
+        self.renderer = renderer or ReportRenderer()
+        self.count = 0
+        os.makedirs(output_dir, exist_ok=True)
+        self.csv_file = None
+        if 'csv' in formats:
+            self.csv_file = open(os.path.join(output_dir, 'case.csv'), 'w', encoding='utf-8', newline='')
+            self.csv_writer = csv.writer(self.csv_file)
+            self.csv_writer.writerow([header for header, value in REPORT_CSV_COLUMNS])
+            
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        
+    def add(self, result):
+        context = report_context(result)
+        self.count += 1
+        if self.formats:
+            name = re.sub(r'[^\w.-]+', '_', context['file'].get('name') or 'immagine')
+            base = os.path.join(self.output_dir, f"{self.count:06d}_{name}")
+            for report_format in self.formats:
+                with open(f"{base}.{report_format}", 'w', encoding='utf-8') as f:
+                    f.write(self.renderer.render(f"image.{report_format}", info=self.info, **context))
+        if self.csv_file:
+            self.csv_writer.writerow([value(context) for header, value in REPORT_CSV_COLUMNS])
+            
+    def close(self):
+        """Scrive il riepilogo del caso e chiude il CSV"""
+        if self.csv_file is None and not self.formats:
+            return
+        for report_format in self.formats:
+            with open(os.path.join(self.output_dir, f"case.{report_format}"), 'w', encoding='utf-8') as f:
+                f.write(self.renderer.render(f"case.{report_format}", info=self.info, statistics=self.statistics))
+        if self.csv_file:
+            self.csv_file.close()
+        self.csv_file = None
+        self.formats = []
 
-def show_dependency_status():
+def error_level_analysis(image, quality=90, amplification=0):
     """
-    Mostra lo stato delle dipendenze in una finestra di dialogo
+    Error Level Analysis: ricomprime l'immagine in JPEG alla qualità indicata e restituisce
+    (mappa ELA, statistiche) con la differenza per pixel amplificata. Con amplification=0 la
+    differenza massima viene portata a 255. I calcoli sono vettoriali su array NumPy.
     """
-    try:
-        import tkinter as tk
-        from tkinter import messagebox
+    image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    buffer.seek(0)
+    with Image.open(buffer) as recompressed:
+        recompressed_pixels = np.asarray(recompressed.convert('RGB'))
+    original_pixels = np.asarray(image)
+    
+    # |a - b| su uint8 senza conversioni a interi più larghi: max(a, b) - min(a, b)
+    difference = np.maximum(original_pixels, recompressed_pixels)
+    np.subtract(difference, np.minimum(original_pixels, recompressed_pixels), out=difference)
+    error_levels = np.maximum(np.maximum(difference[..., 0], difference[..., 1]), difference[..., 2])
+    
+    max_difference = int(error_levels.max())
+    mean_difference = float(error_levels.mean())
+    scale = amplification or 255.0 / max(max_difference, 1)
+    # Amplificazione con una tabella di 256 valori applicata da Pillow
+    lookup = [min(int(value * scale), 255) for value in range(256)]
+    ela_map = Image.fromarray(difference, 'RGB').point(lookup * 3)
+    
+    statistics = {
+        'quality': quality,
+        'width': image.size[0],
+        'height': image.size[1],
+        'max_difference': max_difference,
+        'mean_difference': mean_difference,
+        'scale': scale,
+        # Pixel con errore molto superiore alla media: zone da ispezionare
+        'high_error_fraction': float(np.count_nonzero(error_levels > max(4 * mean_difference, 1)) / error_levels.size),
+    }
+    return ela_map, statistics
+
+class VirtualImageList:
+    """
+    Lista immagini virtualizzata: nel Treeview esistono solo le righe visibili,
+    che vengono riutilizzate durante lo scorrimento aggiornandone i valori
+    """
+    
+    COLUMNS = (
+        ('name', 'File', 220),
+        ('capture_time', 'Data scatto', 150),
+        ('device', 'Dispositivo', 180),
+        ('gps', 'GPS', 60),
+        ('sha256', 'SHA256', 240),
+    )
+    
+    def __init__(self, parent, summary_loader, on_select, config):
+        self.summary_loader = summary_loader
+        self.on_select = on_select
+        self.config = config
+        self.rows = []
+        self.first = 0
+        self.selected_index = None
+        self.sort_column = None
+        self.sort_reverse = False
+        self.sort_generation = 0
+        self.thumbnails = OrderedDict()
+        self.pending_thumbnails = set()
+        self.refreshing = False
         
-        required_packages = ['Pillow', 'requests', 'folium', 'tkintermapview']
-        status_info = []
+        self.frame = ttk.Frame(parent)
         
-        for package in required_packages:
+        style = ttk.Style(parent)
+        style.configure('Gallery.Treeview', rowheight=THUMBNAIL_SIZE + 6)
+        
+        self.tree = ttk.Treeview(self.frame, columns=[c[0] for c in self.COLUMNS],
+                                 show='tree headings', selectmode='browse',
+                                 style='Gallery.Treeview')
+        self.tree.column('#0', width=THUMBNAIL_SIZE + 20, stretch=False)
+        for column, heading, width in self.COLUMNS:
+            self.tree.heading(column, text=heading,
+                              command=lambda c=column: self.sort_by(c))
+            self.tree.column(column, width=width, anchor=tk.W)
+        
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        # Immagine vuota per le righe senza miniatura ancora caricata
+        self.placeholder = tk.PhotoImage(width=THUMBNAIL_SIZE, height=THUMBNAIL_SIZE)
+        # Miniatura non disponibile (file illeggibile o oltre i limiti): riquadro grigio barrato
+        self.unavailable = tk.PhotoImage(width=THUMBNAIL_SIZE, height=THUMBNAIL_SIZE)
+        self.unavailable.put('#7f8c8d', to=(0, 0, THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        for offset in range(THUMBNAIL_SIZE - 1):
+            for x, y in ((offset, offset), (THUMBNAIL_SIZE - 2 - offset, offset)):
+                self.unavailable.put('#c0392b', to=(x, y, x + 2, y + 2))
+        
+        self.tree.bind('<Configure>', self.on_resize)
+        self.tree.bind('<<TreeviewSelect>>', self.on_tree_select)
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll_to(self.first - 3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll_to(self.first + 3))
+        
+    def set_rows(self, paths):
+        """Imposta l'elenco delle immagini da mostrare"""
+        self.rows = [{'path': path, 'name': os.path.basename(path)} for path in paths]
+        self.first = 0
+        self.selected_index = None
+        self.sort_column = None
+        # Un caricamento dei riepiloghi in corso per l'elenco precedente viene ignorato
+        self.sort_generation += 1
+        self.refresh()
+        
+    def add_rows(self, paths):
+        """Aggiunge immagini in coda all'elenco (es. nuove evidenze in una cartella monitorata)"""
+        self.rows.extend({'path': path, 'name': os.path.basename(path)} for path in paths)
+        self.refresh()
+        
+    def invalidate(self, image_path):
+        """Forza la rilettura del riepilogo di un'immagine (es. dopo una nuova analisi)"""
+        for row in self.rows:
+            if row['path'] == image_path:
+                row.pop('summary', None)
+        self.refresh()
+        
+    def visible_count(self):
+        """Numero di righe che entrano nell'area visibile del Treeview"""
+        row_height = THUMBNAIL_SIZE + 6
+        height = self.tree.winfo_height()
+        return max(1, (height - 25) // row_height) if height > 1 else 20
+        
+    def row_summary(self, row):
+        """Restituisce il riepilogo di una riga caricandolo solo al primo utilizzo"""
+        if 'summary' not in row:
+            row['summary'] = self.summary_loader(row['path'])
+        return row['summary']
+        
+    def refresh(self):
+        """Aggiorna le sole righe visibili a partire da self.first"""
+        self.refreshing = True
+        try:
+            count = min(self.visible_count(), max(0, len(self.rows) - self.first))
+            items = self.tree.get_children()
+            
+            # Crea o rimuove righe fisiche per adattarsi all'area visibile
+            for _ in range(len(items), count):
+                self.tree.insert('', tk.END, image=self.placeholder)
+            for item in items[count:]:
+                self.tree.delete(item)
+            items = self.tree.get_children()
+            
+            for offset, item in enumerate(items):
+                index = self.first + offset
+                row = self.rows[index]
+                summary = self.row_summary(row)
+                values = (row['name'], summary.get('capture_time', ''), summary.get('device', ''),
+                          '✅' if summary.get('gps') else '—', summary.get('sha256', ''))
+                self.tree.item(item, values=values, image=self.thumbnail_for(row['path']))
+                
+            # Mantiene la selezione sulla riga logica, non su quella fisica
+            if self.selected_index is not None and 0 <= self.selected_index - self.first < len(items):
+                self.tree.selection_set(items[self.selected_index - self.first])
+            else:
+                self.tree.selection_set(())
+            
+            total = len(self.rows)
+            if total:
+                self.scrollbar.set(self.first / total, (self.first + len(items)) / total)
+            else:
+                self.scrollbar.set(0, 1)
+        finally:
+            self.refreshing = False
+            
+    def scroll_to(self, first):
+        """Scorre la lista portando la riga indicata in cima"""
+        last_first = max(0, len(self.rows) - self.visible_count())
+        first = max(0, min(int(first), last_first))
+        if first != self.first:
+            self.first = first
+            self.refresh()
+            
+    def on_scrollbar(self, action, amount, unit=None):
+        """Gestisce i comandi della scrollbar (moveto/scroll)"""
+        if action == 'moveto':
+            self.scroll_to(float(amount) * len(self.rows))
+        elif action == 'scroll':
+            step = self.visible_count() if unit == 'pages' else 1
+            self.scroll_to(self.first + int(amount) * step)
+            
+    def on_mousewheel(self, event):
+        """Scorrimento con rotella del mouse"""
+        self.scroll_to(self.first - int(event.delta / 120) * 3)
+        return 'break'
+        
+    def on_resize(self, event):
+        """Ricalcola le righe visibili al ridimensionamento"""
+        self.refresh()
+        
+    def on_tree_select(self, event):
+        """Notifica la selezione della riga logica corrispondente"""
+        if self.refreshing:
+            return
+        selection = self.tree.selection()
+        if not selection:
+            return
+        index = self.first + self.tree.index(selection[0])
+        if index < len(self.rows) and index != self.selected_index:
+            self.selected_index = index
+            self.on_select(self.rows[index]['path'])
+            
+    def sort_by(self, column):
+        """
+        Ordina tutte le righe per la colonna indicata (click sull'intestazione).
+        Se mancano dei riepiloghi vengono letti in background e l'ordinamento avviene al termine.
+        """
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+        
+        missing = [row for row in self.rows if 'summary' not in row] if column != 'name' else []
+        if missing:
+            self.load_summaries(missing, column)
+        else:
+            self.apply_sort(column)
+            
+    def load_summaries(self, rows, column):
+        """Legge in un thread i riepiloghi mancanti; la lista resta utilizzabile nel frattempo"""
+        self.sort_generation += 1
+        generation = self.sort_generation
+        heading = dict((c[0], c[1]) for c in self.COLUMNS)[column]
+        self.tree.heading(column, text=f"{heading} ⏳")
+        results = queue.Queue()
+        
+        def load():
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results.put(list(executor.map(self.summary_loader, [row['path'] for row in rows])))
+        
+        def poll():
             try:
-                pkg_version = version(package)
-                status_info.append(f"✅ {package}: v{pkg_version}")
-            except PackageNotFoundError:
-                status_info.append(f"❌ {package}: Non installato")
+                summaries = results.get_nowait()
+            except queue.Empty:
+                self.tree.after(100, poll)
+                return
+            self.tree.heading(column, text=heading)
+            if generation != self.sort_generation:
+                return
+            for row, summary in zip(rows, summaries):
+                row.setdefault('summary', summary)
+            if self.sort_column == column:
+                self.apply_sort(column)
         
-        status_message = "Stato Dipendenze:\n\n" + "\n".join(status_info)
-        status_message += "\n\nTutte le dipendenze vengono controllate e aggiornate automaticamente all'avvio."
+        threading.Thread(target=load, daemon=True).start()
+        poll()
         
-        # Crea una finestra temporanea per il messaggio
-        temp_root = tk.Tk()
-        temp_root.withdraw()  # Nasconde la finestra principale
+    def apply_sort(self, column):
+        """Riordina le righe (riepiloghi già caricati) mantenendo la riga selezionata"""
+        selected_path = None
+        if self.selected_index is not None:
+            selected_path = self.rows[self.selected_index]['path']
         
-        messagebox.showinfo("Stato Dipendenze", status_message)
-        temp_root.destroy()
+        if column == 'name':
+            key = lambda row: row['name'].lower()
+        else:
+            key = lambda row: str(row.get('summary', {}).get(column, ''))
+        self.rows.sort(key=key, reverse=self.sort_reverse)
         
-    except Exception as e:
-        print(f"Errore nel mostrare lo stato delle dipendenze: {e}")
+        self.selected_index = None
+        if selected_path:
+            for index, row in enumerate(self.rows):
+                if row['path'] == selected_path:
+                    self.selected_index = index
+                    break
+        self.first = 0
+        self.refresh()
+        
+    def thumbnail_for(self, image_path):
+        """Restituisce la miniatura se già caricata, altrimenti ne pianifica il caricamento"""
+        if image_path in self.thumbnails:
+            self.thumbnails.move_to_end(image_path)
+            return self.thumbnails[image_path]
+        if image_path not in self.pending_thumbnails:
+            self.pending_thumbnails.add(image_path)
+            self.tree.after_idle(self.load_thumbnail, image_path)
+        return self.placeholder
+        
+    def load_thumbnail(self, image_path):
+        """Carica una miniatura se la riga è ancora visibile"""
+        self.pending_thumbnails.discard(image_path)
+        items = self.tree.get_children()
+        offsets = [offset for offset, row in enumerate(self.rows[self.first:self.first + len(items)])
+                   if row['path'] == image_path]
+        if not offsets:
+            return
+        
+        try:
+            # File troppo grandi o sospetti non vengono decodificati
+            if check_evidence_file(image_path, self.config)['status'] != 'ok':
+                raise ValueError("decodifica disabilitata dai limiti di analisi")
+            with format_handler_for_path(image_path).open_preview(image_path) as img:
+                # draft() permette ai JPEG di essere decodificati già ridotti
+                img.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+                img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+                photo = ImageTk.PhotoImage(img)
+        except Exception:
+            photo = self.unavailable
+        
+        self.thumbnails[image_path] = photo
+        while len(self.thumbnails) > THUMBNAIL_CACHE_SIZE:
+            self.thumbnails.popitem(last=False)
+        self.tree.item(items[offsets[0]], image=photo)
 
 class GeoImageAnalyzer:
     def __init__(self, root):
@@ -118,11 +4945,51 @@ class GeoImageAnalyzer:
         self.root.geometry("1200x800")
         self.root.configure(bg='#2c3e50')
         
+        # Configurazione (limiti di analisi, formati supportati)
+        self.config = load_config()
+        Image.MAX_IMAGE_PIXELS = self.config['analysis']['max_image_pixels']
+        
         # Variabili
         self.current_image_path = None
         self.metadata = {}
         self.current_map_file = None
         self.current_coordinates = None
+        self.evidence_check = None
+        
+        # Valori EXIF troncati in attesa di espansione e generazioni di rendering per widget
+        self.expandable_values = {}
+        self.render_generations = {}
+        
+        # Ultimo contenuto mostrato in ogni scheda e analisi già eseguite (per percorso)
+        self.rendered_segments = {}
+        self.analysis_cache = {}
+        
+        # Mappatura del file in analisi, condivisa da hash e Pillow durante analyze_image
+        self.current_evidence = None
+        
+        # Monitoraggio della cartella di deposito (thread di polling + coda verso la GUI)
+        self.watch_stop = None
+        self.watch_queue = queue.Queue()
+        
+        # Database del caso: se aperto, ogni analisi completata viene salvata
+        self.case_database = None
+        
+        # Copia ridotta dell'immagine decodificata per l'anteprima, riusata dall'ELA
+        self.working_image = None
+        self.ela_photo = None
+        self.ela_generation = 0
+        self.ela_queue = queue.Queue()
+        
+        # Archivio locale delle tile (MBTiles) usato dal widget mappa e dal download offline
+        self.tile_cache = open_tile_cache(self.config)
+        self.prefetch_queue = queue.Queue()
+        
+        # Template dei report, compilati una volta e condivisi da scheda Report ed esportazioni
+        self.report_renderer = ReportRenderer(self.config['export']['reports']['template_dir'])
+        
+        # Statistiche aggregate dell'ultima cartella, archivio o carving (scheda Riepilogo)
+        self.case_statistics = None
+        self.case_statistics_source = None
         
         self.setup_ui()
         
@@ -135,6 +5002,12 @@ class GeoImageAnalyzer:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Seleziona Immagine", command=self.select_image)
+        file_menu.add_command(label="Apri Cartella", command=self.open_folder)
+        file_menu.add_command(label="Monitora Cartella (drop folder)", command=self.toggle_watch_folder)
+        file_menu.add_command(label="Analizza Archivio (ZIP/TAR)", command=self.analyze_archive_file)
+        file_menu.add_command(label="Carving Immagini (file/immagine disco)", command=self.carve_file)
+        file_menu.add_separator()
+        file_menu.add_command(label="Apri Database del Caso", command=self.open_case_database)
         file_menu.add_separator()
         file_menu.add_command(label="Esci", command=self.root.quit)
         
@@ -143,6 +5016,12 @@ class GeoImageAnalyzer:
         menubar.add_cascade(label="Strumenti", menu=tools_menu)
         tools_menu.add_command(label="Stato Dipendenze", command=show_dependency_status)
         tools_menu.add_command(label="Aggiorna Dipendenze", command=self.update_dependencies)
+        tools_menu.add_separator()
+        tools_menu.add_command(label="Verifica Integrità (Hash Tree)", command=self.verify_integrity)
+        tools_menu.add_command(label="Raggruppa per Dispositivo", command=self.group_by_device)
+        tools_menu.add_command(label="Esporta Copie Anonimizzate", command=self.export_redacted_copies)
+        tools_menu.add_command(label="Scarica Mappe Offline", command=self.prefetch_map_tiles)
+        tools_menu.add_command(label="Mappa del Caso", command=self.open_case_map)
         
         # Menu Aiuto
         help_menu = tk.Menu(menubar, tearoff=0)
@@ -230,7 +5109,9 @@ class GeoImageAnalyzer:
         analyze_btn.grid(row=0, column=2)
         
         # Informazioni rapide
-        info_label = tk.Label(file_frame, text="Supported: JPG, PNG, TIFF, BMP, GIF | Max size: 100MB", 
+        supported = ", ".join(fmt.lstrip('.').upper() for fmt in self.config['analysis']['supported_formats'])
+        info_label = tk.Label(file_frame, text=f"Supported: {supported} | Max size: "
+                                               f"{self.config['analysis']['max_file_size_mb']}MB", 
                              font=('Segoe UI', 8), fg='#7f8c8d')
         info_label.grid(row=1, column=0, columnspan=3, pady=(10, 0))
         
@@ -332,9 +5213,9 @@ class GeoImageAnalyzer:
         
         # Widget mappa (se tkintermapview è disponibile)
         if tkintermapview:
-            self.map_widget = tkintermapview.TkinterMapView(self.map_frame, 
-                                                           width=800, height=500, 
-                                                           corner_radius=0)
+            self.map_widget = create_map_widget(self.map_frame, self.tile_cache,
+                                                width=800, height=500,
+                                                corner_radius=0)
             self.map_widget.pack(fill=tk.BOTH, expand=True, padx=15, pady=15)
         else:
             # Fallback: area di testo per informazioni mappa
@@ -366,62 +5247,409 @@ class GeoImageAnalyzer:
                                                        insertbackground='#ecf0f1')
         self.forensic_text.pack(fill=tk.BOTH, expand=True, padx=15, pady=15)
         
-        # Tab Report
-        self.report_frame = ttk.Frame(self.notebook)
-        self.notebook.add(self.report_frame, text="📋 Complete Report")
+        # Tab Error Level Analysis
+        self.ela_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.ela_frame, text="🔍 Error Level Analysis")
+        
+        ela_header = tk.Frame(self.ela_frame, bg='#34495e', height=40)
+        ela_header.pack(fill=tk.X, padx=15, pady=(15, 0))
+        ela_header.pack_propagate(False)
+        
+        ela_title = tk.Label(ela_header, text="🔍 Error Level Analysis (JPEG recompression)", 
+                            font=('Segoe UI', 12, 'bold'), fg='#ecf0f1', bg='#34495e')
+        ela_title.pack(side=tk.LEFT, padx=15, pady=10)
+        
+        ela_button_frame = ttk.Frame(self.ela_frame)
+        ela_button_frame.pack(fill=tk.X, padx=15, pady=5)
+        
+        ttk.Label(ela_button_frame, text="Quality:").pack(side=tk.LEFT)
+        self.ela_quality = tk.IntVar(value=self.config['analysis']['ela']['quality'])
+        ttk.Spinbox(ela_button_frame, from_=50, to=100, width=5,
+                    textvariable=self.ela_quality).pack(side=tk.LEFT, padx=(5, 10))
+        ttk.Button(ela_button_frame, text="▶️ Compute ELA", 
+                  command=self.compute_ela).pack(side=tk.LEFT, padx=(0, 10))
+        self.ela_info_label = ttk.Label(ela_button_frame, text="")
+        self.ela_info_label.pack(side=tk.LEFT)
+        
+        self.ela_label = tk.Label(self.ela_frame, text="Load an image and press 'Compute ELA'", 
+                                 bg='#34495e', fg='#ecf0f1', relief='sunken', bd=2,
+                                 font=('Segoe UI', 10), justify=tk.CENTER)
+        self.ela_label.pack(fill=tk.BOTH, expand=True, padx=15, pady=15)
+        
+        # Tab Report
+        self.report_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.report_frame, text="📋 Complete Report")
+        
+        # Header per Report
+        report_header = tk.Frame(self.report_frame, bg='#34495e', height=40)
+        report_header.pack(fill=tk.X, padx=15, pady=(15, 0))
+        report_header.pack_propagate(False)
+        
+        report_title = tk.Label(report_header, text="📋 Comprehensive Evidence Analysis", 
+                               font=('Segoe UI', 12, 'bold'), fg='#ecf0f1', bg='#34495e')
+        report_title.pack(side=tk.LEFT, padx=15, pady=10)
+        
+        report_button_frame = ttk.Frame(self.report_frame)
+        report_button_frame.pack(fill=tk.X, padx=15, pady=5)
+        
+        ttk.Button(report_button_frame, text="📄 Export JSON Report", 
+                  command=self.export_json_report).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(report_button_frame, text="📝 Export TXT Report", 
+                  command=self.export_txt_report).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(report_button_frame, text="🌐 Export HTML Report",
+                  command=self.export_html_report).pack(side=tk.LEFT)
+        
+        self.report_text = scrolledtext.ScrolledText(self.report_frame, wrap=tk.WORD, 
+                                                     width=80, height=18,
+                                                     bg='#2c3e50', fg='#ecf0f1',
+                                                     font=('Consolas', 11),
+                                                     insertbackground='#ecf0f1')
+        self.report_text.pack(fill=tk.BOTH, expand=True, padx=15, pady=15)
+        
+        # Tab Browser evidenze
+        self.browser_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.browser_frame, text="🗂️ Evidence Browser")
+        
+        # Header per Browser
+        browser_header = tk.Frame(self.browser_frame, bg='#34495e', height=40)
+        browser_header.pack(fill=tk.X, padx=15, pady=(15, 0))
+        browser_header.pack_propagate(False)
+        
+        browser_title = tk.Label(browser_header, text="🗂️ Evidence Folder Browser", 
+                                 font=('Segoe UI', 12, 'bold'), fg='#ecf0f1', bg='#34495e')
+        browser_title.pack(side=tk.LEFT, padx=15, pady=10)
+        
+        browser_controls = ttk.Frame(self.browser_frame)
+        browser_controls.pack(fill=tk.X, padx=15, pady=5)
+        
+        ttk.Button(browser_controls, text="📂 Open Folder", 
+                  command=self.open_folder).pack(side=tk.LEFT, padx=(0, 10))
+        self.browser_count_label = ttk.Label(browser_controls, text="Nessuna cartella aperta")
+        self.browser_count_label.pack(side=tk.LEFT)
+        
+        self.image_browser = VirtualImageList(self.browser_frame, self.browser_summary,
+                                              self.on_browser_select, self.config)
+        self.image_browser.frame.pack(fill=tk.BOTH, expand=True, padx=15, pady=15)
+        
+        # Tab Riepilogo del caso
+        self.summary_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.summary_frame, text="📈 Riepilogo")
+        
+        summary_header = tk.Frame(self.summary_frame, bg='#34495e', height=40)
+        summary_header.pack(fill=tk.X, padx=15, pady=(15, 0))
+        summary_header.pack_propagate(False)
+        
+        summary_title = tk.Label(summary_header, text="📈 Case Summary Statistics",
+                                 font=('Segoe UI', 12, 'bold'), fg='#ecf0f1', bg='#34495e')
+        summary_title.pack(side=tk.LEFT, padx=15, pady=10)
+        
+        summary_button_frame = ttk.Frame(self.summary_frame)
+        summary_button_frame.pack(fill=tk.X, padx=15, pady=5)
+        
+        ttk.Button(summary_button_frame, text="▶️ Compute Folder Summary",
+                  command=self.compute_case_statistics).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(summary_button_frame, text="📄 Export JSON",
+                  command=self.export_case_statistics).pack(side=tk.LEFT)
+        
+        self.summary_text = scrolledtext.ScrolledText(self.summary_frame, wrap=tk.NONE,
+                                                      width=80, height=18,
+                                                      bg='#2c3e50', fg='#ecf0f1',
+                                                      font=('Consolas', 11),
+                                                      insertbackground='#ecf0f1')
+        self.summary_text.pack(fill=tk.BOTH, expand=True, padx=15, pady=15)
+        
+    def select_image(self):
+        """Seleziona un'immagine da analizzare"""
+        patterns = " ".join(f"*{fmt}" for fmt in self.config['analysis']['supported_formats'])
+        file_types = [
+            ('Immagini', patterns),
+            ('JPEG', '*.jpg *.jpeg'),
+            ('PNG', '*.png'),
+            ('TIFF', '*.tiff *.tif'),
+            ('WebP', '*.webp'),
+            ('HEIC/HEIF', '*.heic *.heif'),
+            ('RAW', ' '.join(f"*{ext}" for ext in RAW_EXTENSIONS)),
+            ('Tutti i file', '*.*')
+        ]
+        
+        filename = filedialog.askopenfilename(
+            title="Seleziona un'immagine da analizzare",
+            filetypes=file_types
+        )
+        
+        if filename:
+            self.load_evidence(filename)
+            
+    def check_evidence(self, image_path):
+        """Controlla i limiti di analisi; con lo sniffing attivo conta solo la firma del file"""
+        sniff = self.config['analysis']['scanner']['sniff_unknown_extensions']
+        return check_evidence_file(image_path, self.config, require_extension=not sniff)
+        
+    def load_evidence(self, image_path, select_tab=True):
+        """Verifica i limiti di analisi e carica l'evidenza (anteprima solo se decodificabile)"""
+        try:
+            check = self.check_evidence(image_path)
+        except OSError as e:
+            messagebox.showerror("Evidence Error", f"Impossibile leggere il file: {str(e)}")
+            return False
+        
+        if check['status'] == 'rejected':
+            messagebox.showerror("Unsupported Evidence", check['reason'])
+            return False
+        
+        self.current_image_path = image_path
+        self.file_path_var.set(image_path)
+        self.clear_results()
+        self.evidence_check = check
+        
+        if check['status'] == 'degraded':
+            # Nessuna decodifica: l'analisi sarà limitata a metadati e hash
+            self.image_label.config(image='', text=f"Anteprima disabilitata\n\n{check['reason']}")
+            self.render_text(self.info_text, [
+                "=== MODALITÀ RIDOTTA ===\n\n",
+                f"📁 Nome File: {os.path.basename(image_path)}\n",
+                f"📂 Percorso: {image_path}\n",
+                f"💾 Dimensione File: {check['size']:,} bytes\n",
+                f"🖼️ Formato: {check['format']}\n\n",
+                f"⚠️ {check['reason']}\n\n",
+                "L'analisi estrarrà solo metadati e hash senza decodificare l'immagine.\n",
+            ])
+            self.status_label.config(text="⚠️ Degraded mode - metadata and hash only")
+            if select_tab:
+                self.notebook.select(self.preview_frame)
+        else:
+            self.load_image_preview(image_path, select_tab=select_tab)
+        return True
+    
+    def open_folder(self):
+        """Apre una cartella di evidenze nel browser"""
+        folder = filedialog.askdirectory(title="Seleziona una cartella di evidenze")
+        if not folder:
+            return
+        
+        if not os.path.isdir(folder):
+            messagebox.showerror("Errore", f"Impossibile leggere la cartella: {folder}")
+            return
+        
+        self.status_label.config(text="📂 Scanning folder...")
+        self.root.update()
+        unreadable = []
+        paths = sorted(path for path, stats in scan_directory(folder, self.config,
+                                                              error_callback=lambda path, error: unreadable.append(path)))
+        
+        self.image_browser.set_rows(paths)
+        self.browser_count_label.config(text=f"{len(paths):,} immagini in {folder}"
+                                             + (f" ({len(unreadable):,} non leggibili)" if unreadable else ""))
+        self.status_label.config(text=f"📂 {len(paths):,} images found")
+        self.notebook.select(self.browser_frame)
+        
+    def toggle_watch_folder(self):
+        """Avvia o ferma il monitoraggio di una cartella di deposito"""
+        if self.watch_stop:
+            self.watch_stop.set()
+            self.watch_stop = None
+            self.status_label.config(text="⏹️ Drop folder monitoring stopped")
+            return
+        
+        folder = filedialog.askdirectory(title="Seleziona la cartella da monitorare")
+        if not folder:
+            return
+        
+        self.image_browser.set_rows([])
+        self.browser_count_label.config(text=f"Monitoraggio di {folder}")
+        self.watch_stop = threading.Event()
+        threading.Thread(
+            target=watch_directory,
+            args=(folder, self.config, lambda path, stats: self.watch_queue.put(path), self.watch_stop),
+            daemon=True
+        ).start()
+        self.status_label.config(text=f"👁️ Monitoring drop folder: {folder}")
+        self.notebook.select(self.browser_frame)
+        self.poll_watch_queue()
+        
+    def poll_watch_queue(self):
+        """Trasferisce nel browser le nuove evidenze trovate dal thread di monitoraggio"""
+        paths = []
+        while True:
+            try:
+                paths.append(self.watch_queue.get_nowait())
+            except queue.Empty:
+                break
+        if paths:
+            self.image_browser.add_rows(paths)
+            self.browser_count_label.config(text=f"{len(self.image_browser.rows):,} immagini (monitoraggio attivo)")
+            self.status_label.config(text=f"📥 New evidence: {os.path.basename(paths[-1])}")
+        if self.watch_stop:
+            self.root.after(500, self.poll_watch_queue)
+        
+    def analyze_archive_file(self):
+        """Analizza le immagini di un archivio ZIP/TAR senza estrarlo e salva il report JSON"""
+        archive_path = filedialog.askopenfilename(
+            title="Seleziona un archivio di evidenze",
+            filetypes=[("Archivi", " ".join(f"*{ext}" for ext in ARCHIVE_EXTENSIONS)),
+                       ("Tutti i file", "*.*")]
+        )
+        if not archive_path:
+            return
+        output_path = filedialog.asksaveasfilename(
+            title="Salva Report JSON dell'archivio",
+            defaultextension=".json",
+            initialfile=os.path.basename(archive_path) + ".analysis.json",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+        )
+        if not output_path:
+            return
+        
+        def show_progress(count, member_path):
+            self.status_label.config(text=f"🗜️ [{count:,}] {member_path}")
+            self.root.update()
+        
+        statistics = CaseStatistics(self.config)
+        try:
+            count = write_json_results(
+                output_path,
+                collect_results(analyze_archive(archive_path, self.config, show_progress), [statistics.add]),
+                {
+                    'timestamp': datetime.now().isoformat(),
+                    'analyzer': 'GeoImage Analyzer v1.0',
+                    'system': f"{platform.system()} {platform.release()}",
+                    'archive': archive_path,
+                },
+                statistics, exif_normalizer(self.config)
+            )
+        except Exception as e:
+            self.status_label.config(text="❌ Archive analysis failed")
+            messagebox.showerror("Errore", f"Errore nell'analisi dell'archivio: {str(e)}")
+            return
+        
+        self.show_case_statistics(statistics, archive_path)
+        self.status_label.config(text=f"✅ Archive analyzed: {count:,} images")
+        messagebox.showinfo("Successo", f"Analizzate {count:,} immagini dall'archivio.\n\nReport JSON salvato: {output_path}")
+        
+    def carve_file(self):
+        """Esegue il carving delle immagini da un file qualsiasi (es. immagine disco) e salva il report JSON"""
+        source_path = filedialog.askopenfilename(title="Seleziona il file o l'immagine disco")
+        if not source_path:
+            return
+        output_path = filedialog.asksaveasfilename(
+            title="Salva Report JSON del carving",
+            defaultextension=".json",
+            initialfile=os.path.basename(source_path) + ".carving.json",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+        )
+        if not output_path:
+            return
+        
+        self.status_label.config(text="🧩 Carving embedded images...")
+        self.root.update()
+        try:
+            with EvidenceFile(source_path) as evidence:
+                results = analyze_carved_images(evidence, self.config, include_primary=True)
+            statistics = CaseStatistics(self.config)
+            count = write_json_results(output_path, collect_results(results, [statistics.add]), {
+                'timestamp': datetime.now().isoformat(),
+                'analyzer': 'GeoImage Analyzer v1.0',
+                'system': f"{platform.system()} {platform.release()}",
+                'carved_from': source_path,
+            }, statistics, exif_normalizer(self.config))
+        except Exception as e:
+            self.status_label.config(text="❌ Carving failed")
+            messagebox.showerror("Errore", f"Errore nel carving: {str(e)}")
+            return
         
-        # Header per Report
-        report_header = tk.Frame(self.report_frame, bg='#34495e', height=40)
-        report_header.pack(fill=tk.X, padx=15, pady=(15, 0))
-        report_header.pack_propagate(False)
+        self.show_case_statistics(statistics, source_path)
+        self.status_label.config(text=f"✅ Carving completed: {count:,} images")
+        messagebox.showinfo("Successo", f"Individuate {count:,} immagini.\n\nReport JSON salvato: {output_path}")
         
-        report_title = tk.Label(report_header, text="📋 Comprehensive Evidence Analysis", 
-                               font=('Segoe UI', 12, 'bold'), fg='#ecf0f1', bg='#34495e')
-        report_title.pack(side=tk.LEFT, padx=15, pady=10)
+    def browser_summary(self, image_path):
+        """Riepilogo di una riga del browser: dall'analisi in cache se presente, altrimenti dall'header EXIF"""
+        cached = self.get_cached_analysis(image_path)
+        if cached:
+            return cached['summary']
+        return read_image_summary(image_path)
         
-        report_button_frame = ttk.Frame(self.report_frame)
-        report_button_frame.pack(fill=tk.X, padx=15, pady=5)
+    def on_browser_select(self, image_path):
+        """Carica l'immagine selezionata nel browser, riusando l'analisi in cache"""
+        if self.get_cached_analysis(image_path):
+            self.restore_cached_analysis(image_path)
+            self.status_label.config(text="📂 Cached analysis loaded")
+        elif self.load_evidence(image_path, select_tab=False):
+            if self.evidence_check['status'] == 'ok':
+                self.status_label.config(text="🔍 Evidence loaded - not analyzed yet")
         
-        ttk.Button(report_button_frame, text="📄 Export JSON Report", 
-                  command=self.export_json_report).pack(side=tk.LEFT, padx=(0, 10))
-        ttk.Button(report_button_frame, text="📝 Export TXT Report", 
-                  command=self.export_txt_report).pack(side=tk.LEFT)
+    def get_cached_analysis(self, image_path):
+        """Restituisce l'analisi in cache se il file non è cambiato dopo l'analisi"""
+        entry = self.analysis_cache.get(image_path)
+        if entry is None:
+            return None
+        try:
+            stats = os.stat(image_path)
+        except OSError:
+            return None
+        if (stats.st_size, stats.st_mtime) != entry['stat']:
+            del self.analysis_cache[image_path]
+            return None
+        return entry
         
-        self.report_text = scrolledtext.ScrolledText(self.report_frame, wrap=tk.WORD, 
-                                                     width=80, height=18,
-                                                     bg='#2c3e50', fg='#ecf0f1',
-                                                     font=('Consolas', 11),
-                                                     insertbackground='#ecf0f1')
-        self.report_text.pack(fill=tk.BOTH, expand=True, padx=15, pady=15)
+    def cache_current_analysis(self):
+        """Salva in cache i risultati e il contenuto delle schede dell'immagine corrente"""
+        stats = os.stat(self.current_image_path)
+        exif_data = self.metadata.get('exif', {})
+        make = str(exif_data.get('Make', '')).strip()
+        model = str(exif_data.get('Model', '')).strip()
         
-    def select_image(self):
-        """Seleziona un'immagine da analizzare"""
-        file_types = [
-            ('Immagini', '*.jpg *.jpeg *.png *.tiff *.tif *.bmp *.gif'),
-            ('JPEG', '*.jpg *.jpeg'),
-            ('PNG', '*.png'),
-            ('TIFF', '*.tiff *.tif'),
-            ('Tutti i file', '*.*')
-        ]
+        self.analysis_cache[self.current_image_path] = {
+            'stat': (stats.st_size, stats.st_mtime),
+            'metadata': self.metadata,
+            'coordinates': self.current_coordinates,
+            'tabs': dict(self.rendered_segments),
+            'expandable': dict(self.expandable_values),
+            'summary': {
+                'capture_time': str(exif_data.get('DateTimeOriginal', exif_data.get('DateTime', ''))),
+                'device': device_name(make, model),
+                'gps': bool(self.metadata.get('coordinates')),
+                'sha256': self.metadata.get('forensic', {}).get('hashes', {}).get('SHA256', ''),
+            },
+        }
         
-        filename = filedialog.askopenfilename(
-            title="Seleziona un'immagine da analizzare",
-            filetypes=file_types
-        )
+    def restore_cached_analysis(self, image_path):
+        """Ripristina schede, metadati e mappa da un'analisi in cache senza rieseguirla"""
+        entry = self.analysis_cache[image_path]
+        if not self.load_evidence(image_path, select_tab=False):
+            return
         
-        if filename:
-            self.current_image_path = filename
-            self.file_path_var.set(filename)
-            self.clear_results()
-            self.load_image_preview(filename)
+        self.metadata = entry['metadata']
+        self.expandable_values = dict(entry['expandable'])
+        for widget, segments in entry['tabs'].items():
+            if widget is not self.info_text:
+                self.render_text(widget, segments)
+        
+        if entry['coordinates']:
+            self.current_coordinates = entry['coordinates']
+            lat, lon = entry['coordinates']
+            self.update_map_display(lat, lon, self.metadata.get('coordinates', {}).get('address'))
     
-    def load_image_preview(self, image_path):
+    def load_image_preview(self, image_path, select_tab=True):
         """Carica e mostra l'anteprima dell'immagine"""
         try:
-            # Apre l'immagine
-            with Image.open(image_path) as img:
+            # Apre l'immagine (per i RAW l'anteprima JPEG incorporata)
+            with format_handler_for_path(image_path).open_preview(image_path) as img:
                 # Ottiene le dimensioni originali
                 original_width, original_height = img.size
+                image_format, image_mode = img.format, img.mode
+                
+                # Copia di lavoro ridotta: per i JPEG la riduzione avviene già in decodifica (draft)
+                max_dimension = self.config['analysis']['ela']['max_dimension']
+                if max_dimension:
+                    img.draft('RGB', (max_dimension, max_dimension))
+                working_image = img.convert('RGB')
+                if max_dimension:
+                    working_image.thumbnail((max_dimension, max_dimension), Image.Resampling.BILINEAR)
+                self.working_image = working_image
+                self.ela_generation += 1
+                self.ela_photo = None
+                self.ela_label.config(image='', text="Press 'Compute ELA' to analyze this image")
+                self.ela_info_label.config(text="")
                 
                 # Calcola le dimensioni per l'anteprima (max 400x400 mantenendo proporzioni)
                 max_size = 400
@@ -432,8 +5660,8 @@ class GeoImageAnalyzer:
                     new_height = max_size
                     new_width = int((original_width * max_size) / original_height)
                 
-                # Ridimensiona l'immagine
-                img_resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                # Ridimensiona la copia di lavoro
+                img_resized = working_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
                 
                 # Converte per Tkinter
                 self.current_photo = ImageTk.PhotoImage(img_resized)
@@ -442,16 +5670,82 @@ class GeoImageAnalyzer:
                 self.image_label.config(image=self.current_photo, text="")
                 
                 # Aggiorna le informazioni di base
-                self.update_basic_info(image_path, original_width, original_height)
+                self.update_basic_info(image_path, original_width, original_height,
+                                       image_format, image_mode)
                 
                 # Seleziona automaticamente la tab anteprima
-                self.notebook.select(self.preview_frame)
+                if select_tab:
+                    self.notebook.select(self.preview_frame)
                 
         except Exception as e:
             self.image_label.config(image='', text=f"Errore nel caricamento: {str(e)}")
             messagebox.showerror("Errore", f"Impossibile caricare l'immagine: {str(e)}")
     
-    def update_basic_info(self, image_path, width, height):
+    def compute_ela(self):
+        """Avvia l'Error Level Analysis della copia di lavoro in un thread separato"""
+        if np is None:
+            messagebox.showwarning("Attenzione", "Installare numpy per l'Error Level Analysis:\npip install numpy")
+            return
+        if self.working_image is None:
+            messagebox.showwarning("Attenzione", "Nessuna immagine caricata.")
+            return
+        
+        try:
+            quality = min(max(int(self.ela_quality.get()), 1), 100)
+        except (tk.TclError, ValueError):
+            quality = self.config['analysis']['ela']['quality']
+        
+        # Un nuovo calcolo (o una nuova immagine) rende obsoleti i risultati ancora in arrivo
+        self.ela_generation += 1
+        generation = self.ela_generation
+        image = self.working_image
+        amplification = self.config['analysis']['ela']['amplification']
+        
+        def worker():
+            start = time.perf_counter()
+            try:
+                ela_map, statistics = error_level_analysis(image, quality, amplification)
+                statistics['seconds'] = time.perf_counter() - start
+                self.ela_queue.put((generation, ela_map, statistics, None))
+            except Exception as e:
+                self.ela_queue.put((generation, None, None, e))
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.ela_info_label.config(text=f"⏳ Computing ELA at quality {quality}...")
+        self.status_label.config(text="🔍 Computing Error Level Analysis...")
+        self.root.after(50, self.poll_ela_queue)
+        
+    def poll_ela_queue(self):
+        """Mostra il risultato dell'ELA quando il thread di calcolo ha terminato"""
+        try:
+            generation, ela_map, statistics, error = self.ela_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(50, self.poll_ela_queue)
+            return
+        if generation != self.ela_generation:
+            # Risultato di un calcolo superato: si attende quello corrente
+            self.root.after(50, self.poll_ela_queue)
+            return
+        
+        if error:
+            self.ela_label.config(image='', text=f"Errore nell'ELA: {error}")
+            self.ela_info_label.config(text="")
+            self.status_label.config(text="❌ Error Level Analysis failed")
+            return
+        
+        ela_map.thumbnail((800, 600), Image.Resampling.LANCZOS)
+        self.ela_photo = ImageTk.PhotoImage(ela_map)
+        self.ela_label.config(image=self.ela_photo, text="")
+        self.ela_info_label.config(
+            text=f"{statistics['width']}x{statistics['height']} px, max diff {statistics['max_difference']}, "
+                 f"mean {statistics['mean_difference']:.2f}, high-error pixels {statistics['high_error_fraction']:.2%}, "
+                 f"{statistics['seconds']:.2f}s"
+        )
+        if self.metadata:
+            self.metadata['ela'] = statistics
+        self.status_label.config(text="✅ Error Level Analysis completed")
+        
+    def update_basic_info(self, image_path, width, height, image_format, image_mode):
         """Aggiorna le informazioni di base dell'immagine"""
         try:
             # Ottiene informazioni sul file
@@ -462,55 +5756,138 @@ class GeoImageAnalyzer:
             mod_time = os.path.getmtime(image_path)
             mod_date = datetime.fromtimestamp(mod_time).strftime('%Y-%m-%d %H:%M:%S')
             
-            # Ottiene il formato dell'immagine
-            with Image.open(image_path) as img:
-                image_format = img.format
-                image_mode = img.mode
-            
             # Mostra le informazioni
-            self.info_text.delete(1.0, tk.END)
-            self.info_text.insert(tk.END, "=== INFORMAZIONI IMMAGINE ===\n\n")
-            self.info_text.insert(tk.END, f"📁 Nome File: {os.path.basename(image_path)}\n")
-            self.info_text.insert(tk.END, f"📂 Percorso: {image_path}\n\n")
-            
-            self.info_text.insert(tk.END, "=== PROPRIETÀ TECNICHE ===\n")
-            self.info_text.insert(tk.END, f"📐 Dimensioni: {width} x {height} pixel\n")
-            self.info_text.insert(tk.END, f"💾 Dimensione File: {file_size_mb:.2f} MB ({file_size:,} bytes)\n")
-            self.info_text.insert(tk.END, f"🖼️ Formato: {image_format}\n")
-            self.info_text.insert(tk.END, f"🎨 Modalità Colore: {image_mode}\n")
-            self.info_text.insert(tk.END, f"📅 Data Modifica: {mod_date}\n\n")
-            
-            self.info_text.insert(tk.END, "=== ISTRUZIONI ===\n")
-            self.info_text.insert(tk.END, "1. Clicca 'Analizza' per estrarre i metadati EXIF\n")
-            self.info_text.insert(tk.END, "2. Controlla le altre schede per i risultati\n")
-            self.info_text.insert(tk.END, "3. Se presente GPS, vedrai la mappa automaticamente\n")
+            self.render_text(self.info_text, [
+                "=== INFORMAZIONI IMMAGINE ===\n\n",
+                f"📁 Nome File: {os.path.basename(image_path)}\n",
+                f"📂 Percorso: {image_path}\n\n",
+                "=== PROPRIETÀ TECNICHE ===\n",
+                f"📐 Dimensioni: {width} x {height} pixel\n",
+                f"💾 Dimensione File: {file_size_mb:.2f} MB ({file_size:,} bytes)\n",
+                f"🖼️ Formato: {image_format}\n",
+                f"🎨 Modalità Colore: {image_mode}\n",
+                f"📅 Data Modifica: {mod_date}\n\n",
+                "=== ISTRUZIONI ===\n",
+                "1. Clicca 'Analizza' per estrarre i metadati EXIF\n",
+                "2. Controlla le altre schede per i risultati\n",
+                "3. Se presente GPS, vedrai la mappa automaticamente\n",
+            ])
             
         except Exception as e:
-            self.info_text.delete(1.0, tk.END)
-            self.info_text.insert(tk.END, f"Errore nel caricamento informazioni: {str(e)}")
+            self.render_text(self.info_text, [f"Errore nel caricamento informazioni: {str(e)}"])
+            
+    def render_text(self, widget, segments, clear=True):
+        """
+        Aggiorna una scheda di testo con un unico inserimento nel widget.
+        I segmenti sono stringhe semplici o tuple (testo, tag); i testi molto lunghi
+        vengono suddivisi in blocchi inseriti con after_idle per non bloccare l'interfaccia.
+        """
+        # Unisce le stringhe consecutive in segmenti di al massimo RENDER_CHUNK_SIZE caratteri
+        args = []
+        pending = []
+        pending_size = 0
+        for segment in segments:
+            if isinstance(segment, tuple):
+                if pending:
+                    args.append(("".join(pending), ()))
+                    pending = []
+                    pending_size = 0
+                args.append(segment)
+            else:
+                pending.append(segment)
+                pending_size += len(segment)
+                if pending_size >= RENDER_CHUNK_SIZE:
+                    args.append(("".join(pending), ()))
+                    pending = []
+                    pending_size = 0
+        if pending:
+            args.append(("".join(pending), ()))
+        
+        # Una nuova generazione invalida gli inserimenti a blocchi ancora in coda
+        generation = self.render_generations.get(str(widget), 0) + 1
+        self.render_generations[str(widget)] = generation
+        self.rendered_segments[widget] = segments
+        
+        if clear:
+            widget.delete(1.0, tk.END)
+        
+        # Suddivide i segmenti in blocchi di circa RENDER_CHUNK_SIZE caratteri
+        chunks = [[]]
+        chunk_size = 0
+        for text, tags in args:
+            if chunk_size >= RENDER_CHUNK_SIZE:
+                chunks.append([])
+                chunk_size = 0
+            chunks[-1].extend((text, tags))
+            chunk_size += len(text)
+        
+        def insert_chunk(index):
+            if self.render_generations.get(str(widget)) != generation:
+                return
+            if chunks[index]:
+                widget.insert(tk.END, *chunks[index])
+            if index + 1 < len(chunks):
+                self.root.after_idle(insert_chunk, index + 1)
+        
+        insert_chunk(0)
+        
+    def exif_value_segments(self, widget, value):
+        """Restituisce i segmenti per un valore EXIF, troncando i valori lunghi in un link espandibile"""
+        text, truncated = format_exif_value(value)
+        if not truncated:
+            return [text]
+        
+        tag_name = f"expand_{len(self.expandable_values)}"
+        self.expandable_values[tag_name] = value
+        widget.tag_configure('expandable', foreground='#3498db', underline=True)
+        widget.tag_bind('expandable', '<Button-1>',
+                        lambda event, w=widget: self.expand_exif_value(w, event))
+        
+        size = len(value) if isinstance(value, bytes) else len(str(value))
+        unit = "byte" if isinstance(value, bytes) else "caratteri"
+        return [
+            (text, ('expandable', tag_name)),
+            (f" … [{size:,} {unit}, clicca per espandere]", ('expandable', tag_name)),
+        ]
+        
+    def expand_exif_value(self, widget, event):
+        """Sostituisce un valore troncato con il contenuto completo"""
+        index = widget.index(f"@{event.x},{event.y}")
+        for tag_name in widget.tag_names(index):
+            if tag_name in self.expandable_values:
+                start, end = widget.tag_ranges(tag_name)[:2]
+                value = self.expandable_values.pop(tag_name)
+                widget.delete(start, end)
+                widget.insert(start, format_full_exif_value(value))
+                break
             
     def clear_results(self):
         """Pulisce i risultati precedenti"""
-        self.exif_text.delete(1.0, tk.END)
-        self.geo_text.delete(1.0, tk.END)
-        self.forensic_text.delete(1.0, tk.END)
-        self.report_text.delete(1.0, tk.END)
-        self.info_text.delete(1.0, tk.END)
+        for widget in (self.exif_text, self.geo_text, self.forensic_text,
+                       self.report_text, self.info_text):
+            self.render_text(widget, [])
         self.metadata = {}
         self.current_coordinates = None
+        self.expandable_values = {}
         
-        # Pulisce l'anteprima immagine
+        # Pulisce l'anteprima immagine e l'ELA
         self.image_label.config(image='', text="Nessuna immagine caricata")
         if hasattr(self, 'current_photo'):
             self.current_photo = None
+        self.working_image = None
+        self.ela_generation += 1
+        self.ela_photo = None
+        self.ela_label.config(image='', text="Nessuna immagine caricata")
+        self.ela_info_label.config(text="")
         
         # Pulisce la mappa
         if tkintermapview and hasattr(self, 'map_widget'):
             self.map_widget.delete_all_marker()
         elif hasattr(self, 'map_text'):
-            self.map_text.delete(1.0, tk.END)
-            self.map_text.insert(tk.END, "Installare tkintermapview per la visualizzazione interattiva della mappa.\n")
-            self.map_text.insert(tk.END, "Utilizzare il pulsante 'Apri in Browser' per visualizzare la mappa.")
+            self.render_text(self.map_text, [
+                "Installare tkintermapview per la visualizzazione interattiva della mappa.\n",
+                "Utilizzare il pulsante 'Apri in Browser' per visualizzare la mappa.",
+            ])
         
     def analyze_image(self):
         """Analizza l'immagine selezionata"""
@@ -521,12 +5898,22 @@ class GeoImageAnalyzer:
         if not os.path.exists(self.current_image_path):
             messagebox.showerror("Evidence Error", "Digital evidence file not found")
             return
+        
+        # Ricontrolla i limiti: il file potrebbe essere cambiato dopo la selezione
+        self.evidence_check = self.check_evidence(self.current_image_path)
+        if self.evidence_check['status'] == 'rejected':
+            messagebox.showerror("Unsupported Evidence", self.evidence_check['reason'])
+            return
             
         try:
             # Aggiorna status per l'inizio dell'analisi
             self.status_label.config(text="🔬 Starting forensic analysis...")
             self.root.update()
             
+            # Tutte le fasi leggono dalla stessa mappatura del file
+            self.current_evidence = EvidenceFile(self.current_image_path)
+            self.metadata['evidence_check'] = self.evidence_check
+            
             # Analisi EXIF
             self.status_label.config(text="📊 Extracting EXIF metadata...")
             self.root.update()
@@ -547,6 +5934,13 @@ class GeoImageAnalyzer:
             self.root.update()
             self.generate_report()
             
+            # Salva l'analisi per il browser delle evidenze e nel database del caso
+            self.cache_current_analysis()
+            self.image_browser.invalidate(self.current_image_path)
+            if self.case_database:
+                self.case_database.store(self.metadata)
+                self.case_database.flush()
+            
             # Completamento
             self.status_label.config(text="✅ Forensic analysis completed successfully")
             messagebox.showinfo("Analysis Complete", "Digital forensic analysis completed successfully!\n\nReview all tabs for detailed findings.")
@@ -555,73 +5949,116 @@ class GeoImageAnalyzer:
             self.status_label.config(text="❌ Analysis failed - Check evidence integrity")
             messagebox.showerror("Analysis Error", f"Forensic analysis failed: {str(e)}\n\nPlease verify evidence file integrity.")
             
+        finally:
+            if self.current_evidence:
+                self.current_evidence.close()
+                self.current_evidence = None
+            
+    def open_case_database(self):
+        """Apre (o crea) il database del caso in cui salvare le analisi completate"""
+        filename = filedialog.asksaveasfilename(
+            title="Database del Caso",
+            defaultextension=".db",
+            initialfile=os.path.basename(self.config['export']['case_database']['path']),
+            confirmoverwrite=False,
+            filetypes=[("SQLite database", "*.db"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        
+        case_name = os.path.splitext(os.path.basename(filename))[0]
+        try:
+            if self.case_database:
+                self.case_database.close()
+            self.case_database = CaseDatabase(filename, case_name,
+                                              self.config['export']['case_database']['batch_size'])
+            if self.metadata.get('forensic'):
+                self.case_database.store(self.metadata)
+                self.case_database.flush()
+        except Exception as e:
+            self.case_database = None
+            messagebox.showerror("Errore", f"Impossibile aprire il database del caso: {str(e)}")
+            return
+        
+        self.status_label.config(text=f"🗄️ Case database: {filename} (case '{case_name}')")
+        messagebox.showinfo("Database del Caso",
+                            f"Le analisi completate verranno salvate in:\n{filename}\n\nCaso: {case_name}")
+        
+    def open_current_image(self):
+        """Apre l'immagine corrente, dalla mappatura condivisa se disponibile"""
+        if self.current_evidence:
+            return self.current_evidence.open_image()
+        return Image.open(self.current_image_path)
+            
     def extract_exif_data(self):
         """Estrae i metadati EXIF dall'immagine"""
         try:
-            with Image.open(self.current_image_path) as image:
-                exif_data = image._getexif()
+            with self.open_current_image() as image:
+                # Stessa lettura dell'analisi batch: anche i RAW (TiffImageFile, senza _getexif)
+                exif_info, _ = read_exif_metadata(image)
                 
-                if exif_data is not None:
-                    exif_info = {}
-                    for tag_id, value in exif_data.items():
-                        tag = TAGS.get(tag_id, tag_id)
-                        exif_info[tag] = value
-                    
+                if exif_info:
                     self.metadata['exif'] = exif_info
                     
-                    # Mostra i dati EXIF
-                    self.exif_text.insert(tk.END, "=== METADATI EXIF ===\n\n")
-                    
+                    # Mostra i dati EXIF con un solo aggiornamento del widget
+                    segments = ["=== METADATI EXIF ===\n\n"]
                     for tag, value in exif_info.items():
-                        if isinstance(value, bytes):
-                            try:
-                                value = value.decode('utf-8')
-                            except:
-                                value = str(value)
-                        self.exif_text.insert(tk.END, f"{tag}: {value}\n")
+                        segments.append(f"{tag}: ")
+                        segments.extend(self.exif_value_segments(self.exif_text, value))
+                        segments.append("\n")
                         
                 else:
-                    self.exif_text.insert(tk.END, "Nessun dato EXIF trovato nell'immagine.")
+                    segments = ["Nessun dato EXIF trovato nell'immagine.\n"]
                     self.metadata['exif'] = {}
+                
+                # Blocchi XMP, IPTC e MakerNote (nell'interfaccia vengono sempre decodificati tutti)
+                extended = ExtendedMetadata(image, self.metadata['exif'])
+                for name, title in (('xmp', "XMP"), ('iptc', "IPTC"), ('makernote', "MAKERNOTE")):
+                    block = getattr(extended, name)
+                    if not block:
+                        continue
+                    self.metadata[name] = block
+                    if name == 'makernote':
+                        title += f" ({block['vendor']})"
+                        block = block['tags']
+                    segments.append(f"\n=== {title} ===\n\n")
+                    for tag, value in block.items():
+                        segments.append(f"{tag}: ")
+                        segments.extend(self.exif_value_segments(self.exif_text, value))
+                        segments.append("\n")
+                self.render_text(self.exif_text, segments)
                     
         except Exception as e:
-            self.exif_text.insert(tk.END, f"Errore nell'estrazione EXIF: {str(e)}")
+            self.render_text(self.exif_text, [f"Errore nell'estrazione EXIF: {str(e)}"])
             
     def extract_geolocation(self):
         """Estrae e analizza i dati di geolocalizzazione"""
         try:
-            with Image.open(self.current_image_path) as image:
-                exif_data = image._getexif()
+            with self.open_current_image() as image:
+                exif_info, gps_info = read_exif_metadata(image)
                 
-                if exif_data is not None:
-                    gps_info = {}
-                    
-                    for tag_id, value in exif_data.items():
-                        tag = TAGS.get(tag_id, tag_id)
-                        if tag == 'GPSInfo':
-                            for gps_tag_id, gps_value in value.items():
-                                gps_tag = GPSTAGS.get(gps_tag_id, gps_tag_id)
-                                gps_info[gps_tag] = gps_value
-                    
+                if exif_info:
                     self.metadata['gps'] = gps_info
                     
-                    self.geo_text.insert(tk.END, "=== INFORMAZIONI GPS ===\n\n")
+                    segments = ["=== INFORMAZIONI GPS ===\n\n"]
                     
                     if gps_info:
                         for tag, value in gps_info.items():
-                            self.geo_text.insert(tk.END, f"{tag}: {value}\n")
+                            segments.append(f"{tag}: ")
+                            segments.extend(self.exif_value_segments(self.geo_text, value))
+                            segments.append("\n")
                         
                         # Calcola coordinate decimali
                         lat, lon = self.get_decimal_coordinates(gps_info)
                         if lat and lon:
-                            self.geo_text.insert(tk.END, f"\nCoordinate Decimali:\n")
-                            self.geo_text.insert(tk.END, f"Latitudine: {lat}\n")
-                            self.geo_text.insert(tk.END, f"Longitudine: {lon}\n")
+                            segments.append(f"\nCoordinate Decimali:\n")
+                            segments.append(f"Latitudine: {lat}\n")
+                            segments.append(f"Longitudine: {lon}\n")
                             
                             # Reverse geocoding
                             address = self.reverse_geocode(lat, lon)
                             if address:
-                                self.geo_text.insert(tk.END, f"\nIndirizzo: {address}\n")
+                                segments.append(f"\nIndirizzo: {address}\n")
                                 
                             self.metadata['coordinates'] = {'lat': lat, 'lon': lon, 'address': address}
                             self.current_coordinates = (lat, lon)
@@ -629,66 +6066,49 @@ class GeoImageAnalyzer:
                             # Aggiorna automaticamente la mappa
                             self.update_map_display(lat, lon, address)
                     else:
-                        self.geo_text.insert(tk.END, "Nessuna informazione GPS trovata.")
-                        
+                        segments.append("Nessuna informazione GPS trovata.")
+                    
                 else:
-                    self.geo_text.insert(tk.END, "Nessun dato EXIF disponibile per l'analisi GPS.")
+                    self.metadata['gps'] = {}
+                    segments = ["Nessun dato EXIF disponibile per l'analisi GPS.\n"]
+                
+                # Nei file modificati la posizione è spesso solo nel pacchetto XMP
+                if not self.current_coordinates:
+                    lat, lon = ExtendedMetadata(image).xmp_coordinates()
+                    if lat is not None and lon is not None:
+                        segments.append(f"\nCoordinate da XMP:\n")
+                        segments.append(f"Latitudine: {lat}\n")
+                        segments.append(f"Longitudine: {lon}\n")
+                        address = self.reverse_geocode(lat, lon)
+                        if address:
+                            segments.append(f"\nIndirizzo: {address}\n")
+                        self.metadata['coordinates'] = {'lat': lat, 'lon': lon, 'address': address, 'source': 'XMP'}
+                        self.current_coordinates = (lat, lon)
+                        self.update_map_display(lat, lon, address)
+                
+                self.render_text(self.geo_text, segments)
                     
         except Exception as e:
-            self.geo_text.insert(tk.END, f"Errore nell'estrazione GPS: {str(e)}")
+            self.render_text(self.geo_text, [f"Errore nell'estrazione GPS: {str(e)}"])
             
     def get_decimal_coordinates(self, gps_info):
         """Converte le coordinate GPS in formato decimale"""
-        try:
-            lat_ref = gps_info.get('GPSLatitudeRef')
-            lat = gps_info.get('GPSLatitude')
-            lon_ref = gps_info.get('GPSLongitudeRef')
-            lon = gps_info.get('GPSLongitude')
-            
-            if lat and lon:
-                lat_decimal = self.dms_to_decimal(lat, lat_ref)
-                lon_decimal = self.dms_to_decimal(lon, lon_ref)
-                return lat_decimal, lon_decimal
-                
-        except Exception as e:
-            print(f"Errore conversione coordinate: {e}")
-            
-        return None, None
+        return gps_to_decimal(gps_info)
         
     def dms_to_decimal(self, dms, ref):
         """Converte da gradi/minuti/secondi a decimale"""
-        degrees = float(dms[0])
-        minutes = float(dms[1])
-        seconds = float(dms[2])
-        
-        decimal = degrees + (minutes / 60.0) + (seconds / 3600.0)
-        
-        if ref in ['S', 'W']:
-            decimal = -decimal
-            
-        return decimal
+        return dms_to_decimal(dms, ref)
         
     def reverse_geocode(self, lat, lon):
         """Ottiene l'indirizzo dalle coordinate (usando OpenStreetMap)"""
-        try:
-            url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lon}&zoom=18&addressdetails=1"
-            headers = {'User-Agent': 'GeoImageAnalyzer/1.0'}
-            
-            response = requests.get(url, headers=headers, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('display_name', 'Indirizzo non trovato')
-                
-        except Exception as e:
-            print(f"Errore reverse geocoding: {e}")
-            
-        return None
+        if not self.config['geolocation']['reverse_geocoding']['enabled']:
+            return None
+        return reverse_geocode(lat, lon, self.config)
         
     def forensic_analysis(self):
         """Esegue analisi forense approfondita"""
+        segments = ["=== ANALISI FORENSE ===\n\n"]
         try:
-            self.forensic_text.insert(tk.END, "=== ANALISI FORENSE ===\n\n")
-            
             # Informazioni file
             file_stats = os.stat(self.current_image_path)
             file_size = file_stats.st_size
@@ -696,90 +6116,395 @@ class GeoImageAnalyzer:
             modification_time = datetime.fromtimestamp(file_stats.st_mtime)
             access_time = datetime.fromtimestamp(file_stats.st_atime)
             
-            self.forensic_text.insert(tk.END, "INFORMAZIONI FILE:\n")
-            self.forensic_text.insert(tk.END, f"Nome: {os.path.basename(self.current_image_path)}\n")
-            self.forensic_text.insert(tk.END, f"Percorso: {self.current_image_path}\n")
-            self.forensic_text.insert(tk.END, f"Dimensione: {file_size:,} bytes\n")
-            self.forensic_text.insert(tk.END, f"Creazione: {creation_time}\n")
-            self.forensic_text.insert(tk.END, f"Modifica: {modification_time}\n")
-            self.forensic_text.insert(tk.END, f"Ultimo accesso: {access_time}\n\n")
+            segments.append("INFORMAZIONI FILE:\n")
+            segments.append(f"Nome: {os.path.basename(self.current_image_path)}\n")
+            segments.append(f"Percorso: {self.current_image_path}\n")
+            segments.append(f"Dimensione: {file_size:,} bytes\n")
+            segments.append(f"Creazione: {creation_time}\n")
+            segments.append(f"Modifica: {modification_time}\n")
+            segments.append(f"Ultimo accesso: {access_time}\n\n")
             
             # Hash del file
-            file_hashes = self.calculate_hashes()
-            self.forensic_text.insert(tk.END, "HASH FILE:\n")
+            file_hashes, hash_tree = self.calculate_hashes()
+            segments.append("HASH FILE:\n")
             for hash_type, hash_value in file_hashes.items():
-                self.forensic_text.insert(tk.END, f"{hash_type}: {hash_value}\n")
+                segments.append(f"{hash_type}: {hash_value}\n")
+            if hash_tree:
+                segments.append(f"\nHASH TREE (SHA256, blocchi da {hash_tree['block_size']:,} bytes):\n")
+                segments.append(f"Blocchi: {hash_tree['block_count']:,}\n")
+                segments.append(f"Merkle root: {hash_tree['merkle_root']}\n")
             
             # Informazioni immagine
-            with Image.open(self.current_image_path) as image:
-                self.forensic_text.insert(tk.END, f"\nINFORMAZIONI IMMAGINE:\n")
-                self.forensic_text.insert(tk.END, f"Formato: {image.format}\n")
-                self.forensic_text.insert(tk.END, f"Modalità: {image.mode}\n")
-                self.forensic_text.insert(tk.END, f"Dimensioni: {image.size[0]}x{image.size[1]} pixel\n")
+            with self.open_current_image() as image:
+                segments.append(f"\nINFORMAZIONI IMMAGINE:\n")
+                segments.append(f"Formato: {image.format}\n")
+                segments.append(f"Modalità: {image.mode}\n")
+                segments.append(f"Dimensioni: {image.size[0]}x{image.size[1]} pixel\n")
                 
                 if hasattr(image, 'info'):
-                    self.forensic_text.insert(tk.END, f"\nINFORMAZIONI AGGIUNTIVE:\n")
+                    segments.append(f"\nINFORMAZIONI AGGIUNTIVE:\n")
                     for key, value in image.info.items():
-                        self.forensic_text.insert(tk.END, f"{key}: {value}\n")
+                        segments.append(f"{key}: ")
+                        segments.extend(self.exif_value_segments(self.forensic_text, value))
+                        segments.append("\n")
+            
+            # Indicatori di manipolazione (solo intestazione: marker, tabelle di quantizzazione, date)
+            header_bytes = self.config['analysis']['manipulation']['header_bytes']
+            if self.current_evidence:
+                header = self.current_evidence.header(header_bytes)
+            else:
+                with open(self.current_image_path, 'rb') as f:
+                    header = f.read(header_bytes)
+            manipulation = manipulation_indicators(
+                header, self.metadata.get('exif', {}),
+                {'modification_time': modification_time.isoformat()}, self.config
+            )
+            segments.append(f"\nINDICATORI DI MANIPOLAZIONE (punteggio {manipulation['score']}, livello {manipulation['level']}):\n")
+            if manipulation['markers']:
+                segments.append(f"Marker JPEG: {' '.join(manipulation['markers'])}\n")
+            if manipulation['quantization_digest']:
+                segments.append(f"Tabelle di quantizzazione: {manipulation['quantization_digest']} "
+                                f"({manipulation['quantization_match'] or 'firma sconosciuta'})\n")
+            for item in manipulation['indicators']:
+                segments.append(f"- [{item['weight']}] {item['description']}\n")
+            if not manipulation['indicators']:
+                segments.append("- Nessun indicatore rilevato\n")
+            
+            # Immagini incorporate o concatenate (miniature EXIF, anteprime MPF, ...)
+            carved_images = []
+            if self.current_evidence:
+                carved_images = analyze_carved_images(self.current_evidence, self.config)
+                self.metadata['carved_images'] = carved_images
+            if carved_images:
+                segments.append(f"\nIMMAGINI INCORPORATE ({len(carved_images)}):\n")
+                for carved in carved_images:
+                    carved_info = carved['forensic']['file_info']
+                    image_info = carved['forensic'].get('image_info', {})
+                    line = (f"- {carved_info['kind']} @ offset {carved_info['offset']:,} "
+                            f"({carved_info['size']:,} bytes, {image_info.get('format', '?')} "
+                            f"{image_info.get('width', '?')}x{image_info.get('height', '?')})")
+                    if carved.get('coordinates'):
+                        line += f" GPS {carved['coordinates']['lat']:.6f}, {carved['coordinates']['lon']:.6f}"
+                    segments.append(line + "\n")
             
             # Analisi dispositivo (se disponibile)
-            self.analyze_device_info()
+            segments.extend(self.analyze_device_info())
             
             # Salva i dati forensi
             self.metadata['forensic'] = {
-                'file_info': {
-                    'name': os.path.basename(self.current_image_path),
-                    'path': self.current_image_path,
-                    'size': file_size,
-                    'creation_time': creation_time.isoformat(),
-                    'modification_time': modification_time.isoformat(),
-                    'access_time': access_time.isoformat()
-                },
-                'hashes': file_hashes
+                'file_info': file_info_from_stat(self.current_image_path, file_stats),
+                'hashes': file_hashes,
+                'hash_tree': hash_tree,
+                'manipulation': manipulation
             }
             
         except Exception as e:
-            self.forensic_text.insert(tk.END, f"Errore nell'analisi forense: {str(e)}")
+            segments.append(f"Errore nell'analisi forense: {str(e)}")
+        
+        self.render_text(self.forensic_text, segments)
             
     def calculate_hashes(self):
-        """Calcola hash MD5, SHA1 e SHA256 del file"""
+        """Calcola hash MD5, SHA1, SHA256 e il manifest hash tree del file in un'unica lettura"""
         hashes = {}
+        hash_tree = None
+        block_size = int(self.config['analysis']['hash_tree']['block_size_mb'] * 1024 * 1024)
         
         try:
-            with open(self.current_image_path, 'rb') as f:
-                content = f.read()
-                
-                hashes['MD5'] = hashlib.md5(content).hexdigest()
-                hashes['SHA1'] = hashlib.sha1(content).hexdigest()
-                hashes['SHA256'] = hashlib.sha256(content).hexdigest()
+            if self.current_evidence:
+                hashes, hash_tree = self.current_evidence.hashes_with_tree(block_size)
+            else:
+                with EvidenceFile(self.current_image_path) as evidence:
+                    hashes, hash_tree = evidence.hashes_with_tree(block_size)
                 
         except Exception as e:
             print(f"Errore calcolo hash: {e}")
             
-        return hashes
+        return hashes, hash_tree
+        
+    def verify_integrity(self):
+        """Riverifica un file di evidenza rispetto al manifest hash tree di un report JSON"""
+        image_path = filedialog.askopenfilename(title="Seleziona l'evidenza da verificare")
+        if not image_path:
+            return
+        manifest_path = filedialog.askopenfilename(
+            title="Seleziona il report JSON o il manifest hash tree",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+        )
+        if not manifest_path:
+            return
+        
+        def show_progress(done, total):
+            self.status_label.config(text=f"🔐 Verifying blocks {done:,}/{total:,}...")
+            self.root.update()
+        
+        try:
+            manifest = load_hash_manifest(manifest_path)
+            result = verify_hash_tree(
+                image_path, manifest,
+                workers=self.config['analysis']['hash_tree']['workers'],
+                progress_path=f"{manifest_path}.progress",
+                progress_callback=show_progress
+            )
+        except Exception as e:
+            self.status_label.config(text="❌ Integrity verification failed")
+            messagebox.showerror("Errore", f"Errore nella verifica di integrità: {str(e)}")
+            return
+        
+        if result['status'] == 'intact':
+            self.status_label.config(text="✅ Evidence integrity verified")
+            messagebox.showinfo("Verifica Integrità",
+                                f"Evidenza integra.\n\nMerkle root: {result['merkle_root']}")
+        else:
+            self.status_label.config(text="⚠️ Evidence integrity check failed")
+            damaged = result['damaged_blocks']
+            details = "\n".join(
+                f"Blocco {block['index']}: offset {block['offset']:,}, {block['length']:,} bytes"
+                for block in damaged[:20]
+            )
+            if len(damaged) > 20:
+                details += f"\n... e altri {len(damaged) - 20} blocchi"
+            messagebox.showwarning(
+                "Verifica Integrità",
+                f"Evidenza ALTERATA: {len(damaged)} blocchi non corrispondono.\n\n"
+                f"Dimensione attesa: {result['expected_file_size']:,} bytes\n"
+                f"Dimensione attuale: {result['file_size']:,} bytes\n\n{details}"
+            )
+        
+    def group_by_device(self):
+        """Raggruppa per dispositivo di origine le immagini della cartella aperta nel browser"""
+        paths = [row['path'] for row in self.image_browser.rows]
+        if not paths:
+            messagebox.showwarning("Attenzione", "Apri prima una cartella di evidenze.")
+            return
+        
+        devices = DeviceClusters()
+        skipped = 0
+        for count, path in enumerate(paths, start=1):
+            if count % 50 == 0:
+                self.status_label.config(text=f"📷 Reading device signatures {count:,}/{len(paths):,}...")
+                self.root.update()
+            # Solo intestazione e metadati: gli hash non servono per la firma del dispositivo
+            check = check_evidence_file(path, self.config, require_extension=False)
+            if check['status'] == 'rejected':
+                skipped += 1
+                continue
+            try:
+                with open(path, 'rb') as stream:
+                    devices.add(analyze_image_stream(stream, {'name': os.path.basename(path), 'path': path},
+                                                     self.config, hashes={}))
+            except OSError:
+                skipped += 1
+        
+        summary = devices.summary()
+        segments = [
+            "=== DISPOSITIVI DI ORIGINE ===\n\n",
+            f"Immagini analizzate: {len(paths) - skipped:,} (ignorate: {skipped:,})\n",
+            f"Dispositivi individuati: {len(summary):,}\n\n",
+        ]
+        for device in summary:
+            segments.extend(DeviceClusters.describe(device))
+            segments.append("\n")
+        self.render_text(self.report_text, segments)
+        self.notebook.select(self.report_frame)
+        self.status_label.config(text=f"📷 {len(summary):,} source devices identified")
+        
+    def export_redacted_copies(self):
+        """Copie senza GPS, numeri di serie e XMP delle immagini aperte nel browser (pixel invariati)"""
+        paths = [row['path'] for row in self.image_browser.rows]
+        if not paths:
+            messagebox.showwarning("Attenzione", "Apri prima una cartella di evidenze.")
+            return
+        output_root = filedialog.askdirectory(title="Seleziona la cartella per le copie anonimizzate")
+        if not output_root:
+            return
+        source_root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+        if os.path.abspath(output_root) == source_root:
+            messagebox.showerror("Errore", "La cartella di destinazione deve essere diversa da quella delle evidenze.")
+            return
+        
+        def progress(count, entry):
+            if count % 20 == 0 or count == len(paths):
+                self.status_label.config(text=f"🕶️ Writing redacted copies {count:,}/{len(paths):,}...")
+                self.root.update()
+        
+        manifest = export_redacted_copies(paths, source_root, output_root, self.config, progress=progress)
+        info = manifest['redaction_info']
+        self.status_label.config(text=f"🕶️ {info['redacted']:,} redacted copies written")
+        message = (f"Copie anonimizzate: {info['redacted']:,}\nErrori: {info['errors']:,}\n\n"
+                   f"Manifesto: {os.path.join(output_root, self.config['security']['redaction']['manifest'])}")
+        if info['errors']:
+            messagebox.showwarning("Copie Anonimizzate", message)
+        else:
+            messagebox.showinfo("Copie Anonimizzate", message)
+        
+    def compute_case_statistics(self):
+        """Statistiche aggregate delle immagini della cartella aperta, aggiornate mentre vengono lette"""
+        paths = [row['path'] for row in self.image_browser.rows]
+        if not paths:
+            messagebox.showwarning("Attenzione", "Apri prima una cartella di evidenze.")
+            return
+        
+        statistics = CaseStatistics(self.config)
+        source = os.path.dirname(paths[0]) if len(set(map(os.path.dirname, paths))) == 1 else f"{len(paths):,} file"
+        self.notebook.select(self.summary_frame)
+        for count, path in enumerate(paths, start=1):
+            cached = self.get_cached_analysis(path)
+            if cached:
+                statistics.add(cached['metadata'])
+            elif check_evidence_file(path, self.config, require_extension=False)['status'] != 'rejected':
+                # Solo metadati: gli hash non servono per le statistiche
+                try:
+                    with open(path, 'rb') as stream:
+                        statistics.add(analyze_image_stream(stream, {'name': os.path.basename(path), 'path': path},
+                                                            self.config, hashes={}))
+                except OSError:
+                    pass
+            if count % 200 == 0:
+                self.show_case_statistics(statistics, source)
+                self.status_label.config(text=f"📈 Aggregating {count:,}/{len(paths):,}...")
+                self.root.update()
+        self.show_case_statistics(statistics, source)
+        self.status_label.config(text=f"📈 Summary of {statistics.files:,} images")
+        
+    def show_case_statistics(self, statistics, source):
+        """Mostra le statistiche nella scheda Riepilogo"""
+        self.case_statistics = statistics
+        self.case_statistics_source = source
+        self.render_text(self.summary_text, [f"=== RIEPILOGO DEL CASO ===\n\nOrigine: {source}\n"]
+                         + statistics.describe())
+        
+    def export_case_statistics(self):
+        """Esporta in JSON le statistiche mostrate nella scheda Riepilogo"""
+        if self.case_statistics is None:
+            messagebox.showwarning("Attenzione", "Nessun riepilogo da esportare. Calcolare prima il riepilogo.")
+            return
+        filename = filedialog.asksaveasfilename(
+            title="Salva Riepilogo JSON",
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        try:
+            write_json_atomic(filename, {
+                'analysis_info': {
+                    'timestamp': datetime.now().isoformat(),
+                    'analyzer': 'GeoImage Analyzer v1.0',
+                    'system': f"{platform.system()} {platform.release()}",
+                    'source': self.case_statistics_source,
+                },
+                'case_statistics': self.case_statistics.to_dict(),
+            })
+            messagebox.showinfo("Successo", f"Riepilogo JSON salvato: {filename}")
+        except Exception as e:
+            messagebox.showerror("Errore", f"Errore nel salvataggio: {str(e)}")
+        
+    def open_case_map(self):
+        """Apre nel browser la mappa di tutti i punti GPS del caso, generata solo se i dati sono cambiati"""
+        if not self.case_database or self.case_database.case_id is None:
+            messagebox.showwarning("Attenzione", "Aprire prima un database del caso (File > Apri Database del Caso).")
+            return
+        
+        self.status_label.config(text="🗺️ Building case map...")
+        self.root.update()
+        try:
+            points = CaseMapPoints()
+            points.add_rows(self.case_database.query("files.case_id = ? AND gps_points.latitude IS NOT NULL",
+                                                     (self.case_database.case_id,)))
+            if not len(points):
+                messagebox.showwarning("Attenzione", "Nessuna immagine geolocalizzata nel caso.")
+                self.status_label.config(text="Ready")
+                return
+            map_path = (os.path.splitext(self.case_database.path)[0]
+                        + "." + re.sub(r'[^\w.-]+', '_', self.case_database.case_name) + ".map.html")
+            map_path, reused = write_case_map(points.points, map_path,
+                                              self.config['export']['case_map']['heatmap'],
+                                              self.case_database.case_name)
+        except Exception as e:
+            messagebox.showerror("Errore", f"Errore nella generazione della mappa del caso: {str(e)}")
+            return
+        
+        webbrowser.open('file://' + os.path.abspath(map_path))
+        state = "reused" if reused else "generated"
+        self.status_label.config(text=f"🗺️ Case map with {len(points):,} GPS points {state}: {map_path}")
+        
+    def prefetch_map_tiles(self):
+        """Scarica nella cache locale le tile intorno alla posizione corrente per l'uso offline"""
+        if self.tile_cache is None:
+            messagebox.showerror("Errore", "Cache delle tile non disponibile.")
+            return
+        if not self.current_coordinates:
+            messagebox.showwarning("Attenzione", "Nessuna coordinata GPS: analizzare prima un'immagine geolocalizzata.")
+            return
+        
+        tile_config = self.config['geolocation']['tile_cache']
+        lat, lon = self.current_coordinates
+        margin = tile_config['prefetch_margin_degrees']
+        min_zoom, max_zoom = tile_config['prefetch_zoom']
+        tiles = list(tiles_in_area(lat - margin, lon - margin, lat + margin, lon + margin, min_zoom, max_zoom))
+        if len(tiles) > tile_config['max_prefetch_tiles']:
+            messagebox.showerror("Errore", f"{len(tiles):,} tile oltre il limite di {tile_config['max_prefetch_tiles']:,}.")
+            return
+        if not messagebox.askyesno("Scarica Mappe Offline",
+                                   f"Scaricare fino a {len(tiles):,} tile (zoom {min_zoom}-{max_zoom}) intorno a "
+                                   f"{lat:.5f}, {lon:.5f}?\n\nServer: {self.tile_cache.tile_server}"):
+            return
+        
+        def worker():
+            def progress(count, statistics):
+                if count % 25 == 0:
+                    self.prefetch_queue.put((count, statistics, False))
+            statistics = self.tile_cache.prefetch(tiles, progress)
+            self.prefetch_queue.put((len(tiles), statistics, True))
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.status_label.config(text=f"🗺️ Downloading {len(tiles):,} map tiles...")
+        self.root.after(100, self.poll_prefetch_queue)
+        
+    def poll_prefetch_queue(self):
+        """Aggiorna lo stato del download delle tile fino al completamento"""
+        done = False
+        try:
+            while not done:
+                count, statistics, done = self.prefetch_queue.get_nowait()
+                self.status_label.config(text=f"🗺️ Map tiles {count:,}/{statistics['tiles']:,} "
+                                              f"({statistics['downloaded']:,} downloaded)")
+        except queue.Empty:
+            pass
+        if not done:
+            self.root.after(100, self.poll_prefetch_queue)
+            return
+        
+        self.status_label.config(text=f"✅ Offline map ready: {statistics['downloaded']:,} tiles downloaded, "
+                                      f"{statistics['cached']:,} already cached")
+        if not statistics['network_available'] and statistics['failed']:
+            messagebox.showwarning("Scarica Mappe Offline",
+                                   f"Rete non disponibile: {statistics['failed']:,} tile non scaricate.\n"
+                                   f"Le tile già in cache restano utilizzabili offline.")
         
     def analyze_device_info(self):
-        """Analizza informazioni sul dispositivo di origine"""
+        """Analizza informazioni sul dispositivo di origine e restituisce le righe da mostrare"""
+        lines = []
         try:
             exif_data = self.metadata.get('exif', {})
             
-            self.forensic_text.insert(tk.END, f"\nINFORMAZIONI DISPOSITIVO:\n")
+            lines.append(f"\nINFORMAZIONI DISPOSITIVO:\n")
             
             # Marca e modello
             make = exif_data.get('Make', 'Non disponibile')
             model = exif_data.get('Model', 'Non disponibile')
-            self.forensic_text.insert(tk.END, f"Marca: {make}\n")
-            self.forensic_text.insert(tk.END, f"Modello: {model}\n")
+            lines.append(f"Marca: {make}\n")
+            lines.append(f"Modello: {model}\n")
             
             # Software
             software = exif_data.get('Software', 'Non disponibile')
-            self.forensic_text.insert(tk.END, f"Software: {software}\n")
+            lines.append(f"Software: {software}\n")
             
             # Data e ora
             datetime_original = exif_data.get('DateTimeOriginal', 'Non disponibile')
             datetime_digitized = exif_data.get('DateTimeDigitized', 'Non disponibile')
-            self.forensic_text.insert(tk.END, f"Data scatto originale: {datetime_original}\n")
-            self.forensic_text.insert(tk.END, f"Data digitalizzazione: {datetime_digitized}\n")
+            lines.append(f"Data scatto originale: {datetime_original}\n")
+            lines.append(f"Data digitalizzazione: {datetime_digitized}\n")
             
             # Impostazioni fotocamera
             iso = exif_data.get('ISOSpeedRatings', 'Non disponibile')
@@ -787,79 +6512,33 @@ class GeoImageAnalyzer:
             exposure = exif_data.get('ExposureTime', 'Non disponibile')
             focal_length = exif_data.get('FocalLength', 'Non disponibile')
             
-            self.forensic_text.insert(tk.END, f"\nIMPOSTAZIONI SCATTO:\n")
-            self.forensic_text.insert(tk.END, f"ISO: {iso}\n")
-            self.forensic_text.insert(tk.END, f"Apertura: {aperture}\n")
-            self.forensic_text.insert(tk.END, f"Tempo esposizione: {exposure}\n")
-            self.forensic_text.insert(tk.END, f"Lunghezza focale: {focal_length}\n")
+            lines.append(f"\nIMPOSTAZIONI SCATTO:\n")
+            lines.append(f"ISO: {iso}\n")
+            lines.append(f"Apertura: {aperture}\n")
+            lines.append(f"Tempo esposizione: {exposure}\n")
+            lines.append(f"Lunghezza focale: {focal_length}\n")
             
         except Exception as e:
-            self.forensic_text.insert(tk.END, f"Errore analisi dispositivo: {str(e)}")
+            lines.append(f"Errore analisi dispositivo: {str(e)}")
+        
+        return lines
             
     def generate_report(self):
-        """Genera un report completo dell'analisi"""
+        """Genera un report completo dell'analisi (stesso template TXT dei report in batch)"""
         try:
-            self.report_text.insert(tk.END, "=== REPORT COMPLETO ANALISI FORENSE ===\n\n")
-            
-            # Timestamp analisi
-            analysis_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            self.report_text.insert(tk.END, f"Data/Ora Analisi: {analysis_time}\n")
-            self.report_text.insert(tk.END, f"Sistema Operativo: {platform.system()} {platform.release()}\n")
-            self.report_text.insert(tk.END, f"Analizzatore: GeoImage Analyzer v1.0\n\n")
-            
-            # Sommario file
-            self.report_text.insert(tk.END, "SOMMARIO FILE:\n")
-            forensic_data = self.metadata.get('forensic', {})
-            file_info = forensic_data.get('file_info', {})
-            
-            self.report_text.insert(tk.END, f"Nome file: {file_info.get('name', 'N/A')}\n")
-            self.report_text.insert(tk.END, f"Percorso: {file_info.get('path', 'N/A')}\n")
-            self.report_text.insert(tk.END, f"Dimensione: {file_info.get('size', 'N/A')} bytes\n\n")
-            
-            # Hash
-            hashes = forensic_data.get('hashes', {})
-            if hashes:
-                self.report_text.insert(tk.END, "HASH CRITTOGRAFICI:\n")
-                for hash_type, hash_value in hashes.items():
-                    self.report_text.insert(tk.END, f"{hash_type}: {hash_value}\n")
-                self.report_text.insert(tk.END, "\n")
-            
-            # Geolocalizzazione
-            coordinates = self.metadata.get('coordinates', {})
-            if coordinates:
-                self.report_text.insert(tk.END, "GEOLOCALIZZAZIONE:\n")
-                self.report_text.insert(tk.END, f"Latitudine: {coordinates.get('lat', 'N/A')}\n")
-                self.report_text.insert(tk.END, f"Longitudine: {coordinates.get('lon', 'N/A')}\n")
-                self.report_text.insert(tk.END, f"Indirizzo: {coordinates.get('address', 'N/A')}\n\n")
-            
-            # Dispositivo
-            exif_data = self.metadata.get('exif', {})
-            if exif_data:
-                self.report_text.insert(tk.END, "DISPOSITIVO DI ORIGINE:\n")
-                self.report_text.insert(tk.END, f"Marca: {exif_data.get('Make', 'N/A')}\n")
-                self.report_text.insert(tk.END, f"Modello: {exif_data.get('Model', 'N/A')}\n")
-                self.report_text.insert(tk.END, f"Software: {exif_data.get('Software', 'N/A')}\n")
-                self.report_text.insert(tk.END, f"Data scatto: {exif_data.get('DateTimeOriginal', 'N/A')}\n\n")
-            
-            # Conclusioni
-            self.report_text.insert(tk.END, "CONCLUSIONI ANALISI:\n")
-            self.report_text.insert(tk.END, "- Analisi metadati EXIF completata\n")
-            
-            if coordinates:
-                self.report_text.insert(tk.END, "- Geolocalizzazione estratta con successo\n")
-            else:
-                self.report_text.insert(tk.END, "- Nessuna informazione di geolocalizzazione trovata\n")
-                
-            if exif_data.get('Make') or exif_data.get('Model'):
-                self.report_text.insert(tk.END, "- Informazioni dispositivo identificate\n")
-            else:
-                self.report_text.insert(tk.END, "- Informazioni dispositivo limitate\n")
-                
-            self.report_text.insert(tk.END, "- Hash crittografici calcolati per integrità\n")
-            
+            report = self.report_renderer.render_image(self.metadata, 'txt', self.report_info())
         except Exception as e:
-            self.report_text.insert(tk.END, f"Errore generazione report: {str(e)}")
-            
+            report = f"Errore generazione report: {str(e)}"
+        self.render_text(self.report_text, [report])
+        
+    def report_info(self):
+        """Informazioni sull'analisi riportate in testa ai report"""
+        return {
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'analyzer': 'GeoImage Analyzer v1.0',
+            'system': f"{platform.system()} {platform.release()}",
+        }
+        
     def export_json_report(self):
         """Esporta il report in formato JSON"""
         if not self.metadata:
@@ -880,7 +6559,7 @@ class GeoImageAnalyzer:
                         'analyzer': 'GeoImage Analyzer v1.0',
                         'system': f"{platform.system()} {platform.release()}"
                     },
-                    'metadata': self.metadata
+                    'metadata': exif_normalizer(self.config).result(self.metadata)
                 }
                 
                 with open(filename, 'w', encoding='utf-8') as f:
@@ -893,22 +6572,30 @@ class GeoImageAnalyzer:
                 
     def export_txt_report(self):
         """Esporta il report in formato testo"""
+        self.export_rendered_report('txt', "Salva Report TXT", [("Text files", "*.txt"), ("All files", "*.*")])
+        
+    def export_html_report(self):
+        """Esporta il report in formato HTML"""
+        self.export_rendered_report('html', "Salva Report HTML", [("HTML files", "*.html"), ("All files", "*.*")])
+        
+    def export_rendered_report(self, report_format, title, filetypes):
+        """Rende il report dai metadati dell'analisi con il template del formato indicato"""
         if not self.metadata:
             messagebox.showwarning("Attenzione", "Nessun dato da esportare. Analizza prima un'immagine.")
             return
             
         filename = filedialog.asksaveasfilename(
-            title="Salva Report TXT",
-            defaultextension=".txt",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+            title=title,
+            defaultextension=f".{report_format}",
+            filetypes=filetypes
         )
         
         if filename:
             try:
                 with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(self.report_text.get(1.0, tk.END))
+                    f.write(self.report_renderer.render_image(self.metadata, report_format, self.report_info()))
                     
-                messagebox.showinfo("Successo", f"Report TXT salvato: {filename}")
+                messagebox.showinfo("Successo", f"Report {report_format.upper()} salvato: {filename}")
                 
             except Exception as e:
                 messagebox.showerror("Errore", f"Errore nel salvataggio: {str(e)}")
@@ -931,14 +6618,16 @@ class GeoImageAnalyzer:
                 
             elif hasattr(self, 'map_text'):
                 # Aggiorna il testo della mappa
-                self.map_text.delete(1.0, tk.END)
-                self.map_text.insert(tk.END, "=== INFORMAZIONI MAPPA ===\n\n")
-                self.map_text.insert(tk.END, f"Coordinate trovate:\n")
-                self.map_text.insert(tk.END, f"Latitudine: {lat:.6f}\n")
-                self.map_text.insert(tk.END, f"Longitudine: {lon:.6f}\n")
+                lines = [
+                    "=== INFORMAZIONI MAPPA ===\n\n",
+                    f"Coordinate trovate:\n",
+                    f"Latitudine: {lat:.6f}\n",
+                    f"Longitudine: {lon:.6f}\n",
+                ]
                 if address:
-                    self.map_text.insert(tk.END, f"Indirizzo: {address}\n")
-                self.map_text.insert(tk.END, "\nUtilizzare il pulsante 'Apri in Browser' per visualizzare la mappa interattiva.")
+                    lines.append(f"Indirizzo: {address}\n")
+                lines.append("\nUtilizzare il pulsante 'Apri in Browser' per visualizzare la mappa interattiva.")
+                self.render_text(self.map_text, lines)
                 
         except Exception as e:
             print(f"Errore aggiornamento mappa: {e}")
@@ -966,7 +6655,7 @@ class GeoImageAnalyzer:
             lat, lon = self.current_coordinates
             address = self.metadata.get('coordinates', {}).get('address', '')
             
-            # Crea mappa con Folium
+            # Crea mappa con Folium (salvata solo se la posizione non ha già una mappa)
             m = folium.Map(location=[lat, lon], zoom_start=15)
             
             # Aggiunge marker
@@ -991,18 +6680,11 @@ class GeoImageAnalyzer:
                 fillOpacity=0.2
             ).add_to(m)
             
-            # Salva in file temporaneo
-            if self.current_map_file:
-                try:
-                    os.unlink(self.current_map_file)
-                except:
-                    pass
-                    
-            temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False)
-            self.current_map_file = temp_file.name
-            temp_file.close()
-            
-            m.save(self.current_map_file)
+            # Una mappa per posizione: riaprendo la stessa posizione il file già generato viene riusato
+            key = hashlib.sha256(f"{CASE_MAP_VERSION}|{lat:.6f}|{lon:.6f}|{address}".encode('utf-8')).hexdigest()[:16]
+            self.current_map_file = os.path.join(tempfile.gettempdir(), f"geoimage_map_{key}.html")
+            if not os.path.exists(self.current_map_file):
+                m.save(self.current_map_file)
             
             # Apre nel browser
             webbrowser.open('file://' + os.path.abspath(self.current_map_file))
@@ -1069,7 +6751,513 @@ Creato con Python e Tkinter"""
         except Exception as e:
             print(f"Errore nel mostrare le informazioni: {e}")
 
+def parse_arguments(argv=None):
+    """Argomenti da riga di comando; senza argomenti viene avviata l'interfaccia grafica"""
+    parser = argparse.ArgumentParser(description="GeoImage Analyzer - Tool Forense per Analisi Immagini")
+    parser.add_argument('--archive', metavar='ARCHIVIO',
+                        help="analizza le immagini di un archivio ZIP/TAR senza estrarlo")
+    parser.add_argument('--carve', metavar='FILE',
+                        help="cerca immagini incorporate o concatenate in un file o immagine disco")
+    parser.add_argument('--redact', metavar='CARTELLA',
+                        help="scrive copie delle immagini senza GPS, numeri di serie e XMP (pixel invariati)")
+    parser.add_argument('--redact-output', metavar='CARTELLA',
+                        help="con --redact: cartella delle copie (predefinita: <cartella>_redacted)")
+    parser.add_argument('--scan', metavar='CARTELLA',
+                        help="analizza ricorsivamente le immagini di una cartella")
+    parser.add_argument('--include', metavar='GLOB', action='append',
+                        help="analizza solo i file che corrispondono al glob (ripetibile)")
+    parser.add_argument('--exclude', metavar='GLOB', action='append',
+                        help="ignora file e cartelle che corrispondono al glob (ripetibile)")
+    parser.add_argument('--sniff', action='store_true', default=None,
+                        help="riconosce le immagini dalla firma anche con estensione non supportata")
+    parser.add_argument('--parallel', action='store_true',
+                        help="con --scan: usa la pipeline a stadi (come advanced.parallel_processing)")
+    parser.add_argument('--geocode', action='store_true',
+                        help="esegue il reverse geocoding anche in modalità batch (richiede rete)")
+    parser.add_argument('--async', dest='async_io', action='store_true',
+                        help="con --scan: letture concorrenti con asyncio per storage di rete ad alta latenza")
+    parser.add_argument('--concurrency', metavar='N', type=int,
+                        help="letture contemporanee in modalità --async (predefinito: advanced.async_io)")
+    parser.add_argument('--metadata-only', action='store_true',
+                        help="con --async: estrae solo i metadati, senza calcolare gli hash")
+    parser.add_argument('--watch', action='store_true',
+                        help="con --scan: continua a monitorare la cartella e analizza le nuove evidenze")
+    parser.add_argument('--restart', action='store_true',
+                        help="con --scan: ignora il checkpoint di una scansione interrotta e riparte da zero")
+    parser.add_argument('--output', metavar='FILE',
+                        help="file del report JSON (predefinito: <input>.analysis.json)")
+    parser.add_argument('--devices', action='store_true',
+                        help="raggruppa le immagini per dispositivo di origine (<report>.devices.json)")
+    parser.add_argument('--reports', metavar='CARTELLA',
+                        help="report per immagine e riepilogo del caso (TXT/HTML/CSV) nella cartella indicata")
+    parser.add_argument('--report-format', metavar='FORMATI',
+                        help="con --reports/--render: formati separati da virgola (predefiniti da config.json)")
+    parser.add_argument('--render', metavar='REPORT',
+                        help="genera i report da un report JSON esistente senza rianalizzare (richiede --reports)")
+    parser.add_argument('--map', action='store_true',
+                        help="mappa HTML dei punti GPS (<report>.map.html e <report>.map.geojson)")
+    parser.add_argument('--heatmap', action='store_true',
+                        help="con --map: aggiunge il livello heatmap")
+    parser.add_argument('--db', metavar='FILE',
+                        help="database del caso (SQLite): salva i risultati di --scan/--archive/--carve "
+                             "oppure, da solo, esegue le ricerche --find-*")
+    parser.add_argument('--case', metavar='NOME',
+                        help="nome del caso nel database (predefinito: nome dell'input)")
+    parser.add_argument('--find-hash', metavar='HASH',
+                        help="con --db: file con questo MD5/SHA1/SHA256 in tutti i casi")
+    parser.add_argument('--find-device', metavar='MAKE[/MODEL]',
+                        help="con --db: file scattati dal dispositivo indicato")
+    parser.add_argument('--find-time', metavar=('DA', 'A'), nargs=2,
+                        help="con --db: file con data di scatto nell'intervallo (ISO 8601)")
+    parser.add_argument('--find-area', metavar=('LAT_MIN', 'LON_MIN', 'LAT_MAX', 'LON_MAX'), nargs=4, type=float,
+                        help="con --db: file con coordinate GPS nel rettangolo")
+    parser.add_argument('--prefetch-tiles', metavar=('LAT_MIN', 'LON_MIN', 'LAT_MAX', 'LON_MAX'), nargs=4, type=float,
+                        help="scarica nella cache locale le tile della mappa del rettangolo per l'uso offline")
+    parser.add_argument('--zoom', metavar=('MIN', 'MAX'), nargs=2, type=int,
+                        help="con --prefetch-tiles: livelli di zoom (predefinito da config.json)")
+    parser.add_argument('--tile-cache', metavar='FILE',
+                        help="file MBTiles della cache delle tile (predefinito da config.json)")
+    parser.add_argument('--serve', action='store_true',
+                        help="avvia l'API HTTP locale (POST /analyze, GET /health)")
+    parser.add_argument('--host', metavar='INDIRIZZO',
+                        help="con --serve: indirizzo di ascolto (predefinito 127.0.0.1)")
+    parser.add_argument('--port', metavar='PORTA', type=int,
+                        help="con --serve: porta di ascolto (predefinita da config.json)")
+    parser.add_argument('--allow-root', metavar='CARTELLA', action='append',
+                        help="con --serve: cartella i cui file possono essere analizzati per percorso (ripetibile)")
+    parser.add_argument('--workers', metavar='N', type=int,
+                        help="con --serve: richieste analizzate in parallelo; con --redact: file copiati in parallelo")
+    parser.add_argument('--verbose', action='store_true',
+                        help="con --serve: registra ogni richiesta")
+    parser.add_argument('--config', metavar='FILE', default=CONFIG_PATH,
+                        help="file di configurazione (predefinito: config.json)")
+    return parser.parse_args(argv)
+
+def print_scan_error(path, error):
+    """Segnala sulla console un file o una cartella non leggibile durante la scansione"""
+    print(f"⚠️ Non leggibile {path}: {error}")
+
+def open_case_database(args, config, default_case):
+    """Database del caso indicato con --db (None se non richiesto)"""
+    if not args.db:
+        return None
+    case_name = args.case or os.path.basename(os.path.normpath(default_case))
+    print(f"🗄️ Database del caso: {args.db} (caso '{case_name}')")
+    return CaseDatabase(args.db, case_name, config['export']['case_database']['batch_size'])
+
+def result_collectors(database, devices, points=None, reports=None, statistics=None):
+    """Funzioni che ricevono ogni risultato oltre al report (database del caso, dispositivi, mappa, report, statistiche)"""
+    return [collect for collect in (database and database.store, devices and devices.add,
+                                    points is not None and points.add, reports and reports.add,
+                                    statistics and statistics.add) if collect]
+
+def open_report_writer(args, config, analysis_info, statistics):
+    """Report per immagine e del caso richiesti con --reports (None se non richiesti)"""
+    if not args.reports:
+        return None
+    reports_config = config['export']['reports']
+    formats = args.report_format.split(',') if args.report_format else reports_config['formats']
+    return ReportWriter(args.reports, formats, analysis_info, statistics,
+                        ReportRenderer(reports_config['template_dir']))
+
+def close_report_writer(reports):
+    """Scrive il riepilogo del caso e stampa dove sono stati salvati i report"""
+    if reports is None:
+        return
+    reports.close()
+    print(f"📋 Report di {reports.count:,} immagini e riepilogo del caso in {reports.output_dir}")
+
+def collect_results(results, collectors):
+    """Passa ogni risultato ai collettori mentre viene scritto nel report"""
+    for result in results:
+        for collect in collectors:
+            collect(result)
+        yield result
+
+def print_case_statistics(statistics):
+    """Stampa le statistiche principali del caso (l'insieme completo è nel report JSON)"""
+    if not statistics.files:
+        return
+    print(f"📈 Copertura GPS {statistics.gps_coverage:.1%} ({statistics.geolocated:,}/{statistics.files:,})"
+          + (f", scatti dal {statistics.first_capture} al {statistics.last_capture}" if statistics.dated else ""))
+    for title, counter in (("Dispositivi", statistics.devices), ("Software", statistics.software)):
+        top = counter.most_common(3)
+        if top:
+            print(f"  {title}: " + ", ".join(f"{value} ({count:,})" for value, count in top))
+
+def write_device_summary(devices, output_path):
+    """Stampa il riepilogo per dispositivo e lo salva accanto al report"""
+    if not devices:
+        return
+    summary = devices.summary()
+    devices_path = os.path.splitext(output_path)[0] + ".devices.json"
+    write_json_atomic(devices_path, {'devices': summary})
+    print(f"📷 {len(summary):,} dispositivi individuati - riepilogo: {devices_path}")
+    for device in summary:
+        print("  " + "  ".join(DeviceClusters.describe(device)).rstrip())
+
+def write_results_map(points, output_path, heatmap=False):
+    """Scrive (o riusa, se i punti non sono cambiati) la mappa dei punti GPS accanto al report"""
+    if points is None:
+        return
+    map_path = os.path.splitext(output_path)[0] + ".map.html"
+    start = time.perf_counter()
+    map_path, reused = write_case_map(points.points, map_path, heatmap,
+                                      os.path.splitext(os.path.basename(output_path))[0])
+    state = "invariata, riusata" if reused else f"generata in {time.perf_counter() - start:.1f}s"
+    print(f"🗺️ Mappa di {len(points):,} punti GPS ({state}): {map_path}")
+
+def run_case_query(args):
+    """Modalità senza interfaccia: ricerche nel database dei casi"""
+    with CaseDatabase(args.db) as database:
+        start = time.perf_counter()
+        if args.find_hash:
+            rows = database.find_by_hash(args.find_hash)
+        elif args.find_device:
+            make, _, model = args.find_device.partition('/')
+            rows = database.find_by_device(make or None, model or None)
+        elif args.find_time:
+            rows = database.find_by_time(*args.find_time)
+        elif args.find_area:
+            rows = database.find_in_area(*args.find_area)
+        else:
+            rows = database.query("1")
+        elapsed = (time.perf_counter() - start) * 1000
+    
+    for row in rows:
+        position = f"  GPS {row.latitude:.6f}, {row.longitude:.6f}" if row.latitude is not None else ""
+        print(f"  [{row.case_name}] {row.path}  {row.capture_time or '-'}  {row.device}{position}")
+    print(f"✅ {len(rows):,} file trovati in {elapsed:.1f} ms")
+    if args.map:
+        points = CaseMapPoints()
+        points.add_rows(rows)
+        write_results_map(points, args.output or os.path.splitext(args.db)[0] + ".json", args.heatmap)
+
+def run_tile_prefetch(args):
+    """Modalità senza interfaccia: download delle tile di un'area nella cache MBTiles"""
+    config = load_config(args.config)
+    tile_config = config['geolocation']['tile_cache']
+    if args.tile_cache:
+        tile_config['path'] = args.tile_cache
+    min_zoom, max_zoom = args.zoom or tile_config['prefetch_zoom']
+    tiles = list(tiles_in_area(*args.prefetch_tiles, min_zoom, max_zoom))
+    if len(tiles) > tile_config['max_prefetch_tiles']:
+        print(f"❌ {len(tiles):,} tile oltre il limite di {tile_config['max_prefetch_tiles']:,}: "
+              f"ridurre l'area o i livelli di zoom")
+        return
+    
+    tile_cache = open_tile_cache(config)
+    if tile_cache is None:
+        return
+    print(f"🗺️ Download di {len(tiles):,} tile (zoom {min_zoom}-{max_zoom}) in {tile_config['path']}")
+    
+    def progress(count, statistics):
+        if count % 100 == 0:
+            print(f"  {count:,}/{len(tiles):,} ({statistics['downloaded']:,} scaricate)")
+    
+    start = time.perf_counter()
+    with tile_cache:
+        statistics = tile_cache.prefetch(tiles, progress)
+    print(f"✅ {statistics['downloaded']:,} tile scaricate ({statistics['bytes'] / (1024 * 1024):.1f} MB), "
+          f"{statistics['cached']:,} già in cache, {statistics['failed']:,} non disponibili "
+          f"in {time.perf_counter() - start:.1f}s")
+    if not statistics['network_available'] and statistics['failed']:
+        print("⚠️ Rete non disponibile: download interrotto")
+
+def run_api_server(args):
+    """Modalità senza interfaccia: API HTTP locale per gli altri strumenti del laboratorio"""
+    config = load_config(args.config)
+    Image.MAX_IMAGE_PIXELS = config['analysis']['max_image_pixels']
+    api_config = config['advanced']['api_server']
+    host = args.host or api_config['host']
+    port = args.port if args.port is not None else api_config['port']
+    server = AnalysisHTTPServer((host, port), config, args.workers, args.verbose, args.allow_root)
+    if host not in ('127.0.0.1', 'localhost', '::1'):
+        print(f"⚠️ L'API non ha autenticazione: in ascolto su {host} è raggiungibile da altri host")
+    if server.allowed_roots:
+        print(f"📂 Analisi per percorso consentita sotto: {', '.join(server.allowed_roots)}")
+    else:
+        print("📂 Analisi per percorso disabilitata (solo upload): abilitarla con --allow-root CARTELLA")
+    print(f"🌐 API in ascolto su http://{host}:{server.server_port} "
+          f"({server.workers} worker, coda di {server.queue_size}) - CTRL+C per uscire")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    statistics = server.health()['statistics']
+    print(f"✅ {statistics['analyzed']:,} analisi, {statistics['errors']:,} errori, "
+          f"{statistics['rejected']:,} connessioni rifiutate")
+
+def run_render_reports(args):
+    """Modalità senza interfaccia: report TXT/HTML/CSV da un report JSON già prodotto"""
+    config = load_config(args.config)
+    if not args.reports:
+        print("❌ Indicare la cartella di destinazione con --reports")
+        return
+    with open(args.render, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    results = report.get('results') or ([report['metadata']] if 'metadata' in report else [])
+    
+    # Le informazioni di analisi vengono dal report: rigenerare produce gli stessi file
+    start = time.perf_counter()
+    statistics = CaseStatistics(config)
+    reports = open_report_writer(args, config, report.get('analysis_info') or {}, statistics)
+    for result in results:
+        statistics.add(result)
+        reports.add(result)
+    close_report_writer(reports)
+    print(f"✅ {len(results):,} report generati in {time.perf_counter() - start:.1f}s")
+
+def run_redaction(args):
+    """Modalità senza interfaccia: copie anonimizzate delle immagini di una cartella"""
+    config = load_config(args.config)
+    source_root = os.path.normpath(args.redact)
+    output_root = os.path.normpath(args.redact_output or source_root + "_redacted")
+    
+    # L'elenco viene chiuso prima di scrivere: una destinazione interna alla sorgente non viene riletta
+    print(f"🕶️ Copie anonimizzate: {source_root} -> {output_root}")
+    paths = sorted(path for path, stats in scan_directory(source_root, config, include=args.include,
+                                                           exclude=args.exclude, sniff=args.sniff,
+                                                           error_callback=print_scan_error)
+                   if not os.path.abspath(path).startswith(os.path.abspath(output_root) + os.sep))
+    
+    def progress(count, entry):
+        if entry.get('error'):
+            print(f"  ⚠️ {entry['source']}: {entry['error']}")
+        elif count % 100 == 0 or count == len(paths):
+            print(f"  [{count:,}/{len(paths):,}] {entry['source']}")
+    
+    manifest = export_redacted_copies(paths, source_root, output_root, config, args.workers, progress)
+    info = manifest['redaction_info']
+    print(f"✅ {info['redacted']:,} copie anonimizzate, {info['errors']:,} errori in {info['elapsed_seconds']:.1f}s "
+          f"- manifesto: {os.path.join(output_root, config['security']['redaction']['manifest'])}")
+
+def run_archive_analysis(args):
+    """Modalità senza interfaccia: analisi di un archivio ZIP/TAR"""
+    config = load_config(args.config)
+    Image.MAX_IMAGE_PIXELS = config['analysis']['max_image_pixels']
+    output_path = args.output or args.archive + ".analysis.json"
+    
+    print(f"🗜️ Analisi archivio: {args.archive}")
+    database = open_case_database(args, config, args.archive)
+    devices = DeviceClusters() if args.devices else None
+    points = CaseMapPoints() if args.map else None
+    statistics = CaseStatistics(config)
+    analysis_info = {
+        'timestamp': datetime.now().isoformat(),
+        'analyzer': 'GeoImage Analyzer v1.0',
+        'system': f"{platform.system()} {platform.release()}",
+        'archive': args.archive,
+    }
+    reports = open_report_writer(args, config, analysis_info, statistics)
+    try:
+        count = write_json_results(
+            output_path,
+            collect_results(analyze_archive(args.archive, config,
+                                            lambda count, member_path: print(f"  [{count:,}] {member_path}")),
+                            result_collectors(database, devices, points, reports, statistics)),
+            analysis_info, statistics, exif_normalizer(config)
+        )
+    finally:
+        if database:
+            database.close()
+    print(f"✅ {count:,} immagini analizzate - report: {output_path}")
+    print_case_statistics(statistics)
+    write_device_summary(devices, output_path)
+    write_results_map(points, output_path, args.heatmap)
+    close_report_writer(reports)
+
+def run_carving(args):
+    """Modalità senza interfaccia: carving delle immagini da un file o immagine disco"""
+    config = load_config(args.config)
+    Image.MAX_IMAGE_PIXELS = config['analysis']['max_image_pixels']
+    output_path = args.output or args.carve + ".carving.json"
+    
+    print(f"🧩 Carving: {args.carve}")
+    with EvidenceFile(args.carve) as evidence:
+        results = analyze_carved_images(evidence, config, include_primary=True)
+    for result in results:
+        file_info = result['forensic']['file_info']
+        print(f"  {file_info['kind']:<15} offset {file_info['offset']:>12,}  {file_info['size']:>10,} bytes")
+    analysis_info = {
+        'timestamp': datetime.now().isoformat(),
+        'analyzer': 'GeoImage Analyzer v1.0',
+        'system': f"{platform.system()} {platform.release()}",
+        'carved_from': args.carve,
+    }
+    statistics = CaseStatistics(config)
+    count = write_json_results(output_path, collect_results(results, [statistics.add]), analysis_info, statistics,
+                               exif_normalizer(config))
+    database = open_case_database(args, config, args.carve)
+    if database:
+        with database:
+            database.store_all(results)
+    print(f"✅ {count:,} immagini individuate - report: {output_path}")
+    print_case_statistics(statistics)
+    if args.devices:
+        devices = DeviceClusters()
+        for result in results:
+            devices.add(result)
+        write_device_summary(devices, output_path)
+    if args.map:
+        points = CaseMapPoints()
+        for result in results:
+            points.add(result)
+        write_results_map(points, output_path, args.heatmap)
+    reports = open_report_writer(args, config, analysis_info, statistics)
+    if reports:
+        for result in results:
+            reports.add(result)
+        close_report_writer(reports)
+
+def run_scan(args):
+    """Modalità senza interfaccia: analisi ricorsiva di una cartella, opzionalmente monitorata"""
+    config = load_config(args.config)
+    Image.MAX_IMAGE_PIXELS = config['analysis']['max_image_pixels']
+    scan_options = {'include': args.include, 'exclude': args.exclude, 'sniff': args.sniff,
+                    'error_callback': print_scan_error}
+    database = open_case_database(args, config, args.scan)
+    devices = DeviceClusters() if args.devices and not args.watch else None
+    points = CaseMapPoints() if args.map and not args.watch else None
+    try:
+        run_scan_mode(args, config, scan_options, database, devices, points)
+    finally:
+        if database:
+            database.close()
+
+def run_scan_mode(args, config, scan_options, database, devices, points):
+    """Esegue --scan nella modalità richiesta (monitoraggio, asincrona, pipeline o seriale)"""
+    def analyze(path, stats):
+        try:
+            check = check_evidence_file(path, config, require_extension=False)
+            return analyze_evidence_path(path, config, stats=stats, check=check)
+        except OSError as e:
+            # File rimosso o non più accessibile dopo l'enumerazione: resta nel report come errore
+            return read_error_result(file_info_from_stat(path, stats), e)
+    
+    if args.watch:
+        # In monitoraggio i risultati vengono accodati come JSON Lines
+        output_path = args.output or os.path.join(args.scan, "geoimage_watch.jsonl")
+        print(f"👁️ Monitoraggio di {args.scan} - risultati in {output_path} (CTRL+C per uscire)")
+        
+        def on_new_evidence(path, stats):
+            result = analyze(path, stats)
+            if result.get('error'):
+                # Es. file già spostato dalla cartella di deposito: il monitoraggio continua
+                print(f"  ⚠️ {path}: {result['error']}")
+                return
+            with open(output_path, 'a', encoding='utf-8') as f:
+                f.write(serialize_result(result, exif_normalizer(config)) + "\n")
+            if database:
+                database.store(result)
+                database.flush()
+            print(f"  📥 {path}")
+        
+        stop_event = threading.Event()
+        try:
+            watch_directory(args.scan, config, on_new_evidence, stop_event, **scan_options)
+        except KeyboardInterrupt:
+            stop_event.set()
+        return
+    
+    output_path = args.output or os.path.normpath(args.scan) + ".analysis.json"
+    print(f"📂 Analisi cartella: {args.scan}")
+    start = time.time()
+    
+    # Risultati nel giornale con checkpoint periodici: una scansione interrotta riprende da lì
+    identity = {'scan_root': os.path.abspath(args.scan), 'include': args.include, 'exclude': args.exclude,
+                'sniff': args.sniff, 'metadata_only': bool(args.metadata_only),
+                'timestamp_format': config['export']['timestamp_format']}
+    try:
+        journal = BatchJournal(output_path, identity, config['advanced']['checkpoint'], restart=args.restart,
+                               normalizer=exif_normalizer(config))
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return
+    if journal.resumed:
+        print(f"♻️ Ripresa dal checkpoint: {journal.resumed:,} file già analizzati vengono saltati")
+    sources = ((path, stats) for path, stats in scan_directory(args.scan, config, **scan_options)
+               if not journal.is_completed(path, stats))
+    
+    with journal:
+        if args.async_io:
+            io_statistics = asyncio.run(analyze_files_async(
+                sources, config, journal.write,
+                concurrency=args.concurrency, hash_files=not args.metadata_only
+            ))
+            pipeline = None
+        else:
+            geocode = args.geocode and config['geolocation']['reverse_geocoding']['enabled']
+            pipeline = None
+            if args.parallel or config['advanced']['parallel_processing']:
+                pipeline = AnalysisPipeline(config, geocode=geocode)
+            
+            if pipeline:
+                analyzed = pipeline.run(sources)
+            else:
+                analyzed = (analyze(path, stats) for path, stats in sources)
+            for count, result in enumerate(analyzed, start=journal.resumed + 1):
+                if not pipeline and geocode and result.get('coordinates'):
+                    coordinates = result['coordinates']
+                    coordinates['address'] = reverse_geocode(coordinates['lat'], coordinates['lon'], config)
+                print(f"  [{count:,}] {result['forensic']['file_info'].get('path')}")
+                journal.write(result)
+        journal.checkpoint()
+        
+        analysis_info = {
+            'timestamp': datetime.now().isoformat(),
+            'analyzer': 'GeoImage Analyzer v1.0',
+            'system': f"{platform.system()} {platform.release()}",
+            'scan_root': args.scan,
+        }
+        statistics = CaseStatistics(config)
+        reports = open_report_writer(args, config, analysis_info, statistics)
+        count = write_journal_report(journal, output_path, analysis_info,
+                                     result_collectors(database, devices, points, reports, statistics), statistics)
+    journal.finish()
+    
+    print(f"✅ {count:,} immagini analizzate in {time.time() - start:.1f}s - report: {output_path}")
+    print_case_statistics(statistics)
+    if args.async_io:
+        print(f"📊 {io_statistics['files_per_second']:,.1f} file/s, {io_statistics['iops']:,.1f} IOPS, "
+              f"{io_statistics['mb_per_second']:,.1f} MB/s con {io_statistics['concurrency']} letture concorrenti")
+    if pipeline:
+        print("📊 Stadi della pipeline:")
+        for line in pipeline.summary():
+            print(f"  {line}")
+    write_device_summary(devices, output_path)
+    write_results_map(points, output_path, args.heatmap)
+    close_report_writer(reports)
+
 def main():
+    args = parse_arguments()
+    if args.scan:
+        run_scan(args)
+        return
+    if args.redact:
+        run_redaction(args)
+        return
+    if args.archive:
+        run_archive_analysis(args)
+        return
+    if args.carve:
+        run_carving(args)
+        return
+    if args.db:
+        run_case_query(args)
+        return
+    if args.prefetch_tiles:
+        run_tile_prefetch(args)
+        return
+    if args.serve:
+        run_api_server(args)
+        return
+    if args.render:
+        run_render_reports(args)
+        return
+    
     print("🚀 Avvio GeoImage Analyzer...")
     print("=" * 40)
     
@@ -1083,12 +7271,17 @@ def main():
     
     try:
         # Ricarica i moduli dopo l'installazione
-        global tkintermapview
+        global tkintermapview, np
         try:
             import tkintermapview
         except ImportError:
             tkintermapview = None
             print("⚠️ tkintermapview non disponibile - alcune funzionalità mappa saranno limitate")
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+            print("⚠️ numpy non disponibile - Error Level Analysis non disponibile")
         
         root = tk.Tk()
         app = GeoImageAnalyzer(root)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# geo_image_analyzer.py è un modulo singolo nella radice del repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
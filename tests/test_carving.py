@@ -0,0 +1,111 @@
+"""Test del carving: offset, lunghezza e tipo delle immagini trovate in un'immagine disco"""
+import copy
+import io
+
+import pytest
+from PIL import Image
+
+import geo_image_analyzer as analyzer
+from test_redaction import GPS, build_jpeg, build_tiff, segment
+
+# Il segmento MPF di prova è solo un marcatore: Pillow lo legge come JPEG semplice
+pytestmark = pytest.mark.filterwarnings('ignore:Image appears to be a malformed MPO file')
+
+
+def encoded(image_format, size, color, **options):
+    output = io.BytesIO()
+    Image.new('RGB', size, color).save(output, image_format, **options)
+    return output.getvalue()
+
+
+@pytest.fixture
+def disk_image(tmp_path):
+    """
+    Immagine disco sintetica: JPEG iniziale con PNG accodato, dati non allocati, JPEG con
+    miniatura EXIF nell'IFD1, TIFF isolato e JPEG con MPF seguito dalla sua anteprima.
+    Restituisce il percorso e gli offset attesi.
+    """
+    thumbnail = build_jpeg((16, 12), (200, 40, 40), [])
+    with_thumbnail = build_jpeg((40, 30), (10, 200, 10), [segment(
+        0xE1, b'Exif\x00\x00' + build_tiff({0x010F: (2, 'Canon'), 0x8825: GPS}, {0x0103: (3, [6])}, thumbnail))])
+    mpf = build_jpeg((48, 36), (5, 5, 5), [segment(0xE2, b'MPF\x00' + b'\x00' * 16)])
+    parts = [
+        ('primary', encoded('JPEG', (32, 24), (255, 0, 0))),
+        ('appended', encoded('PNG', (8, 8), (0, 0, 255))),
+        (None, b'\x00' * 517),
+        ('carved', with_thumbnail),
+        (None, b'\xA5' * 300),
+        ('tiff', encoded('TIFF', (12, 10), (0, 255, 0))),
+        (None, b'\x00' * 64),
+        ('mpf', mpf),
+        ('mpf_image', encoded('JPEG', (24, 18), (90, 90, 90))),
+    ]
+    data, offsets = b'', {}
+    for name, part in parts:
+        if name:
+            offsets[name] = (len(data), len(part))
+        data += part
+    offsets['exif_thumbnail'] = (offsets['carved'][0] + with_thumbnail.index(thumbnail), len(thumbnail))
+    path = tmp_path / 'disk.img'
+    path.write_bytes(data)
+    return path, offsets
+
+
+def carve(path):
+    with analyzer.EvidenceFile(str(path)) as evidence:
+        return analyzer.carve_images(evidence)
+
+
+def test_carved_offsets_and_kinds(disk_image):
+    path, offsets = disk_image
+    found = {(image['offset'], image['length']): image for image in carve(path)}
+    expected = {
+        'primary': ('JPEG', 'primary', (32, 24)),
+        'appended': ('PNG', 'appended', (8, 8)),
+        'carved': ('JPEG', 'carved', (40, 30)),
+        'exif_thumbnail': ('JPEG', 'exif_thumbnail', (16, 12)),
+        'tiff': ('TIFF', 'carved', (12, 10)),
+        'mpf': ('JPEG', 'carved', (48, 36)),
+        'mpf_image': ('JPEG', 'mpf_image', (24, 18)),
+    }
+    assert sorted(found) == sorted(offsets.values())
+    for name, (image_format, kind, size) in expected.items():
+        image = found[offsets[name]]
+        assert (image['format'], image['kind'], (image['width'], image['height'])) == (image_format, kind, size), name
+    assert found[offsets['exif_thumbnail']]['parent_offset'] == offsets['carved'][0]
+
+
+def test_carved_ranges_open_as_images(disk_image):
+    path, _ = disk_image
+    data = path.read_bytes()
+    for image in carve(path):
+        with Image.open(io.BytesIO(data[image['offset']:image['offset'] + image['length']])) as carved:
+            carved.load()
+            assert carved.size == (image['width'], image['height'])
+
+
+def test_exif_block_is_not_carved_as_tiff(disk_image):
+    path, offsets = disk_image
+    exif_offset = path.read_bytes().index(b'Exif\x00\x00') + 6
+    assert offsets['carved'][0] < exif_offset < offsets['exif_thumbnail'][0]
+    assert exif_offset not in {image['offset'] for image in carve(path)}
+
+
+def test_max_size_skips_larger_images(disk_image):
+    path, offsets = disk_image
+    with analyzer.EvidenceFile(str(path)) as evidence:
+        carved = analyzer.carve_images(evidence, max_size=offsets['exif_thumbnail'][1])
+    assert offsets['exif_thumbnail'][0] in {image['offset'] for image in carved}
+    assert all(image['length'] <= offsets['exif_thumbnail'][1] for image in carved)
+
+
+def test_analyzed_carved_images_keep_offsets(disk_image):
+    path, offsets = disk_image
+    config = copy.deepcopy(analyzer.DEFAULT_CONFIG)
+    with analyzer.EvidenceFile(str(path)) as evidence:
+        results = analyzer.analyze_carved_images(evidence, config)
+    by_offset = {result['forensic']['file_info']['offset']: result for result in results}
+    assert offsets['primary'][0] not in by_offset
+    thumbnail = by_offset[offsets['exif_thumbnail'][0]]['forensic']['file_info']
+    assert thumbnail['size'] == offsets['exif_thumbnail'][1] and thumbnail['kind'] == 'exif_thumbnail'
+    assert thumbnail['path'] == f"{path}@{offsets['exif_thumbnail'][0]}"
@@ -0,0 +1,101 @@
+"""Test dell'hash tree a blocchi (radice Merkle e riverifica dei blocchi)"""
+import hashlib
+import json
+import os
+
+import pytest
+
+import geo_image_analyzer as analyzer
+
+BLOCK_SIZE = 1024
+
+
+def sha256(data):
+    return hashlib.sha256(data).digest()
+
+
+@pytest.fixture
+def evidence_path(tmp_path):
+    path = tmp_path / 'evidence.bin'
+    path.write_bytes(os.urandom(2 * BLOCK_SIZE + 452))
+    return path
+
+
+def build_manifest(path, use_mmap=True):
+    with analyzer.EvidenceFile(str(path), use_mmap=use_mmap) as evidence:
+        return evidence.hashes_with_tree(BLOCK_SIZE)
+
+
+def test_merkle_root_of_empty_and_single_block():
+    assert analyzer.merkle_root([]) == hashlib.sha256(b'').hexdigest()
+    leaf = hashlib.sha256(b'block').hexdigest()
+    assert analyzer.merkle_root([leaf]) == sha256(b'\x00' + bytes.fromhex(leaf)).hex()
+
+
+def test_merkle_root_promotes_odd_node():
+    leaves = [sha256(b'\x00' + hashlib.sha256(bytes([index])).digest()) for index in range(3)]
+    expected = sha256(b'\x01' + sha256(b'\x01' + leaves[0] + leaves[1]) + leaves[2]).hex()
+    assert analyzer.merkle_root([hashlib.sha256(bytes([index])).hexdigest() for index in range(3)]) == expected
+
+
+def test_hashes_with_tree_matches_blocks(evidence_path):
+    data = evidence_path.read_bytes()
+    hashes, tree = build_manifest(evidence_path)
+    assert hashes['SHA256'] == hashlib.sha256(data).hexdigest()
+    assert hashes['MD5'] == hashlib.md5(data).hexdigest()
+    assert tree['block_count'] == 3 and tree['file_size'] == len(data)
+    assert tree['blocks'] == [hashlib.sha256(data[offset:offset + BLOCK_SIZE]).hexdigest()
+                              for offset in range(0, len(data), BLOCK_SIZE)]
+    assert tree['merkle_root'] == analyzer.merkle_root(tree['blocks'])
+    # Stesso manifest leggendo a blocchi dal file invece che dalla mappatura
+    assert build_manifest(evidence_path, use_mmap=False) == (hashes, tree)
+
+
+def test_verify_intact_file(evidence_path):
+    _, tree = build_manifest(evidence_path)
+    result = analyzer.verify_hash_tree(str(evidence_path), tree, workers=2)
+    assert result['status'] == 'intact'
+    assert result['damaged_blocks'] == [] and result['merkle_root'] == tree['merkle_root']
+
+
+def test_verify_locates_modified_block(evidence_path):
+    _, tree = build_manifest(evidence_path)
+    data = bytearray(evidence_path.read_bytes())
+    data[BLOCK_SIZE + 10] ^= 0xFF
+    evidence_path.write_bytes(bytes(data))
+    result = analyzer.verify_hash_tree(str(evidence_path), tree)
+    assert result['status'] == 'damaged'
+    assert result['damaged_blocks'] == [{'index': 1, 'offset': BLOCK_SIZE, 'length': BLOCK_SIZE}]
+
+
+def test_verify_reports_truncated_tail(evidence_path):
+    _, tree = build_manifest(evidence_path)
+    data = evidence_path.read_bytes()
+    evidence_path.write_bytes(data[:BLOCK_SIZE + 100])
+    result = analyzer.verify_hash_tree(str(evidence_path), tree)
+    assert result['status'] == 'damaged'
+    assert result['expected_file_size'] == len(data) and result['file_size'] == BLOCK_SIZE + 100
+    assert [block['index'] for block in result['damaged_blocks']] == [1, 2]
+    assert result['damaged_blocks'][-1] == {'index': 2, 'offset': 2 * BLOCK_SIZE, 'length': 452}
+
+
+def test_verify_resumes_from_progress(evidence_path, tmp_path):
+    _, tree = build_manifest(evidence_path)
+    progress_path = tmp_path / 'verify.progress.json'
+    progress_path.write_text(json.dumps({'merkle_root': tree['merkle_root'],
+                                         'blocks': {'0': tree['blocks'][0]}}), encoding='utf-8')
+    calls = []
+    result = analyzer.verify_hash_tree(str(evidence_path), tree, progress_path=str(progress_path),
+                                       progress_callback=lambda done, total: calls.append((done, total)))
+    assert result['status'] == 'intact' and result['resumed_blocks'] == 1
+    assert calls[-1] == (3, 3)
+    assert not progress_path.exists()
+
+
+def test_progress_of_another_manifest_is_ignored(evidence_path, tmp_path):
+    _, tree = build_manifest(evidence_path)
+    progress_path = tmp_path / 'verify.progress.json'
+    progress_path.write_text(json.dumps({'merkle_root': '00' * 32, 'blocks': {'0': '00' * 32}}),
+                             encoding='utf-8')
+    result = analyzer.verify_hash_tree(str(evidence_path), tree, progress_path=str(progress_path))
+    assert result['status'] == 'intact' and result['resumed_blocks'] == 0
@@ -0,0 +1,107 @@
+"""Test del parser dei box HEIF (metadati senza decoder pillow-heif)"""
+import io
+import struct
+
+import pytest
+from PIL import Image
+
+import geo_image_analyzer as analyzer
+
+XMP = b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><exif:GPSLatitude>45,27.5N</exif:GPSLatitude></x:xmpmeta>'
+
+
+def box(kind, payload):
+    return struct.pack('>I', 8 + len(payload)) + kind + payload
+
+
+def full_box(kind, version, payload):
+    return box(kind, bytes((version, 0, 0, 0)) + payload)
+
+
+def infe(item_id, item_type, content_type=b''):
+    payload = struct.pack('>HH', item_id, 0) + item_type + b'\x00'
+    return full_box(b'infe', 2, payload + (content_type + b'\x00' if content_type else b''))
+
+
+def ispe(width, height):
+    return full_box(b'ispe', 0, struct.pack('>II', width, height))
+
+
+def exif_tiff():
+    exif = Image.Exif()
+    exif[0x010F] = 'Canon'
+    exif.get_ifd(0x8825)[1] = 'N'
+    data = exif.tobytes()
+    return data[6:] if data.startswith(b'Exif\x00\x00') else data
+
+
+def build_heif(exif_payload, mdat_first=False):
+    """
+    HEIF con immagine 'hvc1' (dati in idat, esclusi dagli extent), EXIF divisa in due extent
+    separati da dati estranei e XMP in un extent; mdat con header a 64 bit (largesize)
+    """
+    split = len(exif_payload) // 2
+    junk = b'\xAA' * 37
+    mdat_payload = exif_payload[:split] + junk + exif_payload[split:] + XMP
+
+    def meta(mdat_data_offset):
+        iinf = full_box(b'iinf', 0, struct.pack('>H', 3) + infe(1, b'hvc1') + infe(2, b'Exif')
+                        + infe(3, b'mime', b'application/rdf+xml'))
+        # iloc v1: offset, lunghezza e base_offset a 4 byte, senza indici degli extent
+        entries = struct.pack('>HHHIH II', 1, 1, 0, 0, 1, 0, 16)
+        entries += struct.pack('>HHHIH II II', 2, 0, 0, mdat_data_offset, 2,
+                               0, split, split + len(junk), len(exif_payload) - split)
+        entries += struct.pack('>HHHIH II', 3, 0, 0, mdat_data_offset + len(exif_payload) + len(junk), 1,
+                               0, len(XMP))
+        iloc = full_box(b'iloc', 1, bytes((0x44, 0x40)) + struct.pack('>H', 3) + entries)
+        iprp = box(b'iprp', box(b'ipco', ispe(64, 48) + ispe(320, 240)))
+        return full_box(b'meta', 0, full_box(b'hdlr', 0, b'\x00' * 4 + b'pict' + b'\x00' * 13)
+                        + iinf + iloc + iprp)
+
+    ftyp = box(b'ftyp', b'heic' + b'\x00' * 4 + b'mif1heic')
+    mdat_header = struct.pack('>I4sQ', 1, b'mdat', 16 + len(mdat_payload))
+    if mdat_first:
+        mdat_offset = len(ftyp) + len(mdat_header)
+        return ftyp + mdat_header + mdat_payload + meta(mdat_offset)
+    meta_length = len(meta(0))
+    mdat_offset = len(ftyp) + meta_length + len(mdat_header)
+    return ftyp + meta(mdat_offset) + mdat_header + mdat_payload
+
+
+@pytest.mark.parametrize('mdat_first', [False, True])
+def test_parse_heif_metadata(mdat_first):
+    tiff = exif_tiff()
+    payload = struct.pack('>I', 0) + tiff
+    data = build_heif(payload, mdat_first)
+    metadata = analyzer.parse_heif_metadata(io.BytesIO(data))
+    assert metadata['size'] == (320, 240)
+    assert metadata['exif'] == tiff and metadata['exif_tiff_offset'] == 4
+    assert metadata['xmp'] == XMP
+    first, second = metadata['exif_extents']
+    assert data[first[0]:first[0] + first[1]] + data[second[0]:second[0] + second[1]] == payload
+    offset, length = metadata['xmp_extents'][0]
+    assert data[offset:offset + length] == XMP
+
+
+def test_exif_header_offset_is_skipped():
+    tiff = exif_tiff()
+    # Alcuni encoder mettono "Exif\0\0" prima dell'header TIFF e lo indicano nei primi 4 byte
+    payload = struct.pack('>I', 6) + b'Exif\x00\x00' + tiff
+    metadata = analyzer.parse_heif_metadata(io.BytesIO(build_heif(payload)))
+    assert metadata['exif'] == tiff and metadata['exif_tiff_offset'] == 10
+
+
+def test_missing_meta_box():
+    data = box(b'ftyp', b'heic' + b'\x00' * 4 + b'mif1heic') + box(b'mdat', b'\x00' * 32)
+    with pytest.raises(SyntaxError):
+        analyzer.parse_heif_metadata(io.BytesIO(data))
+
+
+@pytest.mark.skipif(analyzer.pillow_heif is not None, reason="con pillow-heif il plugin di soli metadati non è registrato")
+def test_metadata_plugin_exposes_exif():
+    data = build_heif(struct.pack('>I', 0) + exif_tiff())
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == 'HEIF' and image.size == (320, 240)
+        exif = image.getexif()
+        assert exif[0x010F] == 'Canon' and exif.get_ifd(0x8825)[1] == 'N'
+        assert image.info['xmp'] == XMP
@@ -0,0 +1,277 @@
+"""Test della redazione dei metadati (copie anonimizzate con manifesto)"""
+import copy
+import hashlib
+import io
+import json
+import os
+import struct
+
+import pytest
+from PIL import Image, ExifTags
+
+import geo_image_analyzer as analyzer
+from test_heif import build_heif
+
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1}
+GPS = {1: (2, 'N'), 2: (5, [(45, 1), (27, 1), (3000, 100)]), 3: (2, 'E'), 4: (5, [(9, 1), (11, 1), (1500, 100)])}
+XMP = (b'http://ns.adobe.com/xap/1.0/\x00<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+       b'<exif:GPSLatitude>45,27.5N</exif:GPSLatitude><aux:SerialNumber>SN-XMP-42</aux:SerialNumber>'
+       b'</x:xmpmeta>')
+
+
+def encode(value_type, value):
+    if value_type == 2:
+        return value.encode() + b'\x00'
+    if value_type in (1, 7):
+        return bytes(value)
+    if value_type == 3:
+        return b''.join(struct.pack('<H', item) for item in value)
+    if value_type == 4:
+        return b''.join(struct.pack('<I', item) for item in value)
+    return b''.join(struct.pack('<II', *item) for item in value)
+
+
+def build_tiff(ifd0, ifd1=None, thumbnail=None):
+    """
+    Blocco TIFF little-endian: ogni IFD è un dict tag -> (tipo, valore) oppure tag -> dict per un
+    sotto-IFD. Con thumbnail la miniatura JPEG viene accodata e puntata da 0x0201/0x0202 dell'IFD1.
+    """
+    out = bytearray(b'II*\x00\x08\x00\x00\x00')
+
+    def write_ifd(entries):
+        offset = len(out)
+        out.extend(bytes(2 + 12 * len(entries) + 4))
+        struct.pack_into('<H', out, offset, len(entries))
+        for index, (tag, spec) in enumerate(sorted(entries.items())):
+            entry = offset + 2 + 12 * index
+            if isinstance(spec, dict):
+                struct.pack_into('<HHII', out, entry, tag, 4, 1, write_ifd(spec))
+                continue
+            value_type, value = spec
+            data = encode(value_type, value)
+            if len(data) > 4:
+                field = struct.pack('<I', len(out))
+                out.extend(data + b'\x00' * (len(data) % 2))
+            else:
+                field = data.ljust(4, b'\x00')
+            struct.pack_into('<HHI4s', out, entry, tag, value_type, len(data) // TYPE_SIZES[value_type], field)
+        return offset
+
+    ifd0_offset = write_ifd(ifd0)
+    if ifd1 is not None:
+        ifd1 = dict(ifd1)
+        if thumbnail is not None:
+            ifd1[0x0201] = (4, [0])
+            ifd1[0x0202] = (4, [len(thumbnail)])
+        next_pointer = ifd0_offset + 2 + 12 * len(ifd0)
+        ifd1_offset = write_ifd(ifd1)
+        struct.pack_into('<I', out, next_pointer, ifd1_offset)
+        if thumbnail is not None:
+            index = sorted(ifd1).index(0x0201)
+            struct.pack_into('<I', out, ifd1_offset + 2 + 12 * index + 8, len(out))
+            out.extend(thumbnail)
+    return bytes(out)
+
+
+def segment(marker, payload):
+    return bytes((0xFF, marker)) + struct.pack('>H', len(payload) + 2) + payload
+
+
+def build_jpeg(size, color, segments):
+    """JPEG codificato da Pillow con i segmenti indicati inseriti subito dopo SOI"""
+    encoded = io.BytesIO()
+    Image.new('RGB', size, color).save(encoded, 'JPEG', quality=90)
+    data = encoded.getvalue()
+    return data[:2] + b''.join(segments) + data[2:]
+
+
+def evidence_jpeg(gps_in_ifd0=True):
+    """Foto con GPS (IFD0 e IFD1), seriali, MakerNote, autore, XMP e miniatura con il proprio GPS"""
+    thumbnail = build_jpeg((16, 12), (200, 40, 40),
+                           [segment(0xE1, b'Exif\x00\x00' + build_tiff({0x8825: GPS}))])
+    ifd0 = {
+        0x010F: (2, 'Canon'),
+        0x0110: (2, 'Canon EOS 5D Mark IV'),
+        0x013B: (2, 'Mario Rossi'),
+        0x8769: {
+            0x9003: (2, '2024:05:01 10:00:00'),
+            0x927C: (7, b'MAKERNOTE-SN-1234'),
+            0xA431: (2, 'BODY-SN-0042'),
+            0xA435: (2, 'LENS-SN-0077'),
+        },
+    }
+    if gps_in_ifd0:
+        ifd0[0x8825] = GPS
+    tiff = build_tiff(ifd0, {0x0103: (3, [6]), 0x8825: GPS}, thumbnail)
+    return build_jpeg((64, 48), (20, 120, 220), [segment(0xE1, b'Exif\x00\x00' + tiff), segment(0xE1, XMP)])
+
+
+def exif_of(data):
+    with Image.open(io.BytesIO(data)) as image:
+        exif = image.getexif()
+        return exif, exif.get_ifd(0x8769), exif.get_ifd(ExifTags.IFD.IFD1)
+
+
+def thumbnail_of(data):
+    exif, _, ifd1 = exif_of(data)
+    start = data.index(b'Exif\x00\x00') + 6 + ifd1[0x0201]
+    return data[start:start + ifd1[0x0202]]
+
+
+def redaction_config(anonymize=False):
+    config = copy.deepcopy(analyzer.DEFAULT_CONFIG)
+    config['security']['anonymize_sensitive_data'] = anonymize
+    return config
+
+
+@pytest.fixture
+def redacted(tmp_path):
+    """Redige una cartella con la foto di prova e restituisce (origine, copia, manifesto)"""
+    def run(data, anonymize=False):
+        source_root, output_root = tmp_path / 'src', tmp_path / 'out'
+        source_root.mkdir(exist_ok=True)
+        source = source_root / 'photo.jpg'
+        source.write_bytes(data)
+        config = redaction_config(anonymize)
+        analyzer.export_redacted_copies([str(source)], str(source_root), str(output_root), config)
+        manifest_path = output_root / config['security']['redaction']['manifest']
+        manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+        return source, output_root / 'photo.jpg', manifest
+    return run
+
+
+def test_sample_carries_the_metadata_to_remove():
+    data = evidence_jpeg()
+    exif, exif_ifd, ifd1 = exif_of(data)
+    assert 0x8825 in exif and 0x8825 in ifd1
+    assert {0xA431, 0xA435, 0x927C} <= set(exif_ifd)
+    assert exif_of(thumbnail_of(data))[0].get_ifd(0x8825)
+    assert b'SN-XMP-42' in data
+
+
+def test_removes_gps_serials_and_xmp(redacted):
+    _, output, manifest = redacted(evidence_jpeg())
+    data = output.read_bytes()
+    exif, exif_ifd, ifd1 = exif_of(data)
+    assert 0x8825 not in exif and not exif.get_ifd(0x8825)
+    assert not {0xA431, 0xA435, 0x927C} & set(exif_ifd)
+    assert exif[0x010F] == 'Canon' and exif_ifd[0x9003] == '2024:05:01 10:00:00'
+    assert exif[0x013B] == 'Mario Rossi'
+    for secret in (b'BODY-SN-0042', b'LENS-SN-0077', b'MAKERNOTE-SN-1234', b'SN-XMP-42', b'xmpmeta'):
+        assert secret not in data
+    entry, = manifest['files']
+    assert entry['removed'] == ['BodySerialNumber', 'GPSInfo', 'LensSerialNumber', 'MakerNote', 'XMP']
+
+
+def test_removes_gps_from_ifd1_and_thumbnail(redacted):
+    _, output, _ = redacted(evidence_jpeg())
+    data = output.read_bytes()
+    _, _, ifd1 = exif_of(data)
+    assert 0x8825 not in ifd1
+    thumbnail = thumbnail_of(data)
+    assert not exif_of(thumbnail)[0].get_ifd(0x8825)
+    with Image.open(io.BytesIO(thumbnail)) as image:
+        image.load()
+        assert image.size == (16, 12)
+    # Le coordinate (45° 27' 30") non compaiono più in nessun IFD
+    assert struct.pack('<II', 3000, 100) not in data
+
+
+def test_gps_only_in_ifd1_is_removed(redacted):
+    data = evidence_jpeg(gps_in_ifd0=False)
+    assert 0x8825 not in exif_of(data)[0]
+    _, output, manifest = redacted(data)
+    assert 0x8825 not in exif_of(output.read_bytes())[2]
+    assert 'GPSInfo' in manifest['files'][0]['removed']
+
+
+def test_pixels_and_compressed_data_unchanged(redacted):
+    source, output, _ = redacted(evidence_jpeg())
+    original, copy_data = source.read_bytes(), output.read_bytes()
+    assert len(copy_data) == len(original)
+    scan = original.rindex(b'\xff\xda')
+    assert copy_data[scan:] == original[scan:]
+    with Image.open(source) as before, Image.open(output) as after:
+        assert before.tobytes() == after.tobytes()
+
+
+def test_manifest_hashes_match_files(redacted):
+    source, output, manifest = redacted(evidence_jpeg())
+    entry, = manifest['files']
+    assert entry['sha256_source'] == hashlib.sha256(source.read_bytes()).hexdigest()
+    assert entry['sha256_redacted'] == hashlib.sha256(output.read_bytes()).hexdigest()
+    assert entry['output'] == str(output)
+    assert manifest['redaction_info']['redacted'] == 1 and manifest['redaction_info']['errors'] == 0
+    assert not os.path.exists(f"{output}.tmp")
+
+
+def test_anonymize_removes_personal_tags(redacted):
+    _, output, manifest = redacted(evidence_jpeg(), anonymize=True)
+    exif, _, _ = exif_of(output.read_bytes())
+    assert 0x013B not in exif and exif[0x010F] == 'Canon'
+    assert 'Artist' in manifest['files'][0]['removed']
+
+
+def test_verify_rejects_gps_in_ifd1(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    path.write_bytes(evidence_jpeg(gps_in_ifd0=False))
+    handler = analyzer.format_handler_for_path(str(path))
+    with pytest.raises(ValueError, match='GPSInfo'):
+        analyzer.verify_redacted_file(str(path), handler)
+
+
+def test_verify_rejects_gps_in_thumbnail(tmp_path):
+    # Solo la miniatura conserva il GPS: Pillow non la legge, la verifica strutturale sì
+    data = bytearray(evidence_jpeg())
+    redaction = analyzer.MetadataRedaction(bytes(data)).redact('JPEG')
+    thumbnail_start = bytes(data).index(b'\xff\xd8', 2)
+    for offset, patch in redaction.patches:
+        if offset < thumbnail_start:
+            data[offset:offset + len(patch)] = patch
+    path = tmp_path / 'photo.jpg'
+    path.write_bytes(bytes(data))
+    assert 0x8825 not in exif_of(bytes(data))[0]
+    with pytest.raises(ValueError, match='GPSInfo'):
+        analyzer.verify_redacted_file(str(path), analyzer.format_handler_for_path(str(path)))
+
+
+def test_png_exif_redacted_with_valid_crc(redacted, tmp_path):
+    exif = Image.Exif()
+    exif[0x010F] = 'Canon'
+    exif.get_ifd(0x8825)[1] = 'N'
+    source = tmp_path / 'photo.png'
+    Image.new('RGB', (8, 8), (1, 2, 3)).save(source, exif=exif.tobytes())
+    output = tmp_path / 'out.png'
+    entry = analyzer.redact_image_file(str(source), str(output))
+    assert entry['removed'] == ['GPSInfo']
+    data = output.read_bytes()
+    position = 8
+    while position < len(data):
+        length, = struct.unpack('>I', data[position:position + 4])
+        chunk = data[position + 4:position + 8 + length]
+        assert struct.unpack('>I', data[position + 8 + length:position + 12 + length])[0] == analyzer.zlib.crc32(chunk)
+        position += 12 + length
+    with Image.open(output) as image:
+        assert not image.getexif().get_ifd(0x8825)
+
+
+def test_heif_exif_split_across_extents(tmp_path):
+    tiff = build_tiff({0x010F: (2, 'Canon'), 0x8825: GPS, 0x8769: {0xA431: (2, 'BODY-SN-0042')}})
+    data = build_heif(struct.pack('>I', 0) + tiff)
+    metadata = analyzer.parse_heif_metadata(io.BytesIO(data))
+    (first_offset, first_length), _ = metadata['exif_extents']
+    source, output = tmp_path / 'photo.heic', tmp_path / 'out.heic'
+    source.write_bytes(data)
+    entry = analyzer.redact_image_file(str(source), str(output))
+    assert entry['removed'] == ['BodySerialNumber', 'GPSInfo', 'XMP']
+    redacted = output.read_bytes()
+    assert len(redacted) == len(data)
+    exif = Image.Exif()
+    exif.load(analyzer.parse_heif_metadata(io.BytesIO(redacted))['exif'])
+    assert exif[0x010F] == 'Canon' and 0x8825 not in exif and 0xA431 not in exif.get_ifd(0x8769)
+    # Modificati solo i byte degli extent Exif e XMP, in entrambi gli extent Exif
+    changed = [index for index in range(len(data)) if data[index] != redacted[index]]
+    extents = metadata['exif_extents'] + metadata['xmp_extents']
+    assert all(any(offset <= index < offset + length for offset, length in extents) for index in changed)
+    assert any(index < first_offset + first_length for index in changed)
+    assert any(offset <= index < offset + length for index in changed for offset, length in metadata['exif_extents'][1:])